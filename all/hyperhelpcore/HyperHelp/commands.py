@@ -3,15 +3,21 @@ import sublime_plugin
 
 import os
 import textwrap
+from bisect import bisect_left, bisect_right
 
 from hyperhelpcore.common import log, hh_setting, hh_update_setting, help_package_prompt
 from hyperhelpcore.common import current_help_file, current_help_package
+from hyperhelpcore.common import log_history
 from hyperhelpcore.view import find_help_view
 from hyperhelpcore.core import help_index_list, lookup_help_topic
+from hyperhelpcore.core import help_index_generation
 from hyperhelpcore.core import show_help_topic, navigate_help_history, jump_help_history
-from hyperhelpcore.core import clear_help_history
+from hyperhelpcore.core import clear_help_history, compile_help_index
+from hyperhelpcore.core import render_help_sidecars
 from hyperhelpcore.core import parse_anchor_body
-from hyperhelpcore.help import HistoryData, _get_link_topic
+from hyperhelpcore.help import HistoryData, _get_link_topic, _anchor_outline
+from hyperhelpcore.linkgraph import _links_to_topic, _broken_links
+from hyperhelpcore.state import _get_help_history
 
 
 from .bootstrap import __version__ as local_version
@@ -82,6 +88,88 @@ def _bookmark_at_index(bookmark_idx, displayError=False):
         return None
 
 
+def _cached_items(cache, pkg_info):
+    """
+    Get the dictionary of cached quick panel items for the given help package
+    from the cache provided, which is a list of the help index generation the
+    cache is for and a dictionary of items keyed by package name. The whole
+    cache is thrown away when the loaded help indexes change, so that it never
+    keeps help indexes that are no longer loaded alive.
+
+    Help packages that are not currently loaded are not cached.
+    """
+    generation = help_index_generation()
+    if cache[0] != generation:
+        cache[0] = generation
+        cache[1] = dict()
+
+    if help_index_list().get(pkg_info.package, None) is not pkg_info:
+        return dict()
+
+    return cache[1].setdefault(pkg_info.package, dict())
+
+
+def _topic_index_items(pkg_info):
+    """
+    Get the list of quick panel items that make up the topic index for the
+    given help package, sorted by topic. This is only calculated once for each
+    loaded help index.
+    """
+    items = _cached_items(_topic_index_items.cache, pkg_info)
+    if "index" not in items:
+        items["index"] = [[pkg_info.help_topics[topic]["caption"], topic]
+                          for topic in sorted(pkg_info.help_topics.keys())]
+
+    return items["index"]
+
+_topic_index_items.cache = [0, dict()]
+
+
+def _toc_items(pkg_info, toc_level):
+    """
+    Get the list of quick panel items for the provided level of the table of
+    contents of the given help package. This is only calculated once for each
+    level of each loaded help index.
+    """
+    items = _cached_items(_toc_items.cache, pkg_info)
+    if id(toc_level) not in items:
+        items[id(toc_level)] = [[item["caption"], item["topic"] +
+            (" ({} topics)".format(len(item["children"])) if "children" in item else "")]
+            for item in toc_level]
+
+    return items[id(toc_level)]
+
+_toc_items.cache = [0, dict()]
+
+
+def _show_link_list(links, empty_msg):
+    """
+    Display a quick panel with the provided list of links, each of which is a
+    LinkData tuple. Picking a link displays the help file that contains it
+    and focuses the link.
+    """
+    if not links:
+        return log(empty_msg, status=True)
+
+    links = sorted(links, key=lambda link: (link.package, link.file,
+                                            link.region))
+    items = [["%s: %s" % (link.package, link.file), link.context]
+             for link in links]
+
+    def select(index):
+        if index >= 0:
+            link = links[index]
+            show_help_topic(link.package, link.file, history=True,
+                            background=True,
+                            on_done=lambda view: view.run_command(
+                                "hyperhelp_focus", {
+                                    "position": list(link.region),
+                                    "at_center": True
+                                }))
+
+    sublime.active_window().show_quick_panel(items, on_select=select)
+
+
 ###----------------------------------------------------------------------------
 
 
@@ -243,7 +331,7 @@ class HyperhelpTopicCommand(sublime_plugin.ApplicationCommand):
             return log("Cannot display topic '%s'; cannot determine package",
                 topic, status=True)
 
-        show_help_topic(package, topic, history=True)
+        show_help_topic(package, topic, history=True, background=True)
 
 
 class HyperhelpOpenBookmarkCommand(sublime_plugin.ApplicationCommand):
@@ -265,8 +353,7 @@ class HyperhelpOpenBookmarkCommand(sublime_plugin.ApplicationCommand):
         if pkg is None or topic is None:
             return log("Bookmark at index specified is not valid", status=True)
 
-        if show_help_topic(pkg, topic, history=True) == "file":
-            help_view = find_help_view()
+        def restore(help_view):
             if caret is not None:
                 help_view.sel().clear()
                 help_view.sel().add(sublime.Region(caret[0], caret[1]))
@@ -276,6 +363,9 @@ class HyperhelpOpenBookmarkCommand(sublime_plugin.ApplicationCommand):
                 else:
                     help_view.show_at_center(help_view.sel()[0])
 
+        show_help_topic(pkg, topic, history=True, background=True,
+                        on_done=restore)
+
     def description(self, bookmark_idx=None):
         bmark = _bookmark_at_index(bookmark_idx)
         return (_bookmark_name(bmark) if bmark is not None
@@ -426,16 +516,14 @@ class HyperhelpContentsCommand(sublime_plugin.ApplicationCommand):
         return True
 
     def show_toc(self, pkg_info, items, stack):
-        captions = [[item["caption"], item["topic"] +
-            (" ({} topics)".format(len(item["children"])) if "children" in item else "")]
-            for item in items]
+        captions = _toc_items(pkg_info, items)
 
         if not captions and not stack:
             return log("No help topics defined for package '%s'",
                        pkg_info.package, status=True)
 
         if stack:
-            captions.insert(0, ["..", "Go back"])
+            captions = [["..", "Go back"]] + captions
 
         sublime.active_window().show_quick_panel(
             captions,
@@ -459,7 +547,8 @@ class HyperhelpContentsCommand(sublime_plugin.ApplicationCommand):
                 stack.append(items)
                 return self.show_toc(pkg_info, children, stack)
 
-            show_help_topic(pkg_info.package, entry["topic"], history=True)
+            show_help_topic(pkg_info.package, entry["topic"], history=True,
+                            background=True)
 
 
 class HyperhelpIndexCommand(sublime_plugin.ApplicationCommand):
@@ -480,11 +569,7 @@ class HyperhelpIndexCommand(sublime_plugin.ApplicationCommand):
             return log("Cannot display topic index; unknown package '%s",
                        package, status=True)
 
-        topics = [pkg_info.help_topics.get(topic)
-                  for topic in sorted(pkg_info.help_topics.keys())]
-
-        items = [[t["caption"], t["topic"]]
-                 for t in topics]
+        items = _topic_index_items(pkg_info)
 
         if not items:
             return log("No help topics defined for package '%s'",
@@ -507,7 +592,8 @@ class HyperhelpIndexCommand(sublime_plugin.ApplicationCommand):
 
     def select(self, pkg_info, items, index):
         if index >= 0:
-            show_help_topic(pkg_info.package, items[index][1], history=True)
+            show_help_topic(pkg_info.package, items[index][1], history=True,
+                            background=True)
 
 
 class HyperhelpNavigateCommand(sublime_plugin.WindowCommand):
@@ -531,21 +617,19 @@ class HyperhelpNavigateCommand(sublime_plugin.WindowCommand):
 
     def anchor_nav(self, prev):
         help_view = find_help_view()
-        anchors = help_view.get_regions("_hh_anchors")
+        anchors, offsets = _anchor_outline(help_view)
         if not anchors:
             return
 
+        # The anchor before or after the cursor, wrapping around the ends.
         point = help_view.sel()[0].begin()
-        fallback = anchors[-1] if prev else anchors[0]
-
-        pick = lambda p: (point < p.a) if not prev else (point > p.a)
-        for pos in reversed(anchors) if prev else anchors:
-            if pick(pos):
-                return help_view.run_command("hyperhelp_focus",
-                    {"position": [pos.b, pos.a]})
+        if prev:
+            anchor = anchors[bisect_left(offsets, point) - 1]
+        else:
+            anchor = anchors[bisect_right(offsets, point) % len(anchors)]
 
         help_view.run_command("hyperhelp_focus",
-            {"position": [fallback.b, fallback.a]})
+            {"position": [anchor.end, anchor.start]})
 
     def follow_link(self):
         help_view = find_help_view()
@@ -561,7 +645,151 @@ class HyperhelpNavigateCommand(sublime_plugin.WindowCommand):
                 topic = topic_dat["topic"]
                 package = topic_dat["pkg"] or package
 
-            show_help_topic(package, topic, history=True)
+            show_help_topic(package, topic, history=True, background=True)
+
+
+class HyperhelpLinksHereCommand(sublime_plugin.ApplicationCommand):
+    """
+    Display a list of all of the links in all loaded help files that point to
+    the provided topic in the given package. When no topic is given, the
+    anchor under the cursor in the current help view is used, or the current
+    help file if the cursor is not on an anchor.
+    """
+    def run(self, package=None, topic=None):
+        package = package or current_help_package()
+        topic = topic or self.current_topic()
+
+        if package is None or topic is None:
+            return log("Cannot find links; no help topic given", status=True)
+
+        _links_to_topic(package, topic, lambda links: _show_link_list(links,
+            "No help files link to '%s'" % topic))
+
+    def is_enabled(self, package=None, topic=None):
+        if package is None or topic is None:
+            return find_help_view() is not None
+
+        return True
+
+    def current_topic(self):
+        help_view = find_help_view()
+        if help_view is None:
+            return None
+
+        point = help_view.sel()[0].begin()
+        anchors, offsets = _anchor_outline(help_view)
+
+        idx = bisect_right(offsets, point) - 1
+        if idx >= 0 and point <= anchors[idx].end and anchors[idx].topic:
+            return anchors[idx].topic
+
+        return current_help_file()
+
+
+class HyperhelpGotoAnchorCommand(sublime_plugin.WindowCommand):
+    """
+    Display a list of all of the anchors in the current help view, indented to
+    show how they nest under the headings in the file, and focus the one that
+    is picked. The anchor at or before the cursor is selected initially.
+    """
+    def run(self):
+        help_view = find_help_view(self.window)
+        anchors, offsets = _anchor_outline(help_view)
+        if not anchors:
+            return log("No anchors found in the current help file", status=True)
+
+        items = [["    " * max(0, anchor.level - 1) + anchor.text,
+                  anchor.topic or ""] for anchor in anchors]
+        current = max(0, bisect_right(offsets, help_view.sel()[0].begin()) - 1)
+
+        def select(index):
+            if index >= 0:
+                anchor = anchors[index]
+                help_view.run_command("hyperhelp_focus",
+                    {"position": [anchor.end, anchor.start]})
+
+        self.window.show_quick_panel(items, on_select=select,
+                                     selected_index=current)
+
+    def is_enabled(self):
+        return find_help_view(self.window) is not None
+
+
+class HyperhelpBrokenLinksCommand(sublime_plugin.ApplicationCommand):
+    """
+    Display a list of all of the broken links in the help files of the given
+    package, or of all loaded help packages if no package is given.
+    """
+    def run(self, package=None):
+        _broken_links(package, lambda links: _show_link_list(links,
+            "No broken links found"))
+
+
+class HyperhelpCompileIndexCommand(sublime_plugin.ApplicationCommand):
+    """
+    Compile the help index for the package provided and save the compiled
+    index alongside of the hyperhelp.json file, so that the help index can be
+    loaded without having to process it. If no package is given and one cannot
+    be inferred from the current help view, the user will be prompted for one.
+    """
+    def run(self, package=None, prompt=False):
+        package = package or current_help_package()
+        if package is None or prompt:
+            return help_package_prompt(help_index_list(),
+                                       on_select=lambda pkg: self.run(pkg))
+
+        pkg_info = help_index_list().get(package, None)
+        if pkg_info is None:
+            return log("Cannot compile help index; unknown package '%s'",
+                       package, status=True)
+
+        file_name = compile_help_index(pkg_info.index_file)
+        if file_name is None:
+            return log("Unable to compile the help index for '%s'",
+                       package, status=True)
+
+        log("Compiled the help index for '%s' into '%s'", package, file_name,
+            status=True)
+
+
+class HyperhelpRenderSidecarsCommand(sublime_plugin.ApplicationCommand):
+    """
+    Pre-render every help file in the package provided into a sidecar that is
+    saved alongside of it, so that help files can be displayed without being
+    post processed. If no package is given and one cannot be inferred from the
+    current help view, the user will be prompted for one.
+    """
+    def run(self, package=None, prompt=False):
+        package = package or current_help_package()
+        if package is None or prompt:
+            return help_package_prompt(help_index_list(),
+                                       on_select=lambda pkg: self.run(pkg))
+
+        pkg_info = help_index_list().get(package, None)
+        if pkg_info is None:
+            return log("Cannot render help files; unknown package '%s'",
+                       package, status=True)
+
+        count = render_help_sidecars(pkg_info)
+        if count is None:
+            return log("Unable to render the help files for '%s'",
+                       package, status=True)
+
+        log("Rendered %d help file(s) for '%s'", count, package, status=True)
+
+
+class HyperhelpLogHistoryCommand(sublime_plugin.WindowCommand):
+    """
+    Display the recent HyperHelp log history in a new view for diagnostic
+    purposes. This includes messages that were not displayed in the console
+    because of the configured log level.
+    """
+    def run(self):
+        view = self.window.new_file()
+        view.set_name("HyperHelp Log History")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": "\n".join(log_history()) + "\n"})
+        view.set_read_only(True)
 
 
 class HyperHelpAboutCommand(sublime_plugin.ApplicationCommand):
@@ -629,7 +857,7 @@ class HyperhelpHistoryCommand(sublime_plugin.WindowCommand):
             settings = help_view.settings()
             return (
                 settings.get("_hh_hist_pos"),
-                settings.get("_hh_hist")
+                _get_help_history(help_view)
             )
 
         return (None, None)
@@ -2,9 +2,26 @@ import sublime
 import sublime_plugin
 
 import textwrap
+import time
+from threading import Thread
 
-from hyperhelpcore.bootstrapper import log, BootstrapThread
+try:
+    import tracemalloc
+except ImportError:
+    # Not available in the Python 3.3 plugin host.
+    tracemalloc = None
 
+from hyperhelpcore.bootstrapper import log, BootstrapThread
+from hyperhelpcore.common import load_resource, load_resources
+from hyperhelpcore.core import help_index_list, lookup_help_topic
+from hyperhelpcore.help_index import _compile_help_index, _compile_index_data
+from hyperhelpcore.help_index import _decode_compiled_index
+from hyperhelpcore.validictory import validate, MultipleValidationError
+from hyperhelpcore.index_validator import _all_errors_validator, _index_schema
+from hyperhelpcore.view import find_help_view
+from hyperhelpcore.state import _get_help_links
+from hyperhelpcore.help import _resource_for_help, _help_streams
+from hyperhelpcore.help import _display_help_file, _display_help_file_async
 
 
 ###----------------------------------------------------------------------------
@@ -19,6 +36,355 @@ def _is_developer_mode():
     return s.get("developer_mode", False)
 
 
+def _time_calls(func, args_list, iterations):
+    """
+    Invoke the provided function once for every argument tuple in the list of
+    arguments, repeating the whole list the number of iterations given. The
+    return value is the average time per call, in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for args in args_list:
+            func(*args)
+
+    calls = max(1, len(args_list) * iterations)
+    return (time.perf_counter() - start) * 1000000 / calls
+
+
+###----------------------------------------------------------------------------
+
+
+def _benchmark_lookup(iterations):
+    """
+    Benchmark topic lookups: every known topic and alias in every package, the
+    same names in a form that requires normalization, and the links in the
+    current help view the way that flagging them looks them up.
+    """
+    help_list = help_index_list()
+
+    normal = [(pkg_info, name)
+              for pkg_info in help_list.values()
+              for name in pkg_info.help_lookup or pkg_info.help_topics]
+    raw = [(pkg_info, "  " + name.upper().replace(" ", "   "))
+           for pkg_info, name in normal]
+
+    help_view = find_help_view()
+    links = _get_help_links(help_view) if help_view is not None else []
+    flagging = [(help_list.get(link["pkg"], None), link["topic"])
+                for link in links]
+
+    log("Benchmark: lookup ({iterations} iterations)", iterations=iterations)
+    for name, args_list in (("normalized topics", normal),
+                            ("raw topics", raw),
+                            ("help view links", flagging)):
+        log("    {name}: {count} lookups, {time:.3f}us per lookup",
+            name=name, count=len(args_list),
+            time=_time_calls(lookup_help_topic, args_list, iterations))
+
+
+def _benchmark_index_load(iterations):
+    """
+    Benchmark loading the help index of every loaded package, both by
+    processing the hyperhelp.json file and by decoding a compiled index.
+    """
+    help_list = help_index_list()
+
+    log("Benchmark: index_load ({iterations} iterations)", iterations=iterations)
+    for pkg_info in help_list.values():
+        res = pkg_info.index_file
+        content = load_resource(res)
+        compiled = _compile_help_index(res)
+        if content is None or compiled is None:
+            continue
+
+        log("    {pkg}: {json:.3f}us from json, {compiled:.3f}us compiled",
+            pkg=pkg_info.package,
+            json=_time_calls(_compile_index_data, [(res, content)], iterations),
+            compiled=_time_calls(_decode_compiled_index,
+                                 [(res, compiled, content)], iterations))
+
+
+def _benchmark_validation(iterations):
+    """
+    Benchmark validating large arrays of topic objects against a strict schema
+    that requires every topic to be unique and match a pattern, as well as
+    every list of aliases.
+    """
+    schema = {
+        "type": "array",
+        "uniqueItems": True,
+        "items": {
+            "type": "object",
+            "properties": {
+                "topic":   { "type": "string", "pattern": r"^[^\r\n]+$" },
+                "caption": { "type": "string", "required": False },
+                "aliases": {
+                    "type": "array",
+                    "uniqueItems": True,
+                    "items": { "type": "string", "pattern": r"^[^\r\n]+$" },
+                    "required": False
+                }
+            },
+            "additionalProperties": False
+        }
+    }
+
+    log("Benchmark: validation ({iterations} iterations)", iterations=iterations)
+    for count in (100, 1000, 10000):
+        topics = [{"topic": "topic %d" % idx,
+                   "caption": "Caption for topic %d" % idx,
+                   "aliases": ["alias %d" % idx, "other alias %d" % idx]}
+                  for idx in range(count)]
+
+        log("    {count} topics: {time:.3f}us per topic", count=count,
+            time=_time_calls(validate, [(topics, schema)], iterations) / count)
+
+
+def _benchmark_concurrent_validation(iterations):
+    """
+    Benchmark validating help indexes from several threads at once, all using
+    the same shared validator. Half of the indexes are broken, and every
+    thread checks that it gets back exactly the errors it should.
+    """
+    def make_index(idx, broken):
+        topics = [{"topic": "topic %d" % t} for t in range(200)]
+        if broken:
+            topics.append({"topic": idx})
+
+        return {"package": "Package %d" % idx,
+                "help_files": {"index.txt": ["Index"] + topics},
+                "help_contents": ["topic %d" % t for t in range(200)]}
+
+    def error_count(index):
+        try:
+            _all_errors_validator.validate(index, _index_schema)
+        except MultipleValidationError as error:
+            return len(error.errors)
+
+        return 0
+
+    indexes = [make_index(idx, idx % 2 == 1) for idx in range(16)]
+    expected = [idx % 2 for idx in range(16)]
+
+    log("Benchmark: concurrent_validation ({iterations} iterations)",
+        iterations=iterations)
+    for thread_count in (1, 2, 4, 8):
+        failures = []
+
+        def worker():
+            for _ in range(iterations):
+                if [error_count(index) for index in indexes] != expected:
+                    failures.append(True)
+
+        threads = [Thread(target=worker) for _ in range(thread_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+        calls = thread_count * iterations * len(indexes)
+        log("    {threads} threads: {time:.3f}us per index, {bad} wrong results",
+            threads=thread_count, time=elapsed * 1000000 / calls,
+            bad=len(failures))
+
+
+def _benchmark_bulk_read(iterations):
+    """
+    Benchmark loading all of the help files in every loaded package, both one
+    at a time through the plugin API and all at once by reading the packages
+    directly.
+    """
+    def one_at_a_time(res_names):
+        for res_name in res_names:
+            load_resource(res_name)
+
+    def all_at_once(res_names):
+        for item in load_resources(res_names):
+            pass
+
+    log("Benchmark: bulk_read ({iterations} iterations)", iterations=iterations)
+    for pkg_info in help_index_list().values():
+        res_names = [_resource_for_help(pkg_info, help_file)
+                     for help_file in pkg_info.help_files]
+
+        log("    {pkg}: {count} files, {single:.3f}us singly, {bulk:.3f}us in bulk",
+            pkg=pkg_info.package, count=len(res_names),
+            single=_time_calls(one_at_a_time, [(res_names, )], iterations),
+            bulk=_time_calls(all_at_once, [(res_names, )], iterations))
+
+
+class _Heartbeat():
+    """
+    Tick in the main thread as often as possible while running, tracking the
+    longest gap between two ticks; this is how long input would have had to
+    wait to be handled.
+    """
+    def start(self):
+        self.running = True
+        self.longest = 0.0
+        self.last = time.perf_counter()
+        sublime.set_timeout(self.tick, 1)
+
+    def tick(self):
+        now = time.perf_counter()
+        self.longest = max(self.longest, now - self.last)
+        self.last = now
+
+        if self.running:
+            sublime.set_timeout(self.tick, 1)
+
+    def stop(self):
+        """
+        Stop ticking, returning the longest gap in milliseconds.
+        """
+        self.tick()
+        self.running = False
+        return self.longest * 1000
+
+
+def _benchmark_display_latency(iterations):
+    """
+    Benchmark how long the main thread (and so input) is held up while the
+    largest help file in every loaded package is displayed, both parsing it in
+    the main thread and in the background.
+
+    This runs asynchronously and reports once all files have been displayed;
+    the help view is left displaying the last one.
+    """
+    targets = []
+    for pkg_info in help_index_list().values():
+        sizes = [(len(load_resource(_resource_for_help(pkg_info, help_file)) or ""),
+                  help_file) for help_file in pkg_info.help_files]
+        if sizes:
+            size, help_file = max(sizes)
+            targets.append((pkg_info, help_file, size))
+
+    runs = [(target, background) for target in targets
+            for background in (False, True) for _ in range(iterations)]
+    stalls = {}
+    heartbeat = _Heartbeat()
+
+    def report():
+        log("Benchmark: display_latency ({iterations} iterations)",
+            iterations=iterations)
+        for pkg_info, help_file, size in targets:
+            times = stalls.get((pkg_info.package, help_file), {})
+            main = times.get(False, [0.0])
+            background = times.get(True, [0.0])
+            log("    {pkg}/{file} ({size} chars): longest stall {main:.1f}ms "
+                "parsing in the main thread, {background:.1f}ms in the background",
+                pkg=pkg_info.package, file=help_file, size=size,
+                main=sum(main) / len(main),
+                background=sum(background) / len(background))
+
+    def next_run():
+        if not runs:
+            return report()
+
+        (pkg_info, help_file, size), background = runs.pop(0)
+
+        def finished(view):
+            # Wait for a progressively displayed file to be complete.
+            if view is not None and view.id() in _help_streams:
+                return sublime.set_timeout(lambda: finished(view), 5)
+
+            key = (pkg_info.package, help_file)
+            stalls.setdefault(key, {}).setdefault(background, []).append(
+                heartbeat.stop())
+            sublime.set_timeout(next_run, 50)
+
+        # Make sure that the file is displayed again even if it's current.
+        view = find_help_view()
+        if view is not None:
+            view.settings().set("_hh_file", "")
+
+        heartbeat.start()
+        if background:
+            _display_help_file_async(pkg_info, help_file, finished)
+        else:
+            sublime.set_timeout(lambda: finished(
+                _display_help_file(pkg_info, help_file)), 1)
+
+    next_run()
+
+
+def _undo_depth(view, limit=10000):
+    """
+    Count how many modifying commands can be undone in the provided view, up to
+    the given limit.
+    """
+    depth = 0
+    while depth < limit and view.command_history(-depth, True)[0]:
+        depth += 1
+
+    return depth
+
+
+def _benchmark_view_memory(iterations):
+    """
+    Benchmark how the help view grows as it's navigated, by displaying two
+    help files back and forth many times and checking how much the undo
+    history of the view and the memory used by Python grow along the way.
+    """
+    targets = next(([(pkg_info, help_file) for help_file in
+                     sorted(pkg_info.help_files)[:2]]
+                    for pkg_info in help_index_list().values()
+                    if len(pkg_info.help_files) >= 2), None)
+    if targets is None:
+        return log("Benchmark: view_memory needs a package with two help files")
+
+    navigations = iterations * 100
+
+    def navigate(count):
+        for idx in range(count):
+            view = _display_help_file(*targets[idx % 2])
+
+        return view
+
+    # Only stop tracing at the end if it was started here.
+    started = tracemalloc is not None and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+
+    # Warm up the caches before taking the baseline.
+    view = navigate(2)
+    undo_start = _undo_depth(view)
+    heap_start = tracemalloc.get_traced_memory()[0] if tracing else 0
+
+    start = time.perf_counter()
+    view = navigate(navigations)
+    elapsed = time.perf_counter() - start
+
+    undo_end = _undo_depth(view)
+    heap_end = tracemalloc.get_traced_memory()[0] if tracing else 0
+    if started:
+        tracemalloc.stop()
+
+    log("Benchmark: view_memory ({iterations} iterations)", iterations=iterations)
+    log("    {count} navigations, {time:.3f}ms each", count=navigations,
+        time=elapsed * 1000 / navigations)
+    log("    undo history: {start} entries before, {end} after",
+        start=undo_start, end=undo_end)
+    if tracing:
+        log("    python heap: {delta:+.1f}KB after all navigations",
+            delta=(heap_end - heap_start) / 1024)
+
+
+_benchmarks = {
+    "bulk_read": _benchmark_bulk_read,
+    "concurrent_validation": _benchmark_concurrent_validation,
+    "display_latency": _benchmark_display_latency,
+    "index_load": _benchmark_index_load,
+    "lookup": _benchmark_lookup,
+    "validation": _benchmark_validation,
+    "view_memory": _benchmark_view_memory,
+}
+
+
 ###----------------------------------------------------------------------------
 
 
@@ -47,4 +413,25 @@ class HyperhelpDeveloperForceBootstrapCommand(sublime_plugin.ApplicationCommand)
         return _is_developer_mode()
 
 
+class HyperhelpDeveloperBenchmarkCommand(sublime_plugin.ApplicationCommand):
+    """
+    Run one of the internal benchmarks (or all of them) and report the results
+    to the console. Benchmarks use the currently loaded help indexes and the
+    current help view, if any.
+
+    This is a developer only command.
+    """
+    def run(self, benchmark=None, iterations=10):
+        names = [benchmark] if benchmark is not None else sorted(_benchmarks)
+        for name in names:
+            if name not in _benchmarks:
+                log("Developer: Unknown benchmark '{name}'", name=name)
+                continue
+
+            _benchmarks[name](iterations)
+
+    def is_enabled(self, benchmark=None, iterations=10):
+        return _is_developer_mode()
+
+
 ###----------------------------------------------------------------------------
@@ -1,14 +1,25 @@
 import sublime
 import sublime_plugin
 
+import os
+from html import escape
 from collections import MutableSet
 
-from hyperhelpcore.common import log
+from hyperhelpcore.common import log, hh_setting
+from hyperhelpcore.common import current_help_package, current_help_file
 from hyperhelpcore.core import help_index_list, lookup_help_topic
 from hyperhelpcore.core import is_topic_file, is_topic_file_valid
-from hyperhelpcore.core import is_topic_url
+from hyperhelpcore.core import is_topic_url, reload_help_file
 from hyperhelpcore.view import find_help_view
-from hyperhelpcore.help import _get_link_topic
+from hyperhelpcore.core import help_index_generation, help_index_snapshot
+from hyperhelpcore.core import add_index_listener, remove_index_listener
+from hyperhelpcore.help import _get_link_topic, _get_link_index
+from hyperhelpcore.help import _patch_help_view, _help_cache
+from hyperhelpcore.help import _recover_help_nav
+from hyperhelpcore.state import _get_help_links, _discard_view_state
+from hyperhelpcore.indexer import _shutdown_indexer
+from hyperhelpcore.topics import _update_topic_map, _topic_location
+from hyperhelpcore.topics import _topic_map_version
 
 from hyperhelpcore.core import load_indexes_from_packages
 from hyperhelpcore.core import unload_help_indexes_from_packges
@@ -17,6 +28,21 @@ from hyperhelpcore.core import unload_help_indexes_from_packges
 ###----------------------------------------------------------------------------
 
 
+# How long (in milliseconds) the list of ignored packages needs to stay the
+# same before help indexes are loaded or unloaded to match it.
+_rescan_delay = 2000
+
+# How long (in milliseconds) the mouse needs to rest on a link before the popup
+# for that link is displayed.
+_hover_delay = 150
+
+# The cached popup bodies for links in help views, keyed by the id of the view.
+# Each entry is a tuple of the link list, index generation and topic map
+# version that the popups were generated for and a dictionary of popup bodies
+# keyed by link index.
+_popup_cache = dict()
+
+
 _help_popup = """
 <body id="hyperhelp-link-caption">
     <style>
@@ -41,6 +67,10 @@ _help_popup = """
             margin-left: 1.5rem;
             font-family: monospace;
         }}
+        .snippet {{
+            margin-top: 1rem;
+            font-style: italic;
+        }}
      </style>
      {body}
 </body>
@@ -72,6 +102,16 @@ _topic_body = """
 <h1>{title}</h1>
 <p class="body">{link_type}</p>
 <p class="details">{link}</p>
+{snippet}
+"""
+
+_topic_snippet = """
+<p class="snippet">{snippet}</p>
+"""
+
+_topic_no_anchor = """
+<p class="snippet">This topic has no anchor in its help file, so following
+   the link opens the file without focusing the topic.</p>
 """
 
 
@@ -83,6 +123,12 @@ class PackageIndexWatcher():
     A simple singleton class for determining when packages are being added to
     or removed from the list of ignored packages, so that we can trigger help
     indexes in those packages to be either unloaded or loaded, as needed.
+
+    Changes are coalesced; the help indexes are only loaded or unloaded once
+    the list of ignored packages stops changing for a while, using the net
+    change since the last time they were loaded or unloaded. This keeps a
+    storm of changes (such as during a package upgrade) from causing a storm
+    of rescans.
     """
     instance = None
 
@@ -93,6 +139,14 @@ class PackageIndexWatcher():
         PackageIndexWatcher.instance = self
         self.settings = sublime.load_settings("Preferences.sublime-settings")
         self.cached_ignored = set(self.settings.get("ignored_packages", []))
+        self.applied_ignored = set(self.cached_ignored)
+
+        # The token of the most recently scheduled update, the number of
+        # rescans that would have been done without coalescing since the last
+        # update, and the total number of rescans avoided so far.
+        self.token = 0
+        self.requested = 0
+        self.avoided = 0
 
         self.settings.add_on_change("_hh_sw", lambda: self.__setting_changed())
 
@@ -112,28 +166,258 @@ class PackageIndexWatcher():
         added = new_list - self.cached_ignored
         self.cached_ignored = new_list
 
+        self.requested += bool(added) + bool(removed)
+        self.token += 1
+
+        token = self.token
+        sublime.set_timeout(lambda: self.__apply_changes(token), _rescan_delay)
+
+    def __apply_changes(self, token):
+        # Superseded by a later change; that one will handle this one too.
+        if token != self.token or PackageIndexWatcher.instance is not self:
+            return
+
+        added = self.cached_ignored - self.applied_ignored
+        removed = self.applied_ignored - self.cached_ignored
+        self.applied_ignored = set(self.cached_ignored)
+
+        performed = bool(added) + bool(removed)
+        if self.requested > performed:
+            self.avoided += self.requested - performed
+            log("coalesced ignored_packages changes; avoided %d rescans "
+                "(%d in total)", self.requested - performed, self.avoided)
+
+        self.requested = 0
+
         if added:
-            log("unloading all help indexes loaded from: %s", list(added))
-            sublime.set_timeout(lambda: unload_help_indexes_from_packges(list(added)), 2000)
+            log("unloading all help indexes loaded from: %s", sorted(added))
+            unload_help_indexes_from_packges(sorted(added))
 
         if removed:
-            log("scanning for help indexes in: %s", list(removed))
-            sublime.set_timeout(lambda: load_indexes_from_packages(list(removed)), 2000)
+            log("scanning for help indexes in: %s", sorted(removed))
+            load_indexes_from_packages(sorted(removed))
 
 
 ###----------------------------------------------------------------------------
 
 
-def plugin_loaded():
-    PackageIndexWatcher()
+def _flag_help_views(packages=None):
+    """
+    Classify the links in all open help views as active or broken. When a list
+    of packages is given, only links that point into them are classified.
+    """
+    for window in sublime.windows():
+        view = find_help_view(window)
+        if view:
+            view.run_command("hyperhelp_internal_flag_links",
+                             {"packages": packages})
+
+
+def _forget_saved_help(source_view):
+    """
+    Given a view that was just saved, throw away any cached copy of the file
+    in it, if it's a file in a package, so that it's loaded again the next
+    time that it's displayed.
+    """
+    file_name = source_view.file_name()
+    if file_name is None:
+        return
+
+    packages = os.path.realpath(sublime.packages_path())
+    file_name = os.path.realpath(file_name)
+
+    # On Windows, files on another drive can't be made relative.
+    try:
+        rel_name = os.path.relpath(file_name, packages)
+    except ValueError:
+        return
+
+    if rel_name.startswith(os.pardir):
+        return
+
+    _help_cache.discard("Packages/" + rel_name.replace(os.sep, "/"))
+
+
+def _live_reload_help_views(source_view):
+    """
+    Given a view that was just saved, update any help views that are currently
+    displaying the help file being edited in it to show the new content.
+    """
+    file_name = source_view.file_name()
+    if file_name is None:
+        return
+
+    file_name = os.path.normcase(os.path.realpath(file_name))
+    help_list = help_index_list()
+    help_text = None
+
+    for window in sublime.windows():
+        view = find_help_view(window)
+        if view is None:
+            continue
+
+        pkg_info = help_list.get(current_help_package(view), None)
+        help_file = current_help_file(view)
+        if pkg_info is None or not help_file:
+            continue
+
+        help_source = os.path.join(sublime.packages_path(),
+                                   pkg_info.doc_root, help_file)
+        if os.path.normcase(os.path.realpath(help_source)) != file_name:
+            continue
+
+        if help_text is None:
+            help_text = source_view.substr(sublime.Region(0, source_view.size()))
+
+        # A view that is still being displayed progressively is reloaded.
+        if not _patch_help_view(view, pkg_info, help_file, help_text):
+            reload_help_file(help_list, view)
+
+
+def _help_indexes_changed(change):
+    _flag_help_views(sorted(change.added | change.removed | change.changed))
+    _update_topic_map(help_index_list())
+
+
+def _recover_help_views():
+    """
+    Rebuild the state of any open help views that was lost because they were
+    restored from a session.
+    """
+    help_list = help_index_list()
     for window in sublime.windows():
         view = find_help_view(window)
         if view:
-            view.run_command("hyperhelp_internal_flag_links")
+            _recover_help_nav(help_list, view)
+
+
+def _startup_flag_links():
+    """
+    Make sure that the links in open help views are flagged for the currently
+    loaded help indexes and that their state is recovered. This runs in the
+    background so that loading the help indexes is not on the startup path.
+    """
+    # When the indexes are not loaded yet, loading them flags the links in open
+    # views through the change notification.
+    if help_index_generation() == 0:
+        help_index_snapshot()
+    else:
+        sublime.set_timeout(_flag_help_views)
+
+    sublime.set_timeout(_recover_help_views)
+
+
+def plugin_loaded():
+    PackageIndexWatcher()
+    add_index_listener(_help_indexes_changed)
+
+    if any(find_help_view(window) for window in sublime.windows()):
+        sublime.set_timeout_async(_startup_flag_links)
+
+    # Indexes that are already loaded won't announce themselves again.
+    if help_index_generation() != 0:
+        _update_topic_map(help_index_list())
 
 
 def plugin_unloaded():
     PackageIndexWatcher.unregister()
+    remove_index_listener(_help_indexes_changed)
+    _shutdown_indexer()
+
+
+def _make_link_popup(view, link_info):
+    """
+    Given the link information for a link in the provided help view, return
+    back the body of the popup that describes that link, or None if there is
+    nothing useful to display.
+    """
+    default_pkg = view.settings().get("_hh_pkg", None)
+
+    pkg = link_info.get("pkg", default_pkg)
+    topic = link_info.get("topic")
+
+    # Report if we don't know the package. In this case we may know what the
+    # topic is but not what file it might appear in.
+    pkg_info = help_index_list().get(pkg, None)
+    if pkg_info is None:
+        return _missing_pkg.format(pkg=pkg, topic=topic)
+
+    # If there is no topic we can't really display anything useful. This is an
+    # exceptional situation that is only possible if the help is broken.
+    if topic is None:
+        return None
+
+    # Look up the topic details. If we can't find it in the index, react like a
+    # missing package since we can't know the file.
+    topic_data = lookup_help_topic(pkg_info, topic)
+    if topic_data is None:
+        return _missing_topic.format(pkg=pkg, topic=topic)
+
+    caption = topic_data.get("caption")
+    file = topic_data.get("file")
+    link = file
+
+    # For links that open files, if that file does not exist as far as Sublime
+    # is concerned, use a custom popup to let the user know. Such a link will
+    # be highlighted as broken, so this explains why.
+    #
+    # This returns None for things that are not package files, so we need to
+    # compare for False directkly.
+    if is_topic_file_valid(pkg_info, topic_data) is False:
+        return _missing_file.format(file=file)
+
+    snippet = ""
+    if is_topic_url(pkg_info, topic_data):
+        link_type = "Opens URL: "
+    elif is_topic_file(pkg_info, topic_data):
+        link_type = "Opens File: "
+    else:
+        link_type = "Links To: "
+
+        # Show the start of the target section, once the package is indexed.
+        location = _topic_location(pkg_info, topic_data["topic"])
+        if location is False:
+            snippet = _topic_no_anchor
+        elif location is not None and location.snippet:
+            snippet = _topic_snippet.format(snippet=escape(location.snippet))
+
+        link = "" if default_pkg == pkg else pkg + " / "
+
+        current_file = view.settings().get("_hh_file", None)
+        if file != current_file:
+            link = link + file + " / "
+
+        link = link + topic
+
+    return _topic_body.format(title=caption or topic,
+                              link_type=link_type,
+                              link=link,
+                              snippet=snippet)
+
+
+def _link_popup(view, link_idx):
+    """
+    Get the body of the popup for the link with the given index in the given
+    help view. Popups are cached per link until either the file in the help
+    view changes, the loaded help indexes change or the topic map changes.
+    """
+    links = _get_help_links(view)
+    generation = help_index_generation()
+    version = _topic_map_version()
+
+    cache = _popup_cache.get(view.id(), None)
+    if (cache is None or cache[0] is not links or cache[1] != generation or
+            cache[2] != version):
+        cache = (links, generation, version, dict())
+        _popup_cache[view.id()] = cache
+
+    popups = cache[3]
+    if link_idx not in popups:
+        link_info = _get_link_topic(view, link_idx)
+        popups[link_idx] = (None if link_info is None
+                            else _make_link_popup(view, link_info))
+
+    return popups[link_idx]
 
 
 def _show_popup(view, point, popup):
@@ -148,6 +432,29 @@ def _show_popup(view, point, popup):
 
 
 class HyperhelpEventListener(sublime_plugin.EventListener):
+    hover_token = 0
+
+    def on_close(self, view):
+        """
+        Throw away any help state that we were tracking for a view that is
+        being closed.
+        """
+        _discard_view_state(view)
+        _popup_cache.pop(view.id(), None)
+
+    def on_post_save(self, view):
+        """
+        When a help file is saved, forget any cached copy of it, and if it's
+        displayed in a help view, update the help view to match if live
+        reloading is turned on.
+        """
+        if view.settings().has("_hh_pkg"):
+            return
+
+        _forget_saved_help(view)
+        if hh_setting("live_reload"):
+            _live_reload_help_views(view)
+
     def on_text_command(self, view, command, args):
         """
         Listen for the drag_select command with arguments that tell us that the
@@ -171,74 +478,39 @@ class HyperhelpEventListener(sublime_plugin.EventListener):
         """
         When the mouse hovers over a link in a help view, show a popup that
         tells you where the link goes or what file/URL it opens.
+
+        The popup is displayed after a short delay, and only if the mouse has
+        not hovered somewhere else in the interim.
         """
         if hover_zone != sublime.HOVER_TEXT:
             return
 
-        default_pkg = view.settings().get("_hh_pkg", None)
-        if default_pkg is None or not view.score_selector(point, "meta.link"):
-            return
+        # Any new hover supersedes a popup that is still waiting to display.
+        HyperhelpEventListener.hover_token += 1
+        token = HyperhelpEventListener.hover_token
 
-        link_info = _get_link_topic(view, view.extract_scope(point))
-        if link_info is None:
+        if (not view.settings().has("_hh_pkg") or
+                not view.score_selector(point, "meta.link")):
             return
 
-        pkg = link_info.get("pkg", default_pkg)
-        topic = link_info.get("topic")
+        sublime.set_timeout(lambda: self.hover_link(view, point, token),
+                            _hover_delay)
 
-        # Report if we don't know the package. In this case we may know what
-        # the topic is but not what file it might appear in.
-        pkg_info = help_index_list().get(pkg, None)
-        if pkg_info is None:
-            popup = _missing_pkg.format(pkg=pkg, topic=topic)
-            return _show_popup(view, point, popup)
+    def hover_link(self, view, point, token):
+        """
+        Display the popup for the link at the given point, unless a newer hover
+        has happened since the hover with the given token was triggered.
+        """
+        if token != HyperhelpEventListener.hover_token or not view.is_valid():
+            return
 
-        # If there is no topic we can't really display anything useful. This is
-        # an exceptional situation that is only possible if the help is broken.
-        if topic is None:
+        link_idx = _get_link_index(view, view.extract_scope(point))
+        if link_idx is None:
             return
 
-        # Look up the topic details. If we can't find it in the index, react
-        # like a missing package since we can't know the file.
-        topic_data = lookup_help_topic(pkg_info, topic)
-        if topic_data is None:
-            popup = _missing_topic.format(pkg=pkg, topic=topic)
-            return _show_popup(view, point, popup)
-
-        caption = topic_data.get("caption")
-        file = topic_data.get("file")
-        link = file
-
-        # For links that open files, if that file does not exist as far as
-        # Sublime is concerned, use a custom popup to let the user know. Such
-        # a link will be highlighted as broken, so this explains why.
-        #
-        # This returns None for things that are not package files, so we need
-        # to compare for False directkly.
-        if is_topic_file_valid(pkg_info, topic_data) is False:
-            popup = _missing_file.format(file=file)
-            return _show_popup(view, point, popup)
-
-        if is_topic_url(pkg_info, topic_data):
-            link_type = "Opens URL: "
-        elif is_topic_file(pkg_info, topic_data):
-            link_type = "Opens File: "
-        else:
-            link_type = "Links To: "
-
-            link = "" if default_pkg == pkg else pkg + " / "
-
-            current_file = view.settings().get("_hh_file", None)
-            if file != current_file:
-                link = link + file + " / "
-
-            link = link + topic
-
-        popup = _topic_body.format(title=caption or topic,
-                                   link_type=link_type,
-                                   link=link)
-
-        _show_popup(view, point, popup)
+        popup = _link_popup(view, link_idx)
+        if popup is not None:
+            _show_popup(view, point, popup)
 
 
 ###----------------------------------------------------------------------------
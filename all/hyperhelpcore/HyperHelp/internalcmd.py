@@ -1,12 +1,17 @@
 import sublime
 import sublime_plugin
 
-import time
-
 from hyperhelpcore.core import parse_help_header, parse_anchor_body, parse_link_body
 from hyperhelpcore.core import help_index_list, lookup_help_topic
 from hyperhelpcore.core import is_topic_file, is_topic_file_valid
+from hyperhelpcore.core import is_topic_normal
 from hyperhelpcore.help import _get_link_topic
+from hyperhelpcore.help_index import _normalize_topic
+from hyperhelpcore.render import _format_help_header
+from hyperhelpcore.prefetch import _prefetch_help_files
+from hyperhelpcore.state import _get_help_links, _set_help_links
+from hyperhelpcore.state import _get_help_nav, _set_help_nav
+from hyperhelpcore.state import _get_link_targets
 from hyperhelpcore.common import hh_setting
 from hyperhelpcore.common import current_help_package, current_help_file
 
@@ -42,27 +47,8 @@ class HyperhelpInternalProcessHeaderCommand(sublime_plugin.TextCommand):
         if header is None:
             return
 
-        _hdr_width = 80
-        _time_fmt = hh_setting("hyperhelp_date_format")
-
-        file_target = "*%s*" % help_file
-        title = header.title
-        date_str = "Not Available"
-
-        if header.date != 0:
-            date_str = time.strftime(_time_fmt, time.localtime(header.date))
-
-        # Take into account two extra spaces on either side of the title
-        max_title_len = _hdr_width - len(file_target) - len(date_str) - 4
-        if len(title) > max_title_len:
-            title = title[:max_title_len-1] + '\u2026'
-
-        header_line = "%s  %s  %s\n%s\n" % (
-            file_target,
-            "%s" % title.center(max_title_len, " "),
-            date_str,
-            ("=" * _hdr_width)
-        )
+        header_line = _format_help_header(help_file, header,
+                                          hh_setting("hyperhelp_date_format"))
 
         self.view.replace(edit, self.view.full_line(0), header_line)
 
@@ -75,11 +61,12 @@ class HyperhelpInternalProcessCommentsCommand(sublime_plugin.TextCommand):
     Remove all hyperhelp comments from a newly loaded help file.
 
     All text scoped as a comment (including newlines) will be redacted from the
-    file.
+    file. Only comments at or after the start position are considered.
     """
-    def run(self, edit):
+    def run(self, edit, start=0):
         for region in reversed(self.view.find_by_selector("comment.block.help")):
-            self.view.erase(edit, region)
+            if region.begin() >= start:
+                self.view.erase(edit, region)
 
     def is_enabled(self):
         return _can_post_process(self.view)
@@ -93,23 +80,34 @@ class HyperhelpInternalProcessAnchorsCommand(sublime_plugin.TextCommand):
 
     This results in regions and settings being applied to the view that allow
     the help core to navigate within the file.
+
+    When a start position is given, only anchors at or after that position are
+    processed, and they are added to the anchors that were already processed.
     """
-    def run(self, edit):
+    def run(self, edit, start=0):
         v = self.view
-        v.add_regions("_hh_anchors", v.find_by_selector("meta.anchor"), "",
+        prior = v.get_regions("_hh_anchors") if start else []
+        anchors = [r for r in v.find_by_selector("meta.anchor") if r.begin() >= start]
+
+        v.add_regions("_hh_anchors", prior + anchors, "",
                      flags=sublime.HIDDEN | sublime.PERSISTENT)
 
         for pos in reversed(v.find_by_selector("punctuation.anchor.hidden")):
-            v.erase(edit, pos)
+            if pos.begin() >= start:
+                v.erase(edit, pos)
 
         hh_nav = {}
         regions = v.get_regions("_hh_anchors")
-        for idx, region in enumerate(reversed(regions)):
+        for idx, region in enumerate(reversed(regions[len(prior):])):
             topic, text = parse_anchor_body(v.substr(region))
             v.replace(edit, region, text)
             hh_nav[topic] = len(regions) - idx - 1
 
-        v.settings().set("_hh_nav", hh_nav)
+        # Anchors seen earlier in the file take precedence.
+        if start:
+            hh_nav.update(_get_help_nav(v))
+
+        _set_help_nav(v, hh_nav)
 
     def is_enabled(self):
         return _can_post_process(self.view)
@@ -123,16 +121,19 @@ class HyperhelpInternalProcessLinksCommand(sublime_plugin.TextCommand):
 
     This results in regions and settings being applied to the view that allow
     the help core to navigate within the file.
+
+    When a start position is given, only links at or after that position are
+    processed, and they are added to the links that were already processed.
     """
-    def run(self, edit):
+    def run(self, edit, start=0):
         v = self.view
-        regions = v.find_by_selector("meta.link")
+        prior = v.get_regions("_hh_links") if start else []
+        regions = [r for r in v.find_by_selector("meta.link") if r.begin() >= start]
         default_pkg = current_help_package(self.view)
 
-        v.add_regions("_hh_links", regions, "",
+        v.add_regions("_hh_links", prior + regions, "",
                       flags=sublime.HIDDEN | sublime.PERSISTENT)
 
-
         hh_links = [None] * len(regions)
         for idx,region in enumerate(reversed(regions)):
             base_text = v.substr(region)
@@ -143,20 +144,81 @@ class HyperhelpInternalProcessLinksCommand(sublime_plugin.TextCommand):
                 topic = "_broken"
                 text = base_text
 
+            # Store the topic normalized so that lookups can use it as is.
             v.replace(edit, region, text)
             hh_links[len(regions) - idx - 1] = {
                 "pkg": pkg_name,
-                "topic": topic
+                "topic": _normalize_topic(topic)
             }
 
-        v.settings().set("_hh_links", hh_links)
+        if start:
+            hh_links = _get_help_links(v) + hh_links
+
+        _set_help_links(v, hh_links)
+
+        v.run_command("hyperhelp_internal_flag_links", {"start": start})
+        v.run_command("hyperhelp_internal_prefetch_links")
 
-        v.run_command("hyperhelp_internal_flag_links")
+    def is_enabled(self):
+        return _can_post_process(self.view)
+
+
+class HyperhelpInternalReplaceContentCommand(sublime_plugin.TextCommand):
+    """
+    Replace the entire content of a help view with the provided text in a
+    single edit; this is how a help view switches to a different help file.
+    """
+    def run(self, edit, characters):
+        self.view.replace(edit, sublime.Region(0, self.view.size()), characters)
+
+    def is_enabled(self):
+        return self.view.settings().has("_hh_pkg")
+
+
+class HyperhelpInternalPatchTextCommand(sublime_plugin.TextCommand):
+    """
+    Apply a list of edits to an already displayed help file, in order to update
+    it in place. Each edit is a [start, end, text] list that replaces the text
+    between start and end (offsets in the file before any edits are applied)
+    with the given text; edits must be in ascending order and not overlap.
+    """
+    def run(self, edit, edits):
+        for start, end, text in reversed(edits):
+            self.view.replace(edit, sublime.Region(start, end), text)
 
     def is_enabled(self):
         return _can_post_process(self.view)
 
 
+class HyperhelpInternalPrefetchLinksCommand(sublime_plugin.TextCommand):
+    """
+    Given a help file which has had its links post processed already, start
+    loading the help files that the links in this file point to in the
+    background, since following a link is the most likely next step.
+    """
+    def run(self, edit):
+        current_pkg = current_help_package(self.view)
+        current_file = current_help_file(self.view)
+
+        seen = set([(current_pkg, current_file)])
+        targets = []
+        for link in _get_help_links(self.view):
+            pkg_info = help_index_list().get(link["pkg"], None)
+            topic = lookup_help_topic(pkg_info, link["topic"])
+            if topic is None or not is_topic_normal(pkg_info, topic):
+                continue
+
+            key = (pkg_info.package, topic["file"])
+            if key not in seen:
+                seen.add(key)
+                targets.append((pkg_info, topic["file"]))
+
+        _prefetch_help_files(targets)
+
+    def is_enabled(self):
+        return self.view.match_selector(0, "text.hyperhelp.help")
+
+
 class HyperhelpInternalFlagLinksCommand(sublime_plugin.TextCommand):
     """
     Given a help file which has had its links post processed already via
@@ -166,24 +228,64 @@ class HyperhelpInternalFlagLinksCommand(sublime_plugin.TextCommand):
 
     This is a non-destructive command and may be executed any time the
     underlying help indexes may have changed, such as at Sublime startup.
+
+    When a start position is given, only links at or after that position are
+    classified; the classification of all earlier links is left as is.
+
+    When a list of packages is given, only the links that point into one of
+    those packages are classified again.
     """
-    def run(self, edit):
+    def run(self, edit, start=0, packages=None):
+        if packages is not None:
+            return self.reflag_packages(packages)
+
         v = self.view
-        active = []
-        broken = []
+        active = v.get_regions("_hh_links_active") if start else []
+        broken = v.get_regions("_hh_links_broken") if start else []
 
         regions = v.get_regions("_hh_links")
         for idx, region in enumerate(regions):
-            link_dat = _get_link_topic(v, idx)
-
-            pkg_info = help_index_list().get(link_dat["pkg"], None)
-            topic = lookup_help_topic(pkg_info, link_dat["topic"])
+            if region.begin() < start:
+                continue
 
-            if self.link_is_active(pkg_info, topic):
+            if self.link_idx_is_active(idx):
                 active.append(region)
             else:
                 broken.append(region)
 
+        self.mark_links(active, broken)
+
+    def reflag_packages(self, packages):
+        v = self.view
+        targets = _get_link_targets(v)
+        affected = set(idx for pkg in packages for idx in targets.get(pkg, []))
+        if not affected:
+            return
+
+        was_active = {(r.a, r.b) for r in v.get_regions("_hh_links_active")}
+
+        active = []
+        broken = []
+        for idx, region in enumerate(v.get_regions("_hh_links")):
+            if idx in affected:
+                is_active = self.link_idx_is_active(idx)
+            else:
+                is_active = (region.a, region.b) in was_active
+
+            (active if is_active else broken).append(region)
+
+        self.mark_links(active, broken)
+
+    def link_idx_is_active(self, idx):
+        link_dat = _get_link_topic(self.view, idx)
+
+        pkg_info = help_index_list().get(link_dat["pkg"], None)
+        topic = lookup_help_topic(pkg_info, link_dat["topic"])
+
+        return self.link_is_active(pkg_info, topic)
+
+    def mark_links(self, active, broken):
+        v = self.view
         v.add_regions("_hh_links_active", active, "storage",
             flags=sublime.DRAW_SOLID_UNDERLINE | sublime.PERSISTENT |
                   sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE)
@@ -1,7 +1,14 @@
 ### ---------------------------------------------------------------------------
 
 
-from .startup import initialize
+# Only the Sublime independent modules (such as help_index and render) can be
+# used outside of Sublime, where there is nothing to initialize.
+try:
+    import sublime
+except ImportError:
+    initialize = None
+else:
+    from .startup import initialize
 
 __version_tuple = (0, 0, 8)
 __version__ = ".".join([str(num) for num in __version_tuple])
@@ -1,26 +1,156 @@
-import sublime
-
 import os
-import codecs
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from .resources import resource_provider
+
+# Outside of Sublime (in a worker process or a plain interpreter), logging,
+# settings and resource loading still work; settings have their default
+# values and resources come from the current resource provider.
+try:
+    import sublime
+    from .view import find_help_view
+except ImportError:
+    sublime = None
+
+
+###----------------------------------------------------------------------------
+
+
+# The available log levels; the "log_level" setting uses the names.
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARNING = 30
+LOG_ERROR = 40
+
+_log_levels = {
+    "debug": LOG_DEBUG,
+    "info": LOG_INFO,
+    "warning": LOG_WARNING,
+    "error": LOG_ERROR
+}
 
-from .view import find_help_view
+# The numeric value of the "log_level" setting; this is looked up the first
+# time that something is logged and kept up to date as the setting changes.
+_current_log_level = None
+
+# The most recent log messages, already formatted, for diagnostics. Only the
+# text is kept so that the history doesn't keep the arguments alive.
+_log_history = deque(maxlen=1000)
+
+# The per-thread state of aggregate_log(), and the number of times that any
+# single message is displayed in an aggregate_log() block before the rest are
+# suppressed.
+_log_scope = threading.local()
+_log_repeat_limit = 5
 
 
 ###----------------------------------------------------------------------------
 
 
-def log(message, *args, status=False, dialog=False):
+def log(message, *args, status=False, dialog=False, level=LOG_INFO):
     """
     Log the provided message to the console, optionally also sending it to the
     status bar and a dialog box.
+
+    Messages below the level in the "log_level" setting are not displayed.
+    Every message is also recorded in the log history, whether it is displayed
+    or not.
+
+    Inside of an aggregate_log() block, repeated messages are only displayed a
+    few times, with a summary of the rest at the end of the block.
     """
-    message = message % args
-    for line in message.splitlines():
+    try:
+        text = message % args
+    except Exception:
+        text = "%s %r" % (message, args)
+
+    _log_history.append((time.time(), level, text))
+
+    if level < _log_level() and not status and not dialog:
+        return
+
+    scope = getattr(_log_scope, "counts", None)
+    if scope is not None and not status and not dialog:
+        count = scope.get(message, (0, ))[0] + 1
+        scope[message] = (count, text)
+        if count > _log_repeat_limit:
+            return
+
+    for line in text.splitlines():
         print("HyperHelp:", line)
-    if status:
-        sublime.status_message(message)
-    if dialog:
-        sublime.message_dialog(message)
+    if status and sublime is not None:
+        sublime.status_message(text)
+    if dialog and sublime is not None:
+        sublime.message_dialog(text)
+
+
+def _log_level():
+    """
+    Get the numeric value of the log level that is currently configured.
+    """
+    global _current_log_level
+
+    if _current_log_level is None:
+        _current_log_level = _log_levels.get(hh_setting("log_level"), LOG_INFO)
+        if sublime is not None:
+            # Replace the handler of an earlier copy of this module, if any.
+            hh_setting.obj.clear_on_change("_hh_log_level")
+            hh_setting.obj.add_on_change("_hh_log_level", _log_level_changed)
+
+    return _current_log_level
+
+
+def _log_level_changed():
+    """
+    Pick up a change to the "log_level" setting.
+    """
+    global _current_log_level
+    _current_log_level = _log_levels.get(hh_setting("log_level"), LOG_INFO)
+
+
+@contextmanager
+def aggregate_log():
+    """
+    A context manager that aggregates repeated log messages; while it's active,
+    each distinct message is only displayed the first few times that it's
+    logged, and a summary of the number of times each message was suppressed
+    is logged when the block exits.
+    """
+    outer = getattr(_log_scope, "counts", None)
+    _log_scope.counts = OrderedDict()
+    try:
+        yield
+    finally:
+        counts = _log_scope.counts
+        _log_scope.counts = outer
+
+        for message, (count, text) in counts.items():
+            if count > _log_repeat_limit:
+                log("Suppressed {:,} more messages like: %s".format(
+                    count - _log_repeat_limit), text,
+                    level=LOG_WARNING)
+
+
+def log_history():
+    """
+    Get the recent log history, regardless of the log level in use, as a list
+    of formatted lines with the oldest message first.
+    """
+    names = {value: name for name, value in _log_levels.items()}
+
+    lines = []
+    for timestamp, level, message in list(_log_history):
+        prefix = "%s.%03d %-7s " % (
+            time.strftime("%H:%M:%S", time.localtime(timestamp)),
+            int(timestamp * 1000) % 1000,
+            names.get(level, str(level)))
+
+        lines.extend(prefix + line for line in message.splitlines())
+
+    return lines
 
 
 def hh_syntax(base_file):
@@ -32,7 +162,7 @@ def hh_syntax(base_file):
     if len(syn_list) == 1:
         return syn_list[0]
 
-    log("Unable to locate unique syntax '%s'", base_file)
+    log("Unable to locate unique syntax '%s'", base_file, level=LOG_ERROR)
 
 
 def hh_setting(key):
@@ -40,11 +170,17 @@ def hh_setting(key):
     Get a HyperHelp setting from a cached settings object.
     """
     if not hasattr(hh_setting, "obj"):
-        hh_setting.obj = sublime.load_settings("HyperHelp.sublime-settings")
+        hh_setting.obj = (dict() if sublime is None else
+                          sublime.load_settings("HyperHelp.sublime-settings"))
         hh_setting.default = {
             "hyperhelp_date_format": "%x",
             "show_changelog": True,
             "focus_links_at_top": True,
+            "progressive_render_threshold": 262144,
+            "log_level": "info",
+            "live_reload": True,
+            "indexer_python": None,
+            "parse_in_background": True,
             "bookmarks": []
         }
 
@@ -67,31 +203,71 @@ def load_resource(res_name):
     Attempt to load and decode the UTF-8 encoded string with normalized line
     endings, returning the string on success or None on error.
 
-    If no resource can be found with the resource specification provided, the
-    call tries to load a file by this name from the packages folder instead.
+    Resources are loaded with the current resource provider; when running in
+    Sublime, a resource that Sublime doesn't know about is loaded from the
+    packages folder instead, if it exists there.
     """
     try:
-        text = sublime.load_binary_resource(res_name).decode("utf-8")
-        return text.replace('\r\n', '\n').replace('\r', '\n')
+        data = resource_provider().load_binary_resource(res_name)
 
     except OSError:
-        pass
+        return log("Unable to load '%s'; resource not found", res_name,
+                   level=LOG_ERROR)
 
-    except UnicodeError:
-        return log("Unable to decode '%s'; resource is not UTF-8" % res_name)
+    return _decode_resource(res_name, data)
+
+
+def load_resources(res_names):
+    """
+    Load and decode all of the resources in the provided list in one pass,
+    yielding a (res_name, text) tuple for each one that can be loaded, in no
+    particular order. The text is decoded the same way as load_resource().
+
+    This is much faster than loading the resources one at a time when there
+    are many of them, such as all of the help files in a package.
+    """
+    for res_name, data in resource_provider().load_binary_resources(res_names):
+        text = _decode_resource(res_name, data)
+        if text is not None:
+            yield res_name, text
 
+
+def _decode_resource(res_name, data):
+    """
+    Decode the binary content of the given resource as UTF-8 with normalized
+    line endings, returning None if it can't be decoded.
+    """
     try:
-        spp = os.path.split(sublime.packages_path())[0]
-        file_name = os.path.join(spp, res_name)
+        text = str(data, "utf-8")
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+    except UnicodeError:
+        return log("Unable to decode '%s'; resource is not UTF-8", res_name,
+                   level=LOG_ERROR)
 
-        with codecs.open(file_name, 'r', 'utf-8') as file:
-            return file.read().replace('\r\n', '\n').replace('\r', '\n')
+
+def load_binary_resource(res_name):
+    """
+    Attempt to load the raw binary contents of the provided resource, returning
+    the bytes on success or None if the resource can't be loaded.
+
+    This loads resources the same way as load_resource(), but does not log
+    anything when the resource is not found.
+    """
+    try:
+        return resource_provider().load_binary_resource(res_name)
 
     except OSError:
-        return log("Unable to load '%s'; resource not found" % res_name)
+        return None
 
-    except UnicodeError:
-        return log("Unable to decode '%s'; resource is not UTF-8" % res_name)
+
+def resource_mtime(res_name):
+    """
+    Get the modification time of the file that provides the given resource (or
+    the archive of the package that contains it), or None if it's not known.
+    This is used to know when a cached copy of a resource is out of date.
+    """
+    return resource_provider().resource_mtime(res_name)
 
 
 def current_help_package(view=None, window=None):
@@ -118,6 +294,28 @@ def current_help_file(view=None, window=None):
     return (view.settings().get("_hh_file") if view is not None else None)
 
 
+def _package_prompt_items(help_list):
+    """
+    Get the sorted list of quick panel items used to prompt for a package from
+    the provided list of loaded help indexes. When the help list is the one
+    returned by help_index_list(), the items are only rebuilt when the loaded
+    help indexes change.
+    """
+    generation = getattr(help_list, "generation", None)
+
+    cache = getattr(_package_prompt_items, "cache", None)
+    if generation is not None and cache is not None and cache[0] == generation:
+        return cache[1]
+
+    captions = [[help_list[key].package, help_list[key].description]
+                for key in sorted(help_list)]
+
+    if generation is not None:
+        _package_prompt_items.cache = (generation, captions)
+
+    return captions
+
+
 def help_package_prompt(help_list, on_select, on_cancel=None):
     """
     Given a list of loaded help indexes, prompt the user to select one of the
@@ -127,10 +325,7 @@ def help_package_prompt(help_list, on_select, on_cancel=None):
     if not help_list:
         return log("No packages with help are installed", status=True)
 
-    pkg_list = sorted([key for key in help_list])
-    captions = [[help_list[key].package,
-                 help_list[key].description]
-        for key in pkg_list]
+    captions = _package_prompt_items(help_list)
 
     def pick_package(index):
         package = None if index < 0 else captions[index][0]
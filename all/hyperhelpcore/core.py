@@ -1,27 +1,132 @@
-import sublime
-
 import os
-import re
-import time
 import webbrowser
+from threading import RLock
+from types import MappingProxyType
+from collections.abc import MutableMapping
 
 from urllib.parse import urlparse
 
+# Loading, reloading and looking up help indexes works outside of Sublime (in a
+# worker process or a plain interpreter) once a resource provider is set; only
+# the functions that display help or manage help views need Sublime.
+try:
+    import sublime
+except ImportError:
+    sublime = None
+
 from .common import log, hh_syntax, hh_setting
+from .common import current_help_file, current_help_package
+from .common import load_resource, LOG_WARNING, LOG_ERROR
 from .view import find_help_view, update_help_view
 
 from .help_index import _load_help_index, _scan_help_packages
+from .help_index import _normalize_topic
+from .help_index import _compile_help_index, _compiled_index_resource
 from .help import _resource_for_help
 from .help import _load_help_file, _display_help_file, _reload_help_file
 from .help import HistoryData, _update_help_history
-from .data import HeaderData
+from .help import _focus_when_rendered, _display_help_file_async
+from .help import _help_cache
+from .data import HelpSnapshot, IndexChange
+from .prefetch import _cancel_prefetch
+from .state import _get_help_nav, _get_help_history, _set_help_history
+from .topics import _topic_location
+from .indexer import _file_provider
+from .resources import resource_provider
+from .render import _parse_help_header, _parse_anchor_body
+from .render import _parse_link_body, _sidecar_resource, _encode_sidecar
 
 
 ###----------------------------------------------------------------------------
 
 
-_header_prefix_re = re.compile(r'^%hyperhelp(\b|$)')
-_header_keypair_re = re.compile(r'\b([a-z]+)\b="([^"]*)"')
+class _HelpRegistry():
+    """
+    The registry of loaded help indexes. The current snapshot is replaced as a
+    whole whenever the loaded help indexes change, so readers never need to
+    lock; the lock only serializes changes.
+
+    Listeners are told what changed whenever a new snapshot is taken.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.snapshot = None
+        self.listeners = []
+
+
+_registry = _HelpRegistry()
+
+
+def _packages_root():
+    """
+    Get the folder that resource names (which start with "Packages/") are
+    relative to, for files that need to be written alongside of package
+    resources, or None if resources don't come from the file system.
+    """
+    files = _file_provider()
+    if files is None:
+        return None
+
+    return os.path.split(files.packages_path)[0]
+
+
+class _HelpIndexView(MutableMapping):
+    """
+    A live view of the help indexes in the current snapshot, which is what
+    help_index_list() returns. Reading from it always sees the current loaded
+    help indexes, while changing it publishes a new snapshot with the change
+    made, as if the package had been loaded or unloaded.
+
+    The generation is that of the current snapshot, so that information that's
+    derived from the view can tell when it's stale.
+    """
+    def __getitem__(self, package):
+        return help_index_snapshot().indexes[package]
+
+    def __setitem__(self, package, pkg_info):
+        with _registry.lock:
+            indexes = dict(help_index_snapshot().indexes)
+            indexes[package] = pkg_info
+            _publish_indexes(indexes)
+
+    def __delitem__(self, package):
+        with _registry.lock:
+            indexes = dict(help_index_snapshot().indexes)
+            del indexes[package]
+            _publish_indexes(indexes)
+
+    def __iter__(self):
+        return iter(help_index_snapshot().indexes)
+
+    def __len__(self):
+        return len(help_index_snapshot().indexes)
+
+    def __contains__(self, package):
+        return package in help_index_snapshot().indexes
+
+    # These come from a single snapshot, so they're consistent even if the
+    # help indexes change while they're being used.
+    def keys(self):
+        return help_index_snapshot().indexes.keys()
+
+    def items(self):
+        return help_index_snapshot().indexes.items()
+
+    def values(self):
+        return help_index_snapshot().indexes.values()
+
+    def get(self, package, default=None):
+        return help_index_snapshot().indexes.get(package, default)
+
+    def copy(self):
+        return dict(help_index_snapshot().indexes)
+
+    @property
+    def generation(self):
+        return help_index_snapshot().generation
+
+
+_help_index_view = _HelpIndexView()
 
 
 ###----------------------------------------------------------------------------
@@ -35,6 +140,37 @@ def load_help_index(index_resource):
     return _load_help_index(index_resource)
 
 
+def compile_help_index(index_resource):
+    """
+    Given an index resource that points to a hyperhelp.json file, compile the
+    help index and save the compiled index alongside of it, so that it can be
+    loaded directly from then on. Returns the name of the file written, or None
+    on error.
+
+    Help indexes in packed packages cannot be compiled this way since the file
+    can't be saved into the package.
+    """
+    data = _compile_help_index(index_resource)
+    if data is None:
+        return None
+
+    spp = _packages_root()
+    if spp is None:
+        return log("Unable to save compiled index; no packages folder",
+                   level=LOG_ERROR)
+
+    file_name = os.path.join(spp, _compiled_index_resource(index_resource))
+
+    try:
+        with open(file_name, "wb") as file:
+            file.write(data)
+    except OSError as err:
+        return log("Unable to save compiled index '%s': %s", file_name, err,
+                   level=LOG_ERROR)
+
+    return file_name
+
+
 def load_help_file(pkg_info, help_file):
     """
     Load the contents of a help file contained in the provided help package.
@@ -45,21 +181,109 @@ def load_help_file(pkg_info, help_file):
     return _load_help_file(pkg_info, help_file)
 
 
+def help_index_snapshot():
+    """
+    Obtain the current snapshot of the loaded help indexes, demand loading all
+    of the help indexes on first access.
+
+    A snapshot never changes once it's been taken; changes to the loaded help
+    indexes create a new snapshot with a higher generation number. This makes
+    it safe to use a snapshot from any thread.
+    """
+    snapshot = _registry.snapshot
+    if snapshot is None:
+        with _registry.lock:
+            if _registry.snapshot is None:
+                _publish_indexes(_scan_help_packages())
+
+            snapshot = _registry.snapshot
+
+    return snapshot
+
+
 def help_index_list(reload=False, package=None):
     """
     Obtain or reload the help index information for all packages. This demand
     loads the indexes on first access and can optionally reload all package
     indexes or only a single one, as desired.
+
+    The return value is a live mapping of package names to help data, which
+    always reflects the currently loaded help indexes; use help_index_snapshot()
+    to get a mapping that doesn't change.
     """
-    initial_load = False
-    if not hasattr(help_index_list, "index"):
-        initial_load = True
-        help_index_list.index = _scan_help_packages()
+    initial_load = _registry.snapshot is None
+    help_index_snapshot()
 
     if reload and not initial_load:
-        help_index_list.index = reload_help_index(help_index_list.index, package)
+        with _registry.lock:
+            indexes = dict(_registry.snapshot.indexes)
+            _publish_indexes(reload_help_index(indexes, package))
+
+    return _help_index_view
+
+
+def help_index_generation():
+    """
+    Obtain the generation number of the loaded help indexes. This number goes
+    up every time that help indexes are loaded, reloaded or unloaded, so it can
+    be used to know when information derived from the help indexes is stale.
+    """
+    snapshot = _registry.snapshot
+    return snapshot.generation if snapshot is not None else 0
+
+
+def _publish_indexes(indexes):
+    """
+    Make a new snapshot of the provided dictionary of help indexes the current
+    one, returning it. This must be called with the registry lock held.
+    """
+    old = _registry.snapshot
+    new = HelpSnapshot(old.generation + 1 if old else 1,
+                       MappingProxyType(dict(indexes)))
+    _registry.snapshot = new
+
+    old_indexes = old.indexes if old else {}
+    change = IndexChange(new.generation,
+        frozenset(pkg for pkg in new.indexes if pkg not in old_indexes),
+        frozenset(pkg for pkg in old_indexes if pkg not in new.indexes),
+        frozenset(pkg for pkg, pkg_info in new.indexes.items()
+                  if pkg in old_indexes and old_indexes[pkg] is not pkg_info))
+
+    # Cached help documents from packages that were reloaded or unloaded may
+    # be out of date (e.g. the package was upgraded).
+    _help_cache.advance(new.generation,
+                        set(old_indexes[pkg].doc_root
+                            for pkg in change.removed | change.changed))
+
+    if change.added or change.removed or change.changed:
+        for listener in list(_registry.listeners):
+            if sublime is None:
+                listener(change)
+            else:
+                sublime.set_timeout(lambda l=listener: l(change))
+
+    return new
+
 
-    return help_index_list.index
+def add_index_listener(listener):
+    """
+    Register a listener to be told about changes to the loaded help indexes.
+    The listener is invoked in the main thread with an IndexChange that says
+    which packages were added, removed or changed.
+    """
+    with _registry.lock:
+        if listener not in _registry.listeners:
+            _registry.listeners.append(listener)
+
+
+def remove_index_listener(listener):
+    """
+    Remove a listener previously registered with add_index_listener(); this
+    does nothing if the listener is not registered.
+    """
+    with _registry.lock:
+        if listener in _registry.listeners:
+            _registry.listeners.remove(listener)
 
 
 def load_indexes_from_packages(packages):
@@ -70,9 +294,16 @@ def load_indexes_from_packages(packages):
     The new list of known help indexes is returned.
     """
     if not packages:
-        return log("Cannot demand load package indexes; no packages provided")
+        return log("Cannot demand load package indexes; no packages provided",
+                   level=LOG_WARNING)
 
-    return _scan_help_packages(help_index_list(), packages)
+    help_index_snapshot()
+    with _registry.lock:
+        indexes = dict(_registry.snapshot.indexes)
+        _scan_help_packages(indexes, packages)
+        _publish_indexes(indexes)
+
+    return _help_index_view
 
 
 def unload_help_indexes_from_packges(packages):
@@ -84,19 +315,24 @@ def unload_help_indexes_from_packges(packages):
     is returned.
     """
     if not packages:
-        return log("Cannot demand unload package indexes; no packages provided")
+        return log("Cannot demand unload package indexes; no packages provided",
+                   level=LOG_WARNING)
 
     if not isinstance(packages, list):
         packages = [packages]
 
-    indexes = help_index_list()
-    for pkg_info in list(indexes.values()):
-        package = os.path.split(pkg_info.index_file)[0].split("/")[1]
-        if package in packages:
-            del indexes[pkg_info.package]
-            log("Unloading help index for package '%s'", pkg_info.package)
+    help_index_snapshot()
+    with _registry.lock:
+        indexes = dict(_registry.snapshot.indexes)
+        for pkg_info in list(indexes.values()):
+            package = os.path.split(pkg_info.index_file)[0].split("/")[1]
+            if package in packages:
+                del indexes[pkg_info.package]
+                log("Unloading help index for package '%s'", pkg_info.package)
+
+        _publish_indexes(indexes)
 
-    return indexes
+    return _help_index_view
 
 
 def reload_help_index(help_list, package):
@@ -128,7 +364,7 @@ def reload_help_index(help_list, package):
             # one from the list of packages.
             if result.package != package:
                 log("Warning: package name in index changed (%s became %s)",
-                    package, result.package)
+                    package, result.package, level=LOG_WARNING)
                 del help_list[package]
 
     return help_list
@@ -143,6 +379,41 @@ def help_file_resource(pkg_info, help_file):
     return _resource_for_help(pkg_info, help_file)
 
 
+def render_help_sidecars(pkg_info):
+    """
+    Pre-render every help file in the provided help package into a sidecar
+    that is saved alongside of it, so that displaying the help file doesn't
+    need to post process it. Returns the number of sidecars written, or None
+    on error.
+
+    As with compiled indexes, help files in packed packages can't have
+    sidecars saved for them this way.
+    """
+    spp = _packages_root()
+    if spp is None:
+        return log("Unable to save sidecars; no packages folder",
+                   level=LOG_ERROR)
+
+    count = 0
+    for help_file in pkg_info.help_files:
+        res_name = _resource_for_help(pkg_info, help_file)
+        help_text = load_resource(res_name)
+        if help_text is None:
+            continue
+
+        file_name = os.path.join(spp, _sidecar_resource(res_name))
+        try:
+            with open(file_name, "wb") as file:
+                file.write(_encode_sidecar(help_file, help_text))
+        except OSError as err:
+            return log("Unable to save sidecar '%s': %s", file_name, err,
+                       level=LOG_ERROR)
+
+        count += 1
+
+    return count
+
+
 def display_help_file(pkg_info, help_file):
     """
     Load and display the help file contained in the provided help package. The
@@ -176,7 +447,8 @@ def lookup_help_topic(pkg_info, topic):
     return the topic structure if needed.
 
     This does all manipulations on the incoming topic, such as case folding and
-    space replacement.
+    space replacement; topics that are already normalized (such as the topics
+    of processed links) are looked up directly.
 
     Returns the topic structure or None.
     """
@@ -184,20 +456,48 @@ def lookup_help_topic(pkg_info, topic):
         pkg_info = help_index_list().get(pkg_info, None)
 
     if pkg_info is not None:
-        topic = " ".join(topic.casefold().split())
-        alias = pkg_info.help_aliases.get(topic, None)
-        return pkg_info.help_topics.get(alias or topic, None)
+        lookup = pkg_info.help_lookup
+
+        # Help data built without the lookup is probed the original way.
+        if lookup is None:
+            topic = _normalize_topic(topic)
+            alias = pkg_info.help_aliases.get(topic, None)
+            return pkg_info.help_topics.get(alias or topic, None)
+
+        result = lookup.get(topic, None)
+        if result is None:
+            result = lookup.get(_normalize_topic(topic), None)
+
+        return result
 
     return None
 
 
+def _topic_kind(pkg_info, topic_dict):
+    """
+    Given a topic dictionary such as returned by lookup_help_topic(), return
+    the kind of the topic ("file", "pkg_file" or "url"). Topic dictionaries
+    that don't record their kind are classified using the help data.
+    """
+    kind = topic_dict.get("kind", None)
+    if kind is None:
+        file = topic_dict["file"]
+        if file in pkg_info.urls:
+            kind = "url"
+        elif file in pkg_info.package_files:
+            kind = "pkg_file"
+        else:
+            kind = "file"
+
+    return kind
+
+
 def is_topic_normal(pkg_info, topic_dict):
     """
     Given a topic dictionary such as returned by lookup_help_topic(), determine
     if the topic represents a "normal" topic or not.
     """
-    return (not is_topic_url(pkg_info, topic_dict) and
-            not is_topic_file(pkg_info, topic_dict))
+    return _topic_kind(pkg_info, topic_dict) == "file"
 
 
 def is_topic_url(pkg_info, topic_dict):
@@ -205,7 +505,7 @@ def is_topic_url(pkg_info, topic_dict):
     Given a topic dictionary such as returned by lookup_help_topic(), determine
     if the topic represents a topic that will open a URL or not.
     """
-    return topic_dict["file"] in pkg_info.urls
+    return _topic_kind(pkg_info, topic_dict) == "url"
 
 
 def is_topic_file(pkg_info, topic_dict):
@@ -213,7 +513,7 @@ def is_topic_file(pkg_info, topic_dict):
     Given a topic dictionary such as returned by lookup_help_topic(), determine
     if the topic represents a topic that will open a URL or not.
     """
-    return topic_dict["file"] in pkg_info.package_files
+    return _topic_kind(pkg_info, topic_dict) == "pkg_file"
 
 
 def is_topic_url_valid(pkg_info, topic_dict):
@@ -225,9 +525,12 @@ def is_topic_url_valid(pkg_info, topic_dict):
     None is returned if a topic does not represent a URL.
     """
     if is_topic_url(pkg_info, topic_dict):
+        if "url_valid" in topic_dict:
+            return topic_dict["url_valid"]
+
         try:
             result = urlparse(topic_dict["file"])
-            return result.scheme and result.netloc
+            return bool(result.scheme and result.netloc)
         except:
             return False
 
@@ -245,7 +548,7 @@ def is_topic_file_valid(pkg_info, topic_dict):
     if is_topic_file(pkg_info, topic_dict):
         file = topic_dict["file"]
         base = os.path.split(file)[1]
-        if file not in sublime.find_resources(base):
+        if file not in resource_provider().find_resources(base):
             return False
 
         return True
@@ -253,7 +556,7 @@ def is_topic_file_valid(pkg_info, topic_dict):
     return None
 
 
-def show_help_topic(package, topic, history):
+def show_help_topic(package, topic, history, background=False, on_done=None):
     """
     Attempt to display the help for the provided topic in the given package
     (both strings) as appropriate. This will transparently create a new help
@@ -264,8 +567,17 @@ def show_help_topic(package, topic, history):
     untouched. history is implicitly True when this has to create a help view
     for the first time so that history is properly initialized.
 
+    If background is True and the parse_in_background setting is enabled, a
+    help file is loaded and parsed in a background thread and displayed when
+    that finishes; a newer navigation abandons it. When provided, on_done is
+    invoked in the main thread with the help view once a help file has been
+    displayed and the topic focused, whether in the background or not.
+
     The return value is None on error or a string that represents the kind of
-    topic that was navigated to ("file", "pkg_file" or "url")
+    topic that was navigated to ("file", "pkg_file" or "url"). A background
+    navigation to a help file that isn't displayed yet returns "pending"; if
+    the file then fails to load the failure is logged and on_done is not
+    invoked.
     """
     pkg_info = help_index_list().get(package, None)
     if pkg_info is None:
@@ -277,12 +589,13 @@ def show_help_topic(package, topic, history):
         return None
 
     help_file = topic_data["file"]
+    kind = _topic_kind(pkg_info, topic_data)
 
-    if help_file in pkg_info.urls:
+    if kind == "url":
         webbrowser.open_new_tab(help_file)
         return "url"
 
-    if help_file in pkg_info.package_files:
+    if kind == "pkg_file":
         help_file = help_file.replace("Packages/", "${packages}/")
         window = sublime.active_window()
         window.run_command("open_file", {"file": help_file})
@@ -292,34 +605,84 @@ def show_help_topic(package, topic, history):
     if history:
         _update_help_history(find_help_view())
 
+    # Any help files still being prefetched for the current file are no longer
+    # interesting once we navigate away from it.
+    if (package, help_file) != (current_help_package(), current_help_file()):
+        _cancel_prefetch()
+
     existing_view = True if find_help_view() is not None else False
-    help_view = display_help_file(pkg_info, help_file)
+
+    shown = []
+
+    # The displayer logs the reason that a help file could not be displayed.
+    def displayed(help_view):
+        if help_view is None:
+            return
+
+        shown.append(help_view)
+        _show_displayed_topic(help_view, pkg_info, topic, topic_data,
+                              history and existing_view)
+        if on_done is not None:
+            on_done(help_view)
+
+    if background and hh_setting("parse_in_background"):
+        _display_help_file_async(pkg_info, help_file, displayed,
+                                 topic_data["topic"])
+        return "file" if shown else "pending"
+
+    help_view = _display_help_file(pkg_info, help_file, topic_data["topic"])
     if help_view is None:
-        log("Unable to load help file '%s'", help_file, status=True)
         return None
 
-    found = False
-    anchor_dict = help_view.settings().get("_hh_nav", [])
-    idx = anchor_dict.get(topic_data["topic"], -1)
-    if idx >= 0:
-        anchor_pos = help_view.get_regions("_hh_anchors")[idx]
-        help_view.run_command("hyperhelp_focus",
-            {
-                "position": [anchor_pos.b, anchor_pos.a],
-                "at_top": hh_setting("focus_links_at_top"),
-                "at_center": not hh_setting("focus_links_at_top")
-            })
-        found = True
-
-    # Update history to track the new file, but only if the help view already
-    # existed; otherwise its creation set up the default history already.
-    if history and existing_view:
+    displayed(help_view)
+    return "file"
+
+
+def _show_displayed_topic(help_view, pkg_info, topic, topic_data, history):
+    """
+    Focus the given topic in the provided help view, which has just been told
+    to display the help file that contains it, and add a history entry for the
+    navigation if history is True.
+    """
+    help_file = topic_data["file"]
+    found = _focus_topic_anchor(help_view, topic_data["topic"])
+
+    # Callers only ask for history when the help view already existed, since
+    # otherwise its creation set up the default history already.
+    if history:
         _update_help_history(help_view, append=True)
 
     if not found:
-        log("Unable to find topic '%s' in help file '%s'", topic, help_file,
-            status=True)
-    return "file"
+        # When the file is still being displayed, the anchor may not have been
+        # rendered yet; in that case the focus happens when it arrives, unless
+        # indexing already found that the file has no anchor for the topic.
+        missing = lambda: log("Unable to find topic '%s' in help file '%s'",
+                              topic, help_file, status=True)
+        if (_topic_location(pkg_info, topic_data["topic"]) is False or
+                not _focus_when_rendered(help_view, topic_data["topic"],
+                    lambda: _focus_topic_anchor(help_view, topic_data["topic"]),
+                    missing)):
+            missing()
+
+
+def _focus_topic_anchor(help_view, topic):
+    """
+    Focus the anchor for the given topic in the provided help view, if there
+    is one. Returns a boolean to tell you if the anchor was found or not.
+    """
+    idx = _get_help_nav(help_view).get(topic, -1)
+    if idx < 0:
+        return False
+
+    anchor_pos = help_view.get_regions("_hh_anchors")[idx]
+    help_view.run_command("hyperhelp_focus",
+        {
+            "position": [anchor_pos.b, anchor_pos.a],
+            "at_top": hh_setting("focus_links_at_top"),
+            "at_center": not hh_setting("focus_links_at_top")
+        })
+
+    return True
 
 
 def navigate_help_history(help_view, prev):
@@ -337,7 +700,7 @@ def navigate_help_history(help_view, prev):
         return False
 
     hist_pos = help_view.settings().get("_hh_hist_pos")
-    hist_info = help_view.settings().get("_hh_hist")
+    hist_info = _get_help_history(help_view)
 
     if (prev and hist_pos == 0) or (not prev and hist_pos == len(hist_info) - 1):
         log("Cannot navigate %s through history; already at the end",
@@ -377,7 +740,7 @@ def jump_help_history(help_view, new_pos):
         return False
 
     hist_pos = help_view.settings().get("_hh_hist_pos")
-    hist_info = help_view.settings().get("_hh_hist")
+    hist_info = _get_help_history(help_view)
 
     if new_pos < 0 or new_pos >= len(hist_info) or new_pos == hist_pos:
         return False
@@ -412,12 +775,12 @@ def clear_help_history(help_view):
         return False
 
     hist_pos = help_view.settings().get("_hh_hist_pos")
-    hist_info = help_view.settings().get("_hh_hist")
+    hist_info = _get_help_history(help_view)
 
     entry = HistoryData._make(hist_info[hist_pos])
 
     help_view.settings().set("_hh_hist_pos", 0)
-    help_view.settings().set("_hh_hist", [entry])
+    _set_help_history(help_view, [entry])
 
     return True
 
@@ -427,28 +790,7 @@ def parse_help_header(help_file, header_line):
     Given the first line of a help file, check to see if it looks like a help
     source file, and if so parse the header and return the parsed values back.
     """
-    if not _header_prefix_re.match(header_line):
-        return None
-
-    title = "No Title Provided"
-    date = 0.0
-
-    for match in re.findall(_header_keypair_re, header_line):
-        if match[0] == "title":
-            title = match[1]
-        elif match[0] == "date":
-            try:
-                date = time.mktime(time.strptime(match[1], "%Y-%m-%d"))
-            except Exception as e:
-                print(e)
-                date = 0.0
-                log("Ignoring invalid file date '%s' in '%s'",
-                    match[1], help_file)
-        else:
-            log("Ignoring unknown header key '%s' in '%s'",
-                match[1], help_file)
-
-    return HeaderData(help_file, title, date)
+    return _parse_help_header(help_file, header_line)
 
 
 def parse_anchor_body(anchor_body):
@@ -459,16 +801,7 @@ def parse_anchor_body(anchor_body):
     This always returns a 2-tuple, though based on the anchor body in the file
     it may end up thinking that the topic ID and the text are identical.
     """
-    c_pos = anchor_body.find(':')
-    if c_pos >= 0:
-        id_val = anchor_body[:c_pos]
-        anchor_body = anchor_body[c_pos+1:]
-
-        id_val = id_val or anchor_body
-    else:
-        id_val = anchor_body
-
-    return (id_val.casefold().rstrip(), anchor_body.strip())
+    return _parse_anchor_body(anchor_body)
 
 
 def parse_link_body(link_body):
@@ -480,20 +813,7 @@ def parse_link_body(link_body):
     None if the parse failed. It's possible for the package to be None, in
     which case you can infer what the default package should be.
     """
-    parts = link_body.split(':')
-    if len(parts) == 1:
-        return None, link_body.rstrip(), link_body.rstrip()
-
-    if len(parts) >= 3:
-        pkg = parts[0]
-        topic = parts[1]
-        text = ":".join(parts[2:])
-    else:
-        return (None, None, None)
-
-    pkg = pkg or None
-    topic = topic or text
-    return (pkg, topic.strip(), text.strip())
+    return _parse_link_body(link_body)
 
 
 ###----------------------------------------------------------------------------
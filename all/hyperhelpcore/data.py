@@ -20,9 +20,60 @@ HistoryData = namedtuple("HistoryData", [
 #
 # This tells us all of the information we need about the help for a package at
 # load time so that we don't need to look it up later.
+#
+# help_lookup associates every normalized topic name and alias directly with
+# the topic structure that it represents. It's optional so that code that
+# constructs this from the other fields continues to work; when it's None,
+# lookups probe the topics and aliases directly instead.
 HelpData = namedtuple("HelpData", [
     "package", "index_file", "description", "doc_root", "help_topics",
-    "help_aliases", "help_files", "package_files", "urls", "help_toc"
+    "help_aliases", "help_files", "package_files", "urls", "help_toc",
+    "help_lookup"
+])
+HelpData.__new__.__defaults__ = (None, )
+
+# A snapshot of all of the loaded help indexes; indexes is a read-only mapping
+# of package names to HelpData, and the generation increases every time that a
+# new snapshot is taken.
+HelpSnapshot = namedtuple("HelpSnapshot", [
+    "generation", "indexes"
+])
+
+# A description of a change to the loaded help indexes; the generation of the
+# new snapshot and the sets of the names of packages that were added, removed
+# or changed (reloaded) in it.
+IndexChange = namedtuple("IndexChange", [
+    "generation", "added", "removed", "changed"
+])
+
+# A representation of a help file rendered outside of a help view; the text as
+# it would appear in the view, along with the anchors and links in it and the
+# parsed header (if any).
+RenderedHelp = namedtuple("RenderedHelp", [
+    "text", "anchors", "links", "header"
+])
+
+# A representation of a single link in the link graph; the package, file and
+# region (in the rendered file) of the link, the package and topic that the
+# link points at and the line of text that contains the link.
+LinkData = namedtuple("LinkData", [
+    "package", "file", "region", "target_package", "topic", "context"
+])
+
+# A single entry in the anchor outline of a help view; the region of the
+# anchor, the topic it represents (None if an earlier anchor in the file has the
+# same topic), the text of the anchor as displayed and its nesting level. File
+# header anchors are level 0, headings are at the level of the heading and
+# other anchors are nested one level below the heading before them.
+AnchorData = namedtuple("AnchorData", [
+    "start", "end", "topic", "text", "level"
+])
+
+# The location of the anchor for a topic, as found by indexing a help package;
+# the help file and the region of the anchor in the rendered file, along with
+# a snippet of the text of the section that the anchor introduces.
+TopicLocation = namedtuple("TopicLocation", [
+    "file", "start", "end", "snippet"
 ])
 
 
@@ -1,13 +1,194 @@
-import sublime
-import sublime_plugin
-
 import re
 import time
+from collections import OrderedDict, deque
+from threading import Lock
+
+# Displaying help needs Sublime, but the document cache and the functions that
+# load help files work without it, such as in a worker process.
+try:
+    import sublime
+except ImportError:
+    sublime = None
+
+from .view import find_help_view, update_help_view, clear_help_view_undo
+from .common import log, hh_syntax, hh_setting, LOG_DEBUG, LOG_ERROR
+from .common import current_help_file, current_help_package
+from .common import load_resource, load_binary_resource, resource_mtime
+from .data import HistoryData, AnchorData
+from .help_index import _normalize_topic
+from .render import _parse_anchor_body, _sidecar_resource, _decode_sidecar
+from .render import _render_help, _diff_rendered
+from .state import _get_help_links, _set_help_links, _save_help_links
+from .state import _get_help_history, _set_help_history
+from .state import _get_help_nav, _set_help_nav, _help_nav_lost
+from .state import _get_anchor_outline, _set_anchor_outline
+
+
+###----------------------------------------------------------------------------
+
+
+# Help files larger than the progressive render threshold are displayed in
+# chunks. The first chunk is displayed right away and the remaining chunks are
+# appended one at a time after a short delay. These control the size of the
+# chunks (in characters) and the delay between them (in milliseconds).
+_first_chunk_size = 8192
+_chunk_size = 65536
+_chunk_delay = 10
+
+# Used when splitting a help file into chunks to make sure that chunks are only
+# split outside of code blocks and comments.
+_code_fence_re = re.compile(r'^\s*(`{3})(?![^`]*`)')
+_code_fence_end_re = re.compile(r'^\s*(`{3})\s*$')
+_comment_re = re.compile(r'<\*\*|\*\*>')
+
+# Used to find anchors in the source of a help file before it is rendered; this
+# matches hidden anchors, regular anchors and heading anchors, in that order.
+_anchor_re = re.compile(r'\*\|([\w:$][^|]*)\|\*|\*([\w:$][^*]*)\*|'
+                        r'^[ \t]*#+(?!#)[ \t]*(\S.*?)[ \t]*#*[ \t]*$', re.MULTILINE)
+
+# Used to find the level of a heading in a help view when building the anchor
+# outline.
+_heading_level_re = re.compile(r'^[ \t]*(#+)[ \t]')
+
 
-from .view import find_help_view, update_help_view
-from .common import log, hh_syntax, current_help_file, current_help_package
-from .common import load_resource
-from .data import HistoryData
+###----------------------------------------------------------------------------
+
+
+class _DocumentCache():
+    """
+    A small, thread safe cache of loaded help documents, keyed by the resource
+    name of the help file. When the cache is full, the least recently used
+    document is discarded to make room for a new one.
+
+    Every document is stored along with the help index generation and the
+    modification time of the resource at the time it was loaded; it is only
+    used while the generation is still current and the resource has not been
+    modified since. When the help indexes change, documents in the packages
+    that changed are thrown away and the rest carry over to the new
+    generation.
+
+    This allows help files to be loaded ahead of time by a background thread so
+    that following a link doesn't need to load the target file from disk.
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = Lock()
+
+    def __contains__(self, res_name):
+        return self.get(res_name) is not None
+
+    def stamp(self, res_name):
+        """
+        Get the (generation, mtime) tuple that a document for the given
+        resource that is about to be loaded should be stored with; this needs
+        to be taken before the document is loaded.
+        """
+        return (self.generation, resource_mtime(res_name))
+
+    def get(self, res_name):
+        with self.lock:
+            entry = self.entries.get(res_name, None)
+            if entry is None:
+                return None
+
+        text, generation, mtime = entry
+        if generation != self.generation or mtime != resource_mtime(res_name):
+            self.discard(res_name)
+            return None
+
+        with self.lock:
+            if res_name in self.entries:
+                self.entries.move_to_end(res_name)
+
+        return text
+
+    def store(self, res_name, text, stamp=None):
+        """
+        Store the text of the given resource, with the stamp that was taken
+        before it was loaded (or a new one). A document loaded for an older
+        generation is not stored.
+        """
+        generation, mtime = stamp if stamp is not None else self.stamp(res_name)
+
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.entries[res_name] = (text, generation, mtime)
+            self.entries.move_to_end(res_name)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, res_name=None):
+        with self.lock:
+            if res_name is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(res_name, None)
+
+    def advance(self, generation, doc_roots):
+        """
+        Move the cache to a new help index generation, throwing away all of the
+        documents that are in any of the provided document roots (those of the
+        packages that were reloaded or unloaded); all other documents are
+        carried over to the new generation.
+        """
+        prefixes = tuple("Packages/%s/" % doc_root for doc_root in doc_roots)
+
+        with self.lock:
+            self.generation = generation
+            for res_name, (text, old, mtime) in list(self.entries.items()):
+                if prefixes and res_name.startswith(prefixes):
+                    del self.entries[res_name]
+                else:
+                    self.entries[res_name] = (text, generation, mtime)
+
+
+# The cache of help documents that have been loaded; this is populated both by
+# displaying help files and by prefetching the targets of links.
+_help_cache = _DocumentCache()
+
+
+class _HelpStream():
+    """
+    Track the progress of a help file that is being displayed progressively,
+    holding the chunks of the file that have not been displayed yet and an
+    optional topic whose anchor should be focused once it has been rendered.
+    """
+    def __init__(self, chunks):
+        self.chunks = deque(chunks)
+        self.pending = None
+
+    def check_pending(self, view):
+        """
+        Check to see if the anchor for the pending topic (if any) has been
+        rendered yet, and invoke the appropriate callback if it has or if it
+        never will be.
+        """
+        if self.pending is None:
+            return
+
+        topic, on_found, on_missing = self.pending
+        if topic in _get_help_nav(view):
+            self.pending = None
+            on_found()
+        elif not self.chunks:
+            self.pending = None
+            on_missing()
+
+
+# The help views that are currently being progressively displayed, keyed by
+# the id of the view.
+_help_streams = dict()
+
+# Every request to display a help file takes the next serial number; a help
+# file that is being parsed in the background is only displayed if no newer
+# request has been made in the meantime. This is only changed in the main
+# thread.
+_display_serial = 0
 
 
 ###----------------------------------------------------------------------------
@@ -28,8 +209,20 @@ def _load_help_file(pkg_info, help_file):
     The help file should be relative to the document root of the package.
 
     Returns None if the help file cannot be loaded.
+
+    This will use a cached copy of the help file if one is available, and will
+    cache the loaded file otherwise.
     """
-    return load_resource(_resource_for_help(pkg_info, help_file))
+    res_name = _resource_for_help(pkg_info, help_file)
+
+    text = _help_cache.get(res_name)
+    if text is None:
+        stamp = _help_cache.stamp(res_name)
+        text = load_resource(res_name)
+        if text is not None:
+            _help_cache.store(res_name, text, stamp)
+
+    return text
 
 
 def _update_help_history(view, append=False, selection=None):
@@ -51,7 +244,7 @@ def _update_help_history(view, append=False, selection=None):
     settings = view.settings()
 
     hist_pos = settings.get("_hh_hist_pos", 0)
-    hist_info = settings.get("_hh_hist", [])
+    hist_info = list(_get_help_history(view))
 
     if append:
         # Truncate all history after this point; new timeline branches out.
@@ -73,7 +266,7 @@ def _update_help_history(view, append=False, selection=None):
         hist_info[hist_pos] = history
 
     settings.set("_hh_hist_pos", hist_pos)
-    settings.set("_hh_hist", hist_info)
+    _set_help_history(view, hist_info)
 
 
 def _enable_post_processing(help_view, enable):
@@ -86,7 +279,270 @@ def _enable_post_processing(help_view, enable):
     help_view.settings().set("_hh_post_processing", enable)
 
 
-def _display_help_file(pkg_info, help_file):
+def _post_process_help(view, start=0, final=True):
+    """
+    Run all of the post processing commands over the text in the provided help
+    view that appears at or after the start position given; this must be the
+    start of a chunk of text that has not been post processed yet. final says
+    if this is the last chunk of the file.
+    """
+    _enable_post_processing(view, True)
+    if start == 0:
+        view.run_command("hyperhelp_internal_process_header")
+
+    view.run_command("hyperhelp_internal_process_comments", {"start": start})
+    view.run_command("hyperhelp_internal_process_anchors", {"start": start})
+    view.run_command("hyperhelp_internal_process_links", {"start": start})
+    _enable_post_processing(view, False)
+    clear_help_view_undo(view)
+
+    if final:
+        _save_help_links(view)
+
+
+def _load_sidecar(pkg_info, help_file, help_text):
+    """
+    Load the pre-rendered sidecar for the help file contained in the provided
+    help package, if there is one. The source of the help file is used to know
+    if the sidecar is still valid.
+
+    Returns a RenderedHelp tuple or None if there is no valid sidecar.
+    """
+    res_name = _sidecar_resource(_resource_for_help(pkg_info, help_file))
+    data = load_binary_resource(res_name)
+    if data is None:
+        return None
+
+    return _decode_sidecar(help_file, data, help_text,
+                           hh_setting("hyperhelp_date_format"))
+
+
+def _apply_rendered_help(view, pkg_info, rendered):
+    """
+    Set up the anchors and links in a help view that is displaying the text of
+    the provided pre-rendered help file, in place of post processing it.
+    """
+    view.add_regions("_hh_anchors",
+                     [sublime.Region(a, b) for a, b, topic in rendered.anchors],
+                     "", flags=sublime.HIDDEN | sublime.PERSISTENT)
+
+    view.add_regions("_hh_links",
+                     [sublime.Region(a, b) for a, b, pkg, topic in rendered.links],
+                     "", flags=sublime.HIDDEN | sublime.PERSISTENT)
+
+    # Anchors seen earlier in the file take precedence.
+    hh_nav = {}
+    for idx in reversed(range(len(rendered.anchors))):
+        hh_nav[rendered.anchors[idx][2]] = idx
+
+    _set_help_nav(view, hh_nav)
+    _set_help_links(view, [{"pkg": pkg or pkg_info.package,
+                            "topic": _normalize_topic(topic)}
+                           for a, b, pkg, topic in rendered.links])
+    _save_help_links(view)
+
+    view.run_command("hyperhelp_internal_flag_links")
+    view.run_command("hyperhelp_internal_prefetch_links")
+
+
+def _anchor_outline(view):
+    """
+    Get the anchor outline for the provided help view, building it if needed;
+    this is a tuple of a list of AnchorData sorted by position and a list of
+    the start positions of those anchors, for bisecting.
+
+    The outline is only built when it's first needed, and is kept until the
+    anchors change; setting up the anchors of a help file (or of each chunk of
+    one that's displayed progressively) throws it away.
+    """
+    outline = _get_anchor_outline(view)
+    if outline is not None:
+        return outline
+
+    topics = {idx: topic for topic, idx in _get_help_nav(view).items()}
+
+    anchors = []
+    heading = 0
+    for idx, region in enumerate(view.get_regions("_hh_anchors")):
+        line = view.line(region.begin())
+        match = _heading_level_re.match(view.substr(line))
+        if line.begin() == 0:
+            level = 0
+        elif match is not None:
+            heading = level = len(match.group(1))
+        else:
+            level = heading + 1
+
+        anchors.append(AnchorData(region.begin(), region.end(),
+                                  topics.get(idx, None), view.substr(region),
+                                  level))
+
+    anchors.sort(key=lambda anchor: anchor.start)
+    outline = (anchors, [anchor.start for anchor in anchors])
+    _set_anchor_outline(view, outline)
+
+    return outline
+
+
+def _find_anchor_source(help_text, topic):
+    """
+    Find the anchor for the given topic in the unprocessed source of a help
+    file, returning its offset. None is returned if it can't be found.
+
+    This is only an approximation of the help syntax, so it can be fooled by
+    things that look like anchors in code blocks and comments.
+    """
+    if topic is not None:
+        for match in _anchor_re.finditer(help_text):
+            body = next(group for group in match.groups() if group is not None)
+            if _parse_anchor_body(body)[0] == topic:
+                return match.start()
+
+    return None
+
+
+def _split_help_text(help_text, topic=None):
+    """
+    Split the text of a help file into chunks for progressive display, if it's
+    large enough to warrant it. The first chunk is made large enough to contain
+    the anchor for the given topic, if one is provided.
+
+    Chunks are only split at blank lines that are outside of code blocks and
+    comments. This always returns a list of at least one chunk.
+    """
+    threshold = hh_setting("progressive_render_threshold")
+    if not threshold or len(help_text) <= threshold:
+        return [help_text]
+
+    target = _first_chunk_size
+    anchor_pos = _find_anchor_source(help_text, topic)
+    if anchor_pos is not None:
+        target = max(target, anchor_pos + _first_chunk_size)
+
+    chunks = []
+    chunk_start = 0
+    pos = 0
+    in_fence = False
+    in_comment = False
+
+    for line in help_text.splitlines(True):
+        pos += len(line)
+
+        if in_fence:
+            in_fence = _code_fence_end_re.match(line) is None
+        elif not in_comment and _code_fence_re.match(line):
+            in_fence = True
+        else:
+            for token in _comment_re.findall(line):
+                in_comment = token == "<**"
+
+        if (pos - chunk_start >= target and not line.strip() and
+                not in_fence and not in_comment):
+            chunks.append(help_text[chunk_start:pos])
+            chunk_start = pos
+            target = _chunk_size
+
+    if chunk_start < len(help_text):
+        chunks.append(help_text[chunk_start:])
+
+    return chunks
+
+
+def _stream_help_chunks(view, chunks):
+    """
+    Progressively append the provided chunks of help text to the help view,
+    one chunk at a time, post processing each one as it's added. This stops if
+    some other help file is displayed in the view in the interim.
+    """
+    stream = _HelpStream(chunks)
+    _help_streams[view.id()] = stream
+
+    def next_chunk():
+        if _help_streams.get(view.id(), None) is not stream:
+            return
+
+        if not view.is_valid():
+            del _help_streams[view.id()]
+            return
+
+        start = view.size()
+        _enable_post_processing(view, True)
+        view.run_command("append", {"characters": stream.chunks.popleft()})
+        _post_process_help(view, start, final=not stream.chunks)
+
+        if stream.chunks:
+            sublime.set_timeout(next_chunk, _chunk_delay)
+        else:
+            del _help_streams[view.id()]
+
+        stream.check_pending(view)
+
+    sublime.set_timeout(next_chunk, _chunk_delay)
+
+
+def _focus_when_rendered(view, topic, on_found, on_missing):
+    """
+    If the help view provided is still progressively displaying its help file,
+    arrange for on_found to be called once the anchor for the given topic has
+    been rendered, or on_missing once the file is fully displayed without it.
+
+    Returns False if the view is not being progressively displayed, in which
+    case nothing happens.
+    """
+    stream = _help_streams.get(view.id(), None)
+    if stream is None:
+        return False
+
+    stream.pending = (topic, on_found, on_missing)
+    return True
+
+
+def _next_display_serial():
+    """
+    Take the next display serial number, abandoning any help file that is
+    still being parsed in the background.
+    """
+    global _display_serial
+    _display_serial += 1
+
+    return _display_serial
+
+
+def _show_help_text(pkg_info, help_file, chunks, rendered=None):
+    """
+    Put the provided help file into the help view of the current window, which
+    will be created if it does not exist, and return the view.
+
+    When a rendered help file is provided, its text is displayed and the
+    anchors and links are set up from it. Otherwise chunks is the list of
+    chunks of the source of the help file, as returned by _split_help_text();
+    the first chunk is displayed and post processed right away and the rest
+    are displayed progressively.
+    """
+    view = find_help_view()
+    if view is not None:
+        _help_streams.pop(view.id(), None)
+
+    text = rendered.text if rendered is not None else chunks[0]
+    view = update_help_view(text, pkg_info.package, help_file,
+                            hh_syntax("HyperHelp-Help.sublime-syntax"))
+
+    # if there is no history yet, add one selection the start of the file.
+    if not view.settings().has("_hh_hist_pos"):
+        _update_help_history(view, selection=sublime.Region(0))
+
+    if rendered is not None:
+        _apply_rendered_help(view, pkg_info, rendered)
+        return view
+
+    _post_process_help(view, final=len(chunks) == 1)
+    if len(chunks) > 1:
+        _stream_help_chunks(view, chunks[1:])
+
+    return view
+
+
+def _display_help_file(pkg_info, help_file, topic=None):
     """
     Load and display the help file contained in the provided help package. The
     help file should be relative to the document root of the package.
@@ -94,11 +550,20 @@ def _display_help_file(pkg_info, help_file):
     The help will be displayed in the help view of the current window, which
     will be created if it does not exist.
 
+    Large help files are displayed progressively; if a topic is provided, the
+    part of the file containing the anchor for that topic is displayed along
+    with the first chunk. A help file with a valid pre-rendered sidecar is
+    displayed from the sidecar, so that it doesn't need to be post processed
+    in the view; otherwise the help syntax and the post processing commands
+    decide where its anchors and links are.
+
     Does nothing if the help view is already displaying this file.
 
     Returns None if the help file could not be found/loaded or the help view
     on success.
     """
+    _next_display_serial()
+
     view = find_help_view()
     window = view.window() if view is not None else sublime.active_window()
 
@@ -113,23 +578,123 @@ def _display_help_file(pkg_info, help_file):
 
     help_text = _load_help_file(pkg_info, help_file)
     if help_text is not None:
-        view = update_help_view(help_text, pkg_info.package, help_file,
-                                hh_syntax("HyperHelp-Help.sublime-syntax"))
+        # A pre-rendered sidecar is displayed as is; otherwise the syntax and
+        # the post processing commands decide where the anchors and links are.
+        chunks = None
+        rendered = _load_sidecar(pkg_info, help_file, help_text)
+        if rendered is None:
+            chunks = _split_help_text(help_text, topic)
 
-        # if there is no history yet, add one selection the start of the file.
-        if not view.settings().has("_hh_hist_pos"):
-            _update_help_history(view, selection=sublime.Region(0))
+        return _show_help_text(pkg_info, help_file, chunks, rendered)
+
+    return log("Unable to find help file '%s'", help_file, status=True)
+
+
+def _display_help_file_async(pkg_info, help_file, on_done, topic=None):
+    """
+    Load and display the help file contained in the provided help package, as
+    _display_help_file() does, except that loading the file (and its sidecar,
+    if it has one) happens in a background thread; only putting the text into
+    the help view and setting up its anchors and links happens in the main
+    thread.
+
+    Large help files are split into chunks in the background thread and then
+    displayed progressively, the same as _display_help_file() does; if a topic
+    is provided, the first chunk includes the anchor for it.
+
+    The callback is invoked in the main thread with the help view once the file
+    is displayed, or with None if it could not be loaded or rendered; the
+    reason is logged before the callback is invoked. If another help file
+    is displayed before this one has been parsed, this one is abandoned and
+    the callback is never invoked.
+    """
+    serial = _next_display_serial()
+
+    view = find_help_view()
+    if view is not None:
+        view.window().focus_view(view)
 
+        if (help_file == current_help_file(view) and
+                pkg_info.package == current_help_package(view)):
+            return on_done(view)
+
+    def parse():
+        if serial != _display_serial:
+            return
+
+        chunks = None
+        rendered = None
+        error = None
+        try:
+            help_text = _load_help_file(pkg_info, help_file)
+            if help_text is not None and serial == _display_serial:
+                rendered = _load_sidecar(pkg_info, help_file, help_text)
+                if rendered is None:
+                    chunks = _split_help_text(help_text, topic)
+
+        except Exception as err:
+            error = err
+
+        sublime.set_timeout(lambda: display(chunks, rendered, error))
+
+    def display(chunks, rendered, error):
+        if serial != _display_serial:
+            return log("Abandoned displaying '%s'; another help file was displayed",
+                       help_file, level=LOG_DEBUG)
+
+        # Failures are only reported here; callers just see None.
+        if error is not None:
+            log("Unable to display help file '%s': %s", help_file, error,
+                status=True, level=LOG_ERROR)
+            return on_done(None)
+
+        if rendered is None and chunks is None:
+            log("Unable to find help file '%s'", help_file, status=True)
+            return on_done(None)
+
+        on_done(_show_help_text(pkg_info, help_file, chunks, rendered))
+
+    sublime.set_timeout_async(parse)
+
+
+def _patch_help_view(view, pkg_info, help_file, help_text):
+    """
+    Update the help view provided, which must be displaying the given help
+    file, to display the new source of that help file that is provided.
+
+    Rather than rebuilding the view, the old and new rendered text are compared
+    and only the parts that changed are edited, so the scroll position and
+    selection in the view are kept; the anchors and links are then set up from
+    the newly rendered file.
+
+    Returns False if the view is still progressively displaying the file, in
+    which case nothing happens.
+    """
+    if view.id() in _help_streams:
+        return False
+
+    rendered = _render_help(help_file, help_text,
+                            hh_setting("hyperhelp_date_format"))
+
+    old_text = view.substr(sublime.Region(0, view.size()))
+    edits = _diff_rendered(old_text,
+                           [r.begin() for r in view.get_regions("_hh_anchors")],
+                           rendered.text,
+                           [a for a, b, topic in rendered.anchors])
+
+    if edits:
         _enable_post_processing(view, True)
-        view.run_command("hyperhelp_internal_process_header")
-        view.run_command("hyperhelp_internal_process_comments")
-        view.run_command("hyperhelp_internal_process_anchors")
-        view.run_command("hyperhelp_internal_process_links")
+        view.run_command("hyperhelp_internal_patch_text",
+                         {"edits": [list(edit) for edit in edits]})
         _enable_post_processing(view, False)
+        clear_help_view_undo(view)
 
-        return view
+    _help_cache.store(_resource_for_help(pkg_info, help_file), help_text)
+    _apply_rendered_help(view, pkg_info, rendered)
 
-    return log("Unable to find help file '%s'", help_file, status=True)
+    log("Updated '%s' in place with %d edit(s)", help_file, len(edits),
+        level=LOG_DEBUG)
+    return True
 
 
 def _reload_help_file(help_list, help_view):
@@ -138,6 +703,9 @@ def _reload_help_file(help_list, help_view):
     up changes made since it was displayed. The information on the package and
     help file should be contained in the provided help list.
 
+    When possible, the view is updated in place so that only the parts of the
+    file that changed are redrawn.
+
     Returns True if the file was reloaded successfully or False if not.
     """
     if help_view is None:
@@ -149,13 +717,20 @@ def _reload_help_file(help_list, help_view):
     pkg_info = help_list.get(package, None)
 
     if pkg_info is not None and file is not None:
+        _help_cache.discard(_resource_for_help(pkg_info, file))
+
+        help_text = load_resource(_resource_for_help(pkg_info, file))
+        if (help_text is not None and
+                _patch_help_view(help_view, pkg_info, file, help_text)):
+            return True
+
         # Remove the file setting so the view will reload; put it back if the
         # reload fails so we can still track what the file used to be.
         settings = help_view.settings()
         settings.set("_hh_file", "")
         if _display_help_file(pkg_info, file) is None:
             settings.set("_hh_file", file)
-            return false
+            return False
 
         return True
 
@@ -163,6 +738,33 @@ def _reload_help_file(help_list, help_view):
     return False
 
 
+def _recover_help_nav(help_list, help_view):
+    """
+    Rebuild the anchor navigation information for the given help view if it
+    was lost because the view was restored from a session. The help file is
+    reloaded in place, which makes no edits if the file has not changed.
+    """
+    if not _help_nav_lost(help_view):
+        return
+
+    if not _reload_help_file(help_list, help_view):
+        _set_help_nav(help_view, {})
+
+
+def _get_link_index(help_view, link_region):
+    """
+    Given a help view and the region of a link within it, return back the index
+    of that link, with the first link in the file being numbered as 0.
+
+    None is returned if the region is not the region of a link.
+    """
+    for idx, region in enumerate(help_view.get_regions("_hh_links")):
+        if region == link_region:
+            return idx
+
+    return None
+
+
 def _get_link_topic(help_view, link_region):
     """
     Given a help view and information about a link, return back an object that
@@ -175,16 +777,16 @@ def _get_link_topic(help_view, link_region):
     None is returned when the information cannot be found.
     """
     topic_data = None
-    topics = help_view.settings().get("_hh_links")
+    topics = _get_help_links(help_view)
 
     try:
         # If the incoming region is an index, our job is easy.
         if isinstance(link_region, int):
             return topics[link_region]
 
-        for idx, region in enumerate(help_view.get_regions("_hh_links")):
-            if region == link_region:
-                return topics[idx]
+        idx = _get_link_index(help_view, link_region)
+        if idx is not None:
+            return topics[idx]
     except:
         pass
 
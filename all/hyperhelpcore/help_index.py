@@ -1,16 +1,21 @@
-import sublime
-import sublime_plugin
-
 # Inside packages, paths are always posix regardless of the platform in use.
 import posixpath as path
 from collections import OrderedDict
+from functools import lru_cache
 import os
 import re
+import io
 import codecs
+import hashlib
+import pickle
+
+from urllib.parse import urlparse
 
-from .common import log, load_resource
+from .common import log, load_resource, load_binary_resource
+from .common import aggregate_log, LOG_WARNING, LOG_ERROR
 from .data import HelpData
 from .index_validator import validate_index
+from .resources import resource_provider
 
 
 ###----------------------------------------------------------------------------
@@ -18,10 +23,87 @@ from .index_validator import validate_index
 
 _url_prefix_re = re.compile(r'^https?://')
 
+# A help index can be compiled into a binary form that is stored alongside the
+# hyperhelp.json file with this name. The compiled index starts with the magic
+# value (which carries the version of the format) and the hash of the index it
+# was compiled from, followed by the pickled fields of the help data.
+_compiled_index_name = "hyperhelp.idx"
+_compiled_index_magic = b"HHIDX\x01\n"
+_compiled_index_keys = {
+    "package", "description", "doc_root", "help_topics", "help_aliases",
+    "help_files", "package_files", "urls", "help_toc", "help_lookup"
+}
+
 
 ###----------------------------------------------------------------------------
 
 
+@lru_cache(maxsize=4096)
+def _normalize_topic(topic):
+    """
+    Normalize the name of a topic by case folding it and collapsing all runs of
+    whitespace into a single space. Results are cached since the same topic
+    names are normalized over and over again.
+    """
+    return " ".join(topic.casefold().split())
+
+
+def _build_lookup(topics, aliases):
+    """
+    Given the dictionaries of topics and aliases for a package, return back a
+    dictionary that associates every topic name and alias directly with the
+    topic structure, so that a lookup only needs to probe a single dictionary.
+
+    An alias takes precedence over a topic of the same name, and an alias for a
+    topic that does not exist is not included.
+    """
+    lookup = dict(topics)
+    for alias, topic in aliases.items():
+        if topic in topics:
+            lookup[alias] = topics[topic]
+        else:
+            lookup.pop(alias, None)
+
+    return lookup
+
+
+def _source_kind(help_source, external):
+    """
+    Classify a help source, returning the kind of topic that all topics in it
+    are ("file" for help files, "pkg_file" for package files and "url" for
+    URLs) and, for URLs, whether the URL is valid or not.
+    """
+    if not external:
+        return "file", None
+
+    if not _url_prefix_re.match(help_source):
+        return "pkg_file", None
+
+    try:
+        result = urlparse(help_source)
+        return "url", bool(result.scheme and result.netloc)
+    except:
+        return "url", False
+
+
+def _make_topic(name, caption, help_source, kind, url_valid):
+    """
+    Create and return a new topic structure for a topic in the given source.
+    URL topics also record whether the URL is valid or not.
+    """
+    topic = {
+        "topic": name,
+        "caption": caption,
+        "file": help_source,
+        "kind": kind
+    }
+
+    if kind == "url":
+        topic["url_valid"] = url_valid
+
+    return topic
+
+
 def _import_topics(package, topics, aliases, help_topic_dict, caption_tpl,
                    external=False):
     """
@@ -43,10 +125,11 @@ def _import_topics(package, topics, aliases, help_topic_dict, caption_tpl,
             and not _url_prefix_re.match(help_source)
             and not help_source.startswith("Packages/")):
                 log("Discarding invalid external '%s' in %s",
-                    help_source, package)
+                    help_source, package, level=LOG_WARNING)
                 continue
 
         default_caption = topic_list[0] if external else None
+        kind, url_valid = _source_kind(help_source, external)
 
         # Skip the first entry since it's the title of the help source
         for topic_entry in topic_list[1:]:
@@ -59,28 +142,24 @@ def _import_topics(package, topics, aliases, help_topic_dict, caption_tpl,
             # Normalize whitespace that appears in topics so that only a single
             # whitespace character appears wherever there might be two or more
             # in a row.
-            # TODO: This could be a lot cleaner
-            name = " ".join(name.casefold().split())
+            name = _normalize_topic(name)
             if name in topics:
                 log("Skipping duplicate topic '%s' in %s:%s",
-                    name, package, help_source)
+                    name, package, help_source, level=LOG_WARNING)
             elif name in aliases:
                 log("Topic %s is already an alias in %s:%s",
-                    name, package, help_source)
+                    name, package, help_source, level=LOG_WARNING)
             else:
-                topics[name] = {
-                    "topic": name,
-                    "caption": caption,
-                    "file": help_source
-                }
+                topics[name] = _make_topic(name, caption, help_source,
+                                           kind, url_valid)
 
-            for new_name in [" ".join(name.casefold().split()) for name in alias_list]:
+            for new_name in [_normalize_topic(name) for name in alias_list]:
                 if new_name in topics:
                     log("Alias '%s' is already a topic in %s:%s",
-                        new_name, package, help_source)
+                        new_name, package, help_source, level=LOG_WARNING)
                 elif new_name in aliases:
                     log("Skipping duplicate alias '%s' in %s:%s",
-                        new_name, package, help_source)
+                        new_name, package, help_source, level=LOG_WARNING)
                 else:
                     aliases[new_name] = name
 
@@ -88,11 +167,8 @@ def _import_topics(package, topics, aliases, help_topic_dict, caption_tpl,
         # file by name. The help file name is the default.
         name = help_source.casefold()
         if name not in topics:
-            topics[name] = {
-                "topic": name,
-                "caption": topic_list[0],
-                "file": help_source
-            }
+            topics[name] = _make_topic(name, topic_list[0], help_source,
+                                       kind, url_valid)
 
     return topics
 
@@ -101,18 +177,17 @@ def _merge_externals(package, externals, topics, package_files, urls):
     """
     Merge the externals into the topic list provided. This ensures that there
     are no duplicate topics during the merge (discarding the external) while
-    also splitting the externals into package file specifications and urls.
+    also splitting the externals into sets of package file specifications and
+    urls.
     """
     for topic, entry in externals.items():
         if topic in topics:
             log("Discarding duplicate external topic '%s' in %s:%s",
-                topic, package, entry["file"])
+                topic, package, entry["file"], level=LOG_WARNING)
             continue
 
-        file = entry["file"]
-        file_list = urls if _url_prefix_re.match(file) else package_files
-        if file not in file_list:
-            file_list.append(file)
+        file_set = urls if entry["kind"] == "url" else package_files
+        file_set.add(entry["file"])
 
         topics[topic] = entry
 
@@ -151,13 +226,14 @@ def _get_toc_metadata(help_toc_list, topics, aliases, package):
             return topic, topics.get(topic, None)
 
         # Use the caption for the topic being referenced if not overridden.
-        topic = " ".join(entry["topic"].casefold().split())
+        topic = _normalize_topic(entry["topic"])
         alias = aliases.get(topic, None)
         base_obj = topics.get(alias or topic, None)
         if base_obj is None:
             return topic, None
 
         entry["file"] = base_obj["file"]
+        entry["kind"] = base_obj["kind"]
         entry["caption"] = entry.get("caption", base_obj["caption"])
 
         return topic, entry
@@ -172,7 +248,8 @@ def _get_toc_metadata(help_toc_list, topics, aliases, package):
         for item in item_list:
             topic, info = lookup_topic_entry(item)
             if info is None:
-                log("TOC for '%s' is missing topic '%s'; skipping", package, topic)
+                log("TOC for '%s' is missing topic '%s'; skipping",
+                    package, topic, level=LOG_WARNING)
                 continue
 
             child_topics = info.get("children", None)
@@ -186,64 +263,193 @@ def _get_toc_metadata(help_toc_list, topics, aliases, package):
     return expand_topic_list(help_toc_list)
 
 
+def _compiled_index_resource(index_res):
+    """
+    Given the resource filename of a hyperhelp json file, return the resource
+    filename of the compiled version of that index.
+    """
+    return path.join(path.split(index_res)[0], _compiled_index_name)
+
+
+def _source_hash(content):
+    """
+    Return the hash of the content of a help index, which is used to know if a
+    compiled index was compiled from that content or not.
+    """
+    return hashlib.sha1(content.encode("utf-8")).hexdigest().encode("ascii")
+
+
+class _IndexUnpickler(pickle.Unpickler):
+    """
+    An unpickler for compiled help indexes, which only contain basic data types
+    and so refuse to load anything else.
+    """
+    allowed = {("builtins", "set"), ("collections", "OrderedDict")}
+
+    def find_class(self, module, name):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError("'%s.%s' is not allowed in an index" %
+                                         (module, name))
+
+        return super().find_class(module, name)
+
+
+def _compile_index_data(index_res, content):
+    """
+    Given the resource filename of a hyperhelp json file and its content,
+    validate it and process it into a dictionary of the fields that make up the
+    HelpData for the index. The return value is None on failure.
+
+    The document root is left as it appears in the index, since resolving it
+    depends on the package that the index is loaded from.
+    """
+    raw_dict = validate_index(content, index_res)
+    if raw_dict is None:
+        return None
+
+    # Repeated problems in a large index are summarized rather than flooding
+    # the console.
+    with aggregate_log():
+        # Top level index keys
+        package = raw_dict.pop("package", None)
+        description = raw_dict.pop("description", "Help for %s" % package)
+        doc_root = raw_dict.pop("doc_root", None)
+        help_files = raw_dict.pop("help_files", dict())
+        help_toc = raw_dict.pop("help_contents", None)
+        externals = raw_dict.pop("externals", None)
+        caption_tpl = raw_dict.pop("default_caption",
+                                        "Topic {topic} in help source {source}")
+
+        # Warn if the dictionary has too many keys
+        for key in raw_dict.keys():
+            log("Ignoring unknown key '%s' in index file %s", key, package,
+                level=LOG_WARNING)
+
+        # Gather the unique list of topics.
+        topic_list = dict()
+        alias_list = dict()
+        _import_topics(package, topic_list, alias_list, help_files, caption_tpl)
+
+        externals_list = dict()
+        package_files = set()
+        urls = set()
+        if externals is not None:
+            _import_topics(package, externals_list, alias_list, externals, caption_tpl, external=True)
+            _merge_externals(package, externals_list, topic_list, package_files, urls)
+
+        return {
+            "package": package,
+            "description": description,
+            "doc_root": doc_root,
+            "help_topics": topic_list,
+            "help_aliases": alias_list,
+            "help_files": _get_file_metadata(help_files),
+            "package_files": package_files,
+            "urls": urls,
+            "help_toc": _get_toc_metadata(help_toc, topic_list, alias_list, package),
+            "help_lookup": _build_lookup(topic_list, alias_list)
+        }
+
+
+def _compile_help_index(index_res):
+    """
+    Given the resource filename of a hyperhelp json file, load and compile it,
+    returning back the binary content of the compiled index. The return value
+    is None on failure.
+
+    The compiled index carries a hash of the index it was compiled from, so
+    that it is only used while it matches that index.
+    """
+    content = load_resource(index_res)
+    if content is None:
+        return log("Unable to load index information from '%s'", index_res,
+                   level=LOG_ERROR)
+
+    index_data = _compile_index_data(index_res, content)
+    if index_data is None:
+        return None
+
+    return (_compiled_index_magic + _source_hash(content) +
+            pickle.dumps(index_data, protocol=3))
+
+
+def _decode_compiled_index(index_res, data, content):
+    """
+    Given the resource filename of a hyperhelp json file, the binary content of
+    its compiled index and the content of the index itself, decode the compiled
+    index and return the dictionary of fields that it contains.
+
+    The return value is None if the compiled index is not valid or was not
+    compiled from the content of the index provided.
+    """
+    if not data.startswith(_compiled_index_magic):
+        return log("Ignoring unknown compiled index format for '%s'",
+                   index_res, level=LOG_WARNING)
+
+    offset = len(_compiled_index_magic)
+    digest = _source_hash(content)
+    if data[offset:offset + len(digest)] != digest:
+        return log("Ignoring stale compiled index for '%s'", index_res,
+                   level=LOG_WARNING)
+
+    try:
+        index_data = _IndexUnpickler(io.BytesIO(data[offset + len(digest):])).load()
+    except Exception as err:
+        return log("Ignoring invalid compiled index for '%s': %s",
+                   index_res, err, level=LOG_WARNING)
+
+    if not isinstance(index_data, dict) or set(index_data) != _compiled_index_keys:
+        return log("Ignoring invalid compiled index for '%s'", index_res,
+                   level=LOG_WARNING)
+
+    return index_data
+
+
 def _load_help_index(index_res):
     """
     Given a package name and the resource filename of the hyperhelp json file,
     load the help index and return it. The return value is None on failure or
     HelpData on success.
+
+    When a compiled index that matches the help index is available, it is used
+    instead of processing the help index.
     """
     if not index_res.casefold().startswith("packages/"):
-        return log("Index source is not in a package: %s", index_res)
+        return log("Index source is not in a package: %s", index_res,
+                   level=LOG_ERROR)
 
     content = load_resource(index_res)
 
     if content is None:
-        return log("Unable to load index information from '%s'", index_res)
+        return log("Unable to load index information from '%s'", index_res,
+                   level=LOG_ERROR)
 
-    raw_dict = validate_index(content, index_res)
-    if raw_dict is None:
-        return None
+    index_data = None
+    compiled = load_binary_resource(_compiled_index_resource(index_res))
+    if compiled is not None:
+        index_data = _decode_compiled_index(index_res, compiled, content)
 
-    containing_pkg = path.split(index_res)[0].split("/")[1]
+    if index_data is None:
+        index_data = _compile_index_data(index_res, content)
+        if index_data is None:
+            return None
 
-    # Top level index keys
-    package = raw_dict.pop("package", None)
-    description = raw_dict.pop("description", "Help for %s" % package)
-    doc_root = raw_dict.pop("doc_root", None)
-    help_files = raw_dict.pop("help_files", dict())
-    help_toc = raw_dict.pop("help_contents", None)
-    externals = raw_dict.pop("externals", None)
-    caption_tpl = raw_dict.pop("default_caption",
-                                    "Topic {topic} in help source {source}")
-
-    # Warn if the dictionary has too many keys
-    for key in raw_dict.keys():
-        log("Ignoring unknown key '%s' in index file %s", key, package)
+    containing_pkg = path.split(index_res)[0].split("/")[1]
 
     # If there is no document root, set it from the index resource; otherwise
     # ensure that it's normalized to appear in the appropriate package.
+    doc_root = index_data["doc_root"]
     if not doc_root:
         doc_root = path.split(index_res[len("Packages/"):])[0]
     else:
         doc_root = path.normpath("%s/%s" % (containing_pkg, doc_root))
 
-    # Gather the unique list of topics.
-    topic_list = dict()
-    alias_list = dict()
-    _import_topics(package, topic_list, alias_list, help_files, caption_tpl)
-
-    externals_list = dict()
-    package_files = list()
-    urls = list()
-    if externals is not None:
-        _import_topics(package, externals_list, alias_list, externals, caption_tpl, external=True)
-        _merge_externals(package, externals_list, topic_list, package_files, urls)
-
     # Everything has succeeded.
-    return HelpData(package, index_res, description, doc_root,
-        topic_list, alias_list,
-        _get_file_metadata(help_files), package_files, urls,
-        _get_toc_metadata(help_toc, topic_list, alias_list, package))
+    return HelpData(index_data["package"], index_res,
+        index_data["description"], doc_root,
+        index_data["help_topics"], index_data["help_aliases"],
+        index_data["help_files"], index_data["package_files"],
+        index_data["urls"], index_data["help_toc"], index_data["help_lookup"])
 
 
 def _is_canonical_pkg_idx(pkg_idx):
@@ -267,29 +473,34 @@ def _resolve_index_conflict(existing_idx, new_idx):
     existing_canon = _is_canonical_pkg_idx(existing_idx)
     new_canon = _is_canonical_pkg_idx(new_idx)
 
-    log("Warning: Multiple indexes found for package '%s'", new_idx.package)
-    log("    %s", existing_idx.index_file)
-    log("    %s", new_idx.index_file)
+    log("Warning: Multiple indexes found for package '%s'", new_idx.package,
+        level=LOG_WARNING)
+    log("    %s", existing_idx.index_file, level=LOG_WARNING)
+    log("    %s", new_idx.index_file, level=LOG_WARNING)
 
     # When only one of the two packages is canonical, that is the one to use.
     if existing_canon != new_canon:
         if existing_canon:
-            log("Warning: Ignoring non-canonical index (%s)", new_idx.index_file)
+            log("Warning: Ignoring non-canonical index (%s)",
+                new_idx.index_file, level=LOG_WARNING)
             return existing_idx
 
-        log("Warning: Using canonical index (%s)", new_idx.index_file)
+        log("Warning: Using canonical index (%s)", new_idx.index_file,
+            level=LOG_WARNING)
         return new_idx
 
     # The canon of both indexes is identical. If neither is canon, always use
     # the most recently loaded one (in package load order), just as result
     # Sublime resources would.
     if existing_canon == False:
-        log("Warning: Selecting new index (%s)", new_idx.index_file)
+        log("Warning: Selecting new index (%s)", new_idx.index_file,
+            level=LOG_WARNING)
         return new_idx
 
     # Both are canon, which is not good. This is an error, and we will return
     # None to signal that.
-    log("Error: Multiple indexes for '%s' are canonical", new_idx.package)
+    log("Error: Multiple indexes for '%s' are canonical", new_idx.package,
+        level=LOG_ERROR)
     return None
 
 
@@ -325,7 +536,8 @@ def _scan_help_packages(help_list=None, name_filter=None):
 
     # Find all of the index file resources and the list of those that are
     # currently loaded in the provided help list (if any).
-    indexes = _filter_index(sublime.find_resources("hyperhelp.json"), name_filter)
+    indexes = _filter_index(resource_provider().find_resources("hyperhelp.json"),
+                            name_filter)
     loaded = [help_list[pkg].index_file for pkg in help_list.keys()]
 
     # The list of packages that are considered broken because they have at
@@ -339,7 +551,7 @@ def _scan_help_packages(help_list=None, name_filter=None):
             # If this package index is broken, ignore it completely
             if new_idx.package in broken:
                 log("Error: Ignoring index for '%s' (%s)", new_idx.package,
-                    new_idx.index_file)
+                    new_idx.index_file, level=LOG_ERROR)
                 continue
 
             # If an index already exists for this package, we need to determine
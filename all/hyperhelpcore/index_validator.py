@@ -1,14 +1,17 @@
-import sublime
+from .validictory import SchemaValidator
+from .validictory import SchemaError, ValidationError, MultipleValidationError
 
-from .validictory import validate
-from .validictory import SchemaError, ValidationError
-
-from .common import log
+from .common import log, aggregate_log, LOG_DEBUG, LOG_ERROR
+from .resources import resource_provider
 
 
 ###----------------------------------------------------------------------------
 
 
+# When collecting all of the problems in a help index, stop after this many
+# have been found.
+_max_index_errors = 100
+
 # The schema to validate that a help file entry in the "help_files" key of the
 # help index is properly formattted.
 _help_file_schema = {
@@ -122,38 +125,68 @@ _index_schema = {
 }
 
 
+# The validators used to validate help indexes; one stops at the first error and
+# the other collects them all. Validators can be used by many threads at once.
+_index_validator = SchemaValidator()
+_all_errors_validator = SchemaValidator(fail_fast=False,
+                                        max_errors=_max_index_errors)
+
+
 ###----------------------------------------------------------------------------
 
 
-def validate_index(content, index_res):
+def validate_index(content, index_res, errors=None):
     """
     Given a raw JSON string that represents a help index for a package, perform
     validation on it to ensure that it's valid JSON and also that it conforms
     to the appropriate index file help schema.
 
+    Validation normally stops at the first problem. When a list is provided in
+    errors, all of the problems in the index (up to a limit) are collected in
+    one pass instead, and each is appended to the list as a tuple of the JSON
+    pointer to the offending value and a description of the problem.
+
     Return a decoded dict object on success or None on failure.
     """
     def validate_fail(message, *args):
-        log("Error validating index in '%s': %s", index_res, message % args)
+        log("Error validating index in '%s': " + message, index_res, *args,
+            level=LOG_ERROR)
+
+    def field_fail(error):
+        pointer = getattr(error, "pointer", "") or "/"
+        if errors is not None:
+            errors.append((pointer, str(error)))
+
+        validate_fail("at %s: %s", pointer, error)
 
     try:
-        log("Loading help index from '%s'", index_res)
-        raw_dict = sublime.decode_value(content)
-    except:
+        log("Loading help index from '%s'", index_res, level=LOG_DEBUG)
+        raw_dict = resource_provider().decode_value(content)
+    except ValueError:
         return validate_fail("Invalid JSON detected; unable to decode")
 
     try:
-        validate(raw_dict, _index_schema)
+        validator = _index_validator if errors is None else _all_errors_validator
+        validator.validate(raw_dict, _index_schema)
         return raw_dict
 
     # The schema provided is itself broken.
     except SchemaError as error:
         return validate_fail("Invalid schema detected: %s", error)
 
-    # One of the fields failed to validate. This generates extremely messy
-    # output, but this can be fixed later.
+    # Collecting all errors; they all go in the list but only the first few
+    # are displayed.
+    except MultipleValidationError as error:
+        with aggregate_log():
+            for field_error in error.errors:
+                field_fail(field_error)
+
+        if error.truncated:
+            validate_fail("stopped after finding %d problems", len(error.errors))
+
+    # One of the fields failed to validate.
     except ValidationError as error:
-        return validate_fail("in %s: %s", error.fieldname, error)
+        return field_fail(error)
 
     # Seems like validictory has a bug in which if you tell it to verify an
     # array has contents but the array is empty, it blows up. This can happen
@@ -0,0 +1,565 @@
+import os
+import sys
+import json
+import queue
+import subprocess
+from threading import Thread, Lock, Event
+
+from .common import log, hh_setting, load_resources, LOG_WARNING, LOG_ERROR
+from .help_index import _normalize_topic
+from .render import _render_help
+from .resources import resource_provider, set_resource_provider
+from .resources import SublimeResourceProvider, FileResourceProvider
+
+
+###----------------------------------------------------------------------------
+
+
+# If the indexer process exits unexpectedly this many times, it's not started
+# again and all indexing happens in process from then on.
+_max_crashes = 3
+
+# The most characters of the text that follows an anchor to keep as a snippet
+# of the section that the anchor introduces.
+_snippet_length = 160
+
+
+###----------------------------------------------------------------------------
+
+
+def _anchor_snippet(text, end):
+    """
+    Get a snippet of the section introduced by an anchor that ends at the given
+    position in the rendered text; this is the first paragraph after the line
+    the anchor is on, with its whitespace collapsed. Horizontal rules, such as
+    the ones under headings, are skipped.
+    """
+    line_end = text.find("\n", end)
+    if line_end < 0:
+        return ""
+
+    words = []
+    length = 0
+    for line in text[line_end + 1:line_end + 1 + 4 * _snippet_length].splitlines():
+        if not line.strip(" \t=-+|"):
+            if words and not line.strip():
+                break
+            continue
+
+        words.extend(line.split())
+        length += len(line)
+        if length >= _snippet_length:
+            break
+
+    snippet = " ".join(words)
+    if len(snippet) > _snippet_length:
+        snippet = snippet[:_snippet_length].rsplit(" ", 1)[0] + "..."
+
+    return snippet
+
+
+def _index_file(package, help_file, help_text, date_format):
+    """
+    Render the source of the given help file from the given package and return
+    back a shard of the index for it; a dictionary with the name of the file,
+    its anchors as [start, end, topic, snippet] lists and its links as [start,
+    end, package, topic, context] lists, where context is the line the link is
+    on and snippet is the start of the section that follows the anchor.
+    """
+    rendered = _render_help(help_file, help_text, date_format)
+    text = rendered.text
+
+    links = []
+    for start, end, pkg, topic in rendered.links:
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", end)
+        if line_end < 0:
+            line_end = len(text)
+
+        links.append([start, end, pkg or package, _normalize_topic(topic),
+                      text[line_start:line_end].strip()])
+
+    return {
+        "file": help_file,
+        "anchors": [[start, end, topic, _anchor_snippet(text, end)]
+                    for start, end, topic in rendered.anchors],
+        "links": links
+    }
+
+
+def _index_package(package, date_format, cancelled):
+    """
+    Index all of the help files in the given package description (a dictionary
+    with the package name, document root and list of help files), yielding a
+    shard for each one. This stops early if cancelled() returns True.
+    """
+    res_names = {"Packages/%s/%s" % (package["doc_root"], help_file): help_file
+                 for help_file in package["files"]}
+
+    for res_name, text in load_resources(list(res_names)):
+        if cancelled():
+            return
+
+        yield _index_file(package["package"], res_names[res_name], text,
+                          date_format)
+
+
+###----------------------------------------------------------------------------
+
+
+class _IndexJob():
+    """
+    A request to index the help files in a list of packages. The shards of the
+    index are collected per package as they arrive, and wait() blocks until
+    they have all arrived. If indexing fails, the reason is in error.
+    """
+    def __init__(self, job_id, packages, date_format):
+        self.id = job_id
+        self.packages = packages
+        self.date_format = date_format
+        self.shards = {}
+        self.cancelled = False
+        self.error = None
+        self.done = Event()
+
+    def message(self, files):
+        """
+        Get the message that asks the indexer process to run this job, reading
+        packages with the provided file resource provider.
+        """
+        return {
+            "id": self.id,
+            "packages": self.packages,
+            "date_format": self.date_format,
+            "packages_path": files.packages_path,
+            "archive_paths": files.archive_paths
+        }
+
+    def add_shard(self, package, shard):
+        self.shards.setdefault(package, []).append(shard)
+
+    def cancel(self):
+        """
+        Cancel this job; wait() returns None right away.
+        """
+        self.cancelled = True
+        _indexer.cancel(self)
+        self.done.set()
+
+    def fail(self, error):
+        """
+        Mark this job as having failed for the reason given; wait() returns
+        None right away.
+        """
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        """
+        Wait for the job to finish, returning a dictionary of the list of index
+        shards for each package, or None if the job was cancelled or failed.
+        """
+        self.done.wait()
+        if self.cancelled or self.error is not None:
+            return None
+
+        return self.shards
+
+
+def _index_in_process(job):
+    """
+    Run an index job in this process; this is used when there is no indexer
+    process to run it. The job is always finished, even if indexing fails.
+    """
+    try:
+        for package in job.packages:
+            for shard in _index_package(package, job.date_format,
+                                        lambda: job.cancelled):
+                job.add_shard(package["package"], shard)
+
+    except Exception as error:
+        job.error = "%s: %s" % (type(error).__name__, error)
+
+    finally:
+        job.done.set()
+
+
+class _Indexer():
+    """
+    Run index jobs in a separate Python process when one is configured, so that
+    indexing a large amount of help doesn't compete with the editor. Jobs are
+    sent to the process over a pipe, one JSON message per line, and the index
+    shards are streamed back the same way as each help file is indexed.
+
+    If the process can't be started or exits while jobs are running, the jobs
+    are sent to a new process; after too many failures, jobs are run in this
+    process instead.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.process = None
+        self.python = None
+        self.jobs = {}
+        self.next_id = 0
+        self.crashes = 0
+
+    def submit(self, packages, date_format, python):
+        """
+        Start a job that indexes the given list of package descriptions, using
+        the provided Python interpreter (if any) to run the indexer process.
+        """
+        with self.lock:
+            self.next_id += 1
+            job = _IndexJob(self.next_id, packages, date_format)
+
+        self.run(job, python)
+        return job
+
+    def run(self, job, python):
+        with self.lock:
+            if python and self.crashes < _max_crashes and self.send(job, python):
+                return
+
+        Thread(target=_index_in_process, args=(job, ), daemon=True).start()
+
+    def send(self, job, python):
+        """
+        Send the job to the indexer process, starting it first if needed; this
+        must be called with the lock held. Returns False if the job can't be
+        sent.
+        """
+        files = _file_provider()
+        if files is None:
+            return False
+
+        if self.process is None or self.python != python:
+            self.stop_process()
+            self.process = self.spawn(python)
+            self.python = python
+            if self.process is None:
+                self.crashes += 1
+                return False
+
+        self.jobs[job.id] = job
+        try:
+            self.write({"job": job.message(files)})
+        except OSError:
+            del self.jobs[job.id]
+            return False
+
+        return True
+
+    def spawn(self, python):
+        """
+        Start a new indexer process with the given interpreter, returning the
+        process or None if it could not be started.
+        """
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = package_root
+
+        startupinfo = None
+        if sys.platform.startswith("win"):
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        try:
+            process = subprocess.Popen(
+                [python, "-m", "hyperhelpcore.indexer"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, cwd=package_root, env=env,
+                startupinfo=startupinfo)
+        except (OSError, ValueError) as error:
+            return log("Unable to start the indexer process '%s': %s",
+                       python, error, level=LOG_ERROR)
+
+        Thread(target=self.read, args=(process, ), daemon=True).start()
+        return process
+
+    def write(self, message):
+        self.process.stdin.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+
+    def read(self, process):
+        """
+        Read the messages from the given indexer process until it exits,
+        adding the index shards to their jobs as they arrive.
+        """
+        for line in process.stdout:
+            try:
+                message = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+
+            finished = "done" in message or "error" in message
+            with self.lock:
+                job = self.jobs.get(message["id"], None)
+                if job is not None and finished:
+                    del self.jobs[job.id]
+
+            if job is None:
+                continue
+
+            if "error" in message:
+                job.fail(message["error"])
+            elif finished:
+                job.done.set()
+            else:
+                job.add_shard(message["package"], message["shard"])
+
+        process.wait()
+        with self.lock:
+            # The process was stopped on purpose.
+            if self.process is not process:
+                return
+
+            self.process = None
+            self.crashes += 1
+            pending = list(self.jobs.values())
+            self.jobs.clear()
+
+        log("The indexer process exited unexpectedly (code %s); restarting %d job(s)",
+            process.returncode, len(pending), level=LOG_WARNING)
+
+        for job in pending:
+            job.shards = {}
+            self.run(job, self.python)
+
+    def cancel(self, job):
+        with self.lock:
+            if self.jobs.pop(job.id, None) is not None:
+                try:
+                    self.write({"cancel": job.id})
+                except OSError:
+                    pass
+
+    def stop_process(self):
+        """
+        Stop the indexer process, if it's running; this must be called with
+        the lock held. Any jobs that it was running are cancelled.
+        """
+        process, self.process = self.process, None
+        if process is not None:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+        for job in self.jobs.values():
+            job.cancelled = True
+            job.done.set()
+
+        self.jobs.clear()
+
+    def shutdown(self):
+        with self.lock:
+            self.stop_process()
+
+
+_indexer = _Indexer()
+
+
+###----------------------------------------------------------------------------
+
+
+def _file_provider():
+    """
+    Get the file resource provider that an indexer process should use to read
+    the same packages as the current resource provider, or None if there isn't
+    one.
+    """
+    provider = resource_provider()
+    if isinstance(provider, SublimeResourceProvider):
+        return provider.file_provider()
+
+    if isinstance(provider, FileResourceProvider):
+        return provider
+
+    return None
+
+
+def _start_indexing(pkg_infos, date_format):
+    """
+    Start indexing all of the help files in the provided list of help packages,
+    returning the job. The indexer process is used if the "indexer_python"
+    setting names an interpreter to run it with; otherwise the files are
+    indexed in a background thread in this process.
+    """
+    packages = [{"package": pkg_info.package,
+                 "doc_root": pkg_info.doc_root,
+                 "files": list(pkg_info.help_files)}
+                for pkg_info in pkg_infos]
+
+    return _indexer.submit(packages, date_format, hh_setting("indexer_python"))
+
+
+class _IndexRequest():
+    """
+    A request for the index shards of a list of help packages, which may be
+    spread over several index jobs shared with other requests.
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.error = None
+
+    def wait(self):
+        """
+        Wait for all of the jobs to finish, returning a dictionary of the list
+        of index shards for each package, or None if any job was cancelled or
+        failed. A failure is logged by the first request that sees it.
+        """
+        shards = {}
+        for package, job in self.jobs:
+            result = job.wait()
+            if result is None:
+                self.error = job.error
+                if job.error is not None and _shared_index.report(job):
+                    log("Unable to index help: %s", job.error, level=LOG_ERROR)
+
+                return None
+
+            shards[package] = result.get(package, [])
+
+        return shards
+
+
+class _SharedIndex():
+    """
+    The index shards of the loaded help packages, shared by everything that's
+    built from them (the topic map and the link graph) so that each package is
+    only indexed once no matter how many of them need it. A package is indexed
+    again when its help index is reloaded, when the date format changes or when
+    the last attempt to index it was cancelled or failed.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.packages = {}
+        self.reported = set()
+
+    def request(self, pkg_infos, date_format):
+        with self.lock:
+            stale = []
+            for pkg_info in pkg_infos:
+                entry = self.packages.get(pkg_info.package, None)
+                if (entry is None or entry[0] is not pkg_info or
+                        entry[1] != date_format or self.unusable(entry[2])):
+                    stale.append(pkg_info)
+
+            if stale:
+                job = _start_indexing(stale, date_format)
+                for pkg_info in stale:
+                    self.packages[pkg_info.package] = (pkg_info, date_format, job)
+
+            return _IndexRequest([(pkg_info.package,
+                                   self.packages[pkg_info.package][2])
+                                  for pkg_info in pkg_infos])
+
+    def unusable(self, job):
+        return job.done.is_set() and (job.cancelled or job.error is not None)
+
+    def report(self, job):
+        """
+        Check if the failure of the given job still needs to be reported,
+        remembering that it has been.
+        """
+        with self.lock:
+            if job.id in self.reported:
+                return False
+
+            self.reported.add(job.id)
+            return True
+
+    def forget(self, packages):
+        with self.lock:
+            for package in packages:
+                self.packages.pop(package, None)
+
+
+_shared_index = _SharedIndex()
+
+
+def _index_shards(pkg_infos, date_format):
+    """
+    Get the index shards for all of the help files in the provided list of help
+    packages, as an _IndexRequest to wait on. Packages that were already
+    indexed (or are being indexed) for someone else are not indexed again.
+    """
+    return _shared_index.request(pkg_infos, date_format)
+
+
+def _forget_index_shards(packages):
+    """
+    Throw away the index shards of the given packages, such as when their help
+    indexes are unloaded.
+    """
+    _shared_index.forget(packages)
+
+
+def _shutdown_indexer():
+    """
+    Stop the indexer process, if it's running, cancelling any jobs in it.
+    """
+    _indexer.shutdown()
+
+
+###----------------------------------------------------------------------------
+
+
+def _worker_main():
+    """
+    The main loop of the indexer process; jobs are read from stdin and their
+    index shards are written to stdout, one JSON message per line.
+    """
+    output = sys.stdout.buffer
+    sys.stdout = sys.stderr
+
+    jobs = queue.Queue()
+    cancelled = set()
+
+    def read_commands():
+        for line in sys.stdin.buffer:
+            message = json.loads(line.decode("utf-8"))
+            if "cancel" in message:
+                cancelled.add(message["cancel"])
+            else:
+                jobs.put(message["job"])
+
+        jobs.put(None)
+
+    def send(message):
+        output.write(json.dumps(message).encode("utf-8") + b"\n")
+        output.flush()
+
+    Thread(target=read_commands, daemon=True).start()
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+
+        job_id = job["id"]
+        set_resource_provider(FileResourceProvider(job["packages_path"],
+                                                   job["archive_paths"]))
+
+        try:
+            for package in job["packages"]:
+                for shard in _index_package(package, job["date_format"],
+                                            lambda: job_id in cancelled):
+                    send({"id": job_id, "package": package["package"],
+                          "shard": shard})
+
+        except Exception as error:
+            send({"id": job_id,
+                  "error": "%s: %s" % (type(error).__name__, error)})
+            continue
+
+        if job_id not in cancelled:
+            send({"id": job_id, "done": True})
+
+
+if __name__ == "__main__":
+    _worker_main()
+
+
+###----------------------------------------------------------------------------
@@ -0,0 +1,209 @@
+import sublime
+
+from threading import Thread, Lock
+
+from .common import hh_setting
+from .core import help_index_list, help_index_snapshot
+from .core import lookup_help_topic, is_topic_file_valid
+from .data import LinkData
+from .indexer import _index_shards, _forget_index_shards
+
+
+###----------------------------------------------------------------------------
+
+
+class _LinkGraph():
+    """
+    The graph of links between all of the help files in all loaded help
+    packages. The links in a package are found by the indexer, which renders
+    every help file in it either in a separate process or a background thread;
+    the index is shared with the topic map, and a package is only indexed again
+    when its help index is reloaded.
+
+    Queries against the graph resolve the topic of every link against the
+    current help indexes; the result of that is cached until either the graph
+    or the help indexes change, so repeated queries are cheap.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.packages = {}
+        self.version = 0
+        self.building = False
+        self.waiting = []
+        self.resolved = None
+
+    def stale_packages(self, help_list):
+        """
+        Return back a list of the packages in the provided help list that
+        need to be added to the graph and a list of packages in the graph
+        that are no longer loaded.
+        """
+        with self.lock:
+            stale = [pkg_info for pkg, pkg_info in help_list.items()
+                     if self.packages.get(pkg, (None, ))[0] is not pkg_info]
+            removed = [pkg for pkg in self.packages if pkg not in help_list]
+
+        return stale, removed
+
+    def update(self, on_done):
+        """
+        Bring the graph up to date with the currently loaded help indexes and
+        then invoke the callback in the main thread. The callback is invoked
+        right away if the graph is already up to date.
+        """
+        help_list = help_index_list()
+        stale, removed = self.stale_packages(help_list)
+        if not stale and not removed:
+            return on_done()
+
+        _forget_index_shards(removed)
+
+        with self.lock:
+            self.waiting.append(on_done)
+            if self.building:
+                return
+
+            self.building = True
+
+        Thread(target=self._build, daemon=True,
+               args=(stale, removed, hh_setting("hyperhelp_date_format"))
+               ).start()
+
+    def _build(self, stale, removed, date_format):
+        packages = None
+        try:
+            shards = _index_shards(stale, date_format).wait()
+            if shards is not None:
+                packages = {pkg_info.package: (pkg_info, _package_links(
+                                pkg_info, shards.get(pkg_info.package, [])))
+                            for pkg_info in stale}
+
+        finally:
+            with self.lock:
+                if packages is not None:
+                    for pkg in removed:
+                        self.packages.pop(pkg, None)
+
+                    self.packages.update(packages)
+                    self.version += 1
+
+                self.building = False
+                waiting, self.waiting = self.waiting, []
+
+        # Indexing was cancelled because the indexer was shut down, or it
+        # failed; there's no graph to answer with.
+        if packages is None:
+            return
+
+        # The help indexes may have changed again while the graph was being
+        # built, so check again before answering.
+        for callback in waiting:
+            sublime.set_timeout(lambda c=callback: self.update(c))
+
+    def resolve(self):
+        """
+        Resolve all of the links in the graph against the currently loaded
+        help indexes, returning back a tuple of a dictionary that maps a
+        (package, topic) tuple to the links that point there, a dictionary
+        that maps a (package, file) tuple to the links that point there and a
+        list of all broken links.
+        """
+        snapshot = help_index_snapshot()
+        key = (self.version, snapshot.generation)
+        if self.resolved is not None and self.resolved[0] == key:
+            return self.resolved[1]
+
+        help_list = snapshot.indexes
+        by_topic = {}
+        by_file = {}
+        broken = []
+
+        with self.lock:
+            links = [link for pkg_info, pkg_links in self.packages.values()
+                          for link in pkg_links]
+
+        for link in links:
+            pkg_info = help_list.get(link.target_package, None)
+            topic = lookup_help_topic(pkg_info, link.topic)
+            if topic is None or is_topic_file_valid(pkg_info, topic) is False:
+                broken.append(link)
+                continue
+
+            target = (pkg_info.package, topic["topic"])
+            by_topic.setdefault(target, []).append(link)
+
+            target = (pkg_info.package, topic["file"])
+            by_file.setdefault(target, []).append(link)
+
+        result = (by_topic, by_file, broken)
+        self.resolved = (key, result)
+
+        return result
+
+
+_link_graph = _LinkGraph()
+
+
+###----------------------------------------------------------------------------
+
+
+def _package_links(pkg_info, shards):
+    """
+    Given the index shards for the help files in the provided help package,
+    return back a list of all of the links contained within them, in the order
+    that the help files appear in the package.
+    """
+    by_file = {shard["file"]: shard for shard in shards}
+
+    links = []
+    for help_file in pkg_info.help_files:
+        shard = by_file.get(help_file, None)
+        if shard is None:
+            continue
+
+        for start, end, pkg, topic, context in shard["links"]:
+            links.append(LinkData(pkg_info.package, help_file, (start, end),
+                                  pkg, topic, context))
+
+    return links
+
+
+def _links_to_topic(package, topic, on_done):
+    """
+    Find all of the links in all loaded help files that point to the given
+    topic in the given package, and invoke the callback in the main thread
+    with the list of them. When the topic is a help file, links to any of the
+    topics in that file are included.
+    """
+    def query():
+        by_topic, by_file, broken = _link_graph.resolve()
+
+        pkg_info = help_index_list().get(package, None)
+        topic_data = lookup_help_topic(pkg_info, topic)
+        if topic_data is None:
+            return on_done([])
+
+        # The topic for a help file is its case folded name.
+        if topic_data["topic"] == topic_data["file"].casefold():
+            on_done(by_file.get((package, topic_data["file"]), []))
+        else:
+            on_done(by_topic.get((package, topic_data["topic"]), []))
+
+    _link_graph.update(query)
+
+
+def _broken_links(package, on_done):
+    """
+    Find all of the broken links in the help files of the given package (or
+    all packages, if package is None) and invoke the callback in the main
+    thread with the list of them.
+    """
+    def query():
+        broken = _link_graph.resolve()[2]
+        on_done([link for link in broken
+                 if package is None or link.package == package])
+
+    _link_graph.update(query)
+
+
+###----------------------------------------------------------------------------
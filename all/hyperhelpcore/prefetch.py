@@ -0,0 +1,105 @@
+from collections import deque
+from threading import Thread, Lock
+
+from .common import load_resource
+from .help import _help_cache, _resource_for_help
+
+
+###----------------------------------------------------------------------------
+
+
+class _HelpPrefetcher():
+    """
+    Load help files into the help document cache in the background, so that
+    following a link to them later doesn't need to wait for the file to load.
+
+    At most max_workers threads are used to load files at any given time.
+    Scheduling a new set of files cancels any files from a prior schedule that
+    have not started loading yet, and the results of any that are in flight
+    are discarded.
+    """
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self.active = 0
+        self.generation = 0
+        self.queue = deque()
+        self.lock = Lock()
+
+    def schedule(self, resources):
+        """
+        Cancel any pending prefetch and start loading the list of help file
+        resources provided instead.
+        """
+        with self.lock:
+            self.generation += 1
+            self.queue.clear()
+            self.queue.extend(res for res in resources if res not in _help_cache)
+
+            spawn = min(self.max_workers - self.active, len(self.queue))
+            self.active += spawn
+
+        for _ in range(spawn):
+            Thread(target=self._worker, daemon=True).start()
+
+    def cancel(self):
+        """
+        Cancel all pending prefetch operations.
+        """
+        with self.lock:
+            self.generation += 1
+            self.queue.clear()
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                if not self.queue:
+                    self.active -= 1
+                    return
+
+                generation = self.generation
+                res_name = self.queue.popleft()
+
+            if res_name in _help_cache:
+                continue
+
+            stamp = _help_cache.stamp(res_name)
+            text = load_resource(res_name)
+
+            # Only keep the result if no cancel happened while it was loading.
+            with self.lock:
+                if text is None or generation != self.generation:
+                    continue
+
+            _help_cache.store(res_name, text, stamp)
+
+
+_prefetcher = _HelpPrefetcher()
+
+
+###----------------------------------------------------------------------------
+
+
+def _prefetch_help_files(file_list):
+    """
+    Given a list of (pkg_info, help_file) tuples, start loading those help
+    files into the help document cache in the background. This cancels any
+    prefetch that is already in progress.
+    """
+    resources = []
+    for pkg_info, help_file in file_list:
+        res_name = _resource_for_help(pkg_info, help_file)
+        if res_name not in resources:
+            resources.append(res_name)
+
+    _prefetcher.schedule(resources)
+
+
+def _cancel_prefetch():
+    """
+    Cancel any background loading of help files that is in progress; files
+    that have already been loaded remain in the help document cache.
+    """
+    _prefetcher.cancel()
+
+
+###----------------------------------------------------------------------------
@@ -0,0 +1,450 @@
+import re
+import io
+import time
+import pickle
+from difflib import SequenceMatcher
+from itertools import chain
+
+from .common import log, LOG_WARNING
+from .data import HeaderData, RenderedHelp
+from .help_index import _source_hash, _IndexUnpickler
+
+
+###----------------------------------------------------------------------------
+
+
+_header_prefix_re = re.compile(r'^%hyperhelp(\b|$)')
+_header_keypair_re = re.compile(r'\b([a-z]+)\b="([^"]*)"')
+
+# The first line of a help file whose header has already been expanded; the
+# file name at the start of the line is an anchor.
+_help_header_re = re.compile(r'^(\*)([^*\|]+)(\*)\s+(.*?)\s{2,}(.*)')
+
+# The constructs in the body of a help file that are interesting when it is
+# rendered. This mirrors the body context of the help syntax, with the
+# alternatives in the same order as the contexts are included there, so that
+# the leftmost match (ties broken by order) is the same one the syntax finds.
+_body_re = re.compile(
+    r'(?P<comment><\*\*)'
+    r'|(?P<keybind><(?=[>\w?]))'
+    r'|(?P<fence>^[ \t]*`{3}(?![^`\n]*`).*\n?)'
+    r'|(?P<code>`)'
+    r'|(?P<link>\|(?=[\w:$]))'
+    r'|(?P<anchor>\*(?=[\w:$]))'
+    r'|(?P<hidden>\*\|(?=[\w:$]))'
+    r'|(?P<heading>^[ \t]*#+(?!#)[ \t]*(?=\S))'
+    r'|(?P<separator>[+|]?(?P<rule>[=-])(?P=rule){3,}[+|]?|\|)',
+    re.MULTILINE)
+
+# The patterns that terminate each of the constructs above.
+_body_end_re = {
+    "comment": re.compile(r'\*\*>\n?'),
+    "keybind": re.compile(r'>(?=[^>])'),
+    "fence":   re.compile(r'^[ \t]*`{3}[ \t]*$', re.MULTILINE),
+    "code":    re.compile(r'`'),
+    "link":    re.compile(r'\|'),
+    "anchor":  re.compile(r'\*'),
+    "hidden":  re.compile(r'\|\*'),
+    "heading": re.compile(r'[ ]*#*[ ]*$', re.MULTILINE),
+    "separator": re.compile(r'')
+}
+
+# The width of the expanded header line in a rendered help file.
+_header_width = 80
+
+# A help file can be pre-rendered into a sidecar that is stored alongside of it
+# with this suffix. Sidecars start with the magic value (which carries the
+# version of the format) and the hash of the source of the help file, followed
+# by the pickled rendered text, anchors and links.
+_sidecar_suffix = ".rendered"
+_sidecar_magic = b"HHRND\x02\n"
+
+
+###----------------------------------------------------------------------------
+
+
+def _parse_help_header(help_file, header_line):
+    """
+    Given the first line of a help file, check to see if it looks like a help
+    source file, and if so parse the header and return the parsed values back.
+    """
+    if not _header_prefix_re.match(header_line):
+        return None
+
+    title = "No Title Provided"
+    date = 0.0
+
+    for match in re.findall(_header_keypair_re, header_line):
+        if match[0] == "title":
+            title = match[1]
+        elif match[0] == "date":
+            try:
+                date = time.mktime(time.strptime(match[1], "%Y-%m-%d"))
+            except Exception as e:
+                date = 0.0
+                log("Ignoring invalid file date '%s' in '%s': %s",
+                    match[1], help_file, e, level=LOG_WARNING)
+        else:
+            log("Ignoring unknown header key '%s' in '%s'",
+                match[0], help_file, level=LOG_WARNING)
+
+    return HeaderData(help_file, title, date)
+
+
+def _format_help_header(help_file, header, date_format):
+    """
+    Given a parsed help header, return back the fully expanded user-facing
+    header lines that replace the source header line in the rendered file.
+    """
+    file_target = "*%s*" % help_file
+    title = header.title
+    date_str = "Not Available"
+
+    if header.date != 0:
+        date_str = time.strftime(date_format, time.localtime(header.date))
+
+    # Take into account two extra spaces on either side of the title
+    max_title_len = _header_width - len(file_target) - len(date_str) - 4
+    if len(title) > max_title_len:
+        title = title[:max_title_len-1] + '\u2026'
+
+    return "%s  %s  %s\n%s\n" % (
+        file_target,
+        "%s" % title.center(max_title_len, " "),
+        date_str,
+        ("=" * _header_width)
+    )
+
+
+def _parse_anchor_body(anchor_body):
+    """
+    Given the body of an anchor, parse it to determine what topic ID it's
+    anchored to and what text the anchor uses in the source help file.
+
+    This always returns a 2-tuple, though based on the anchor body in the file
+    it may end up thinking that the topic ID and the text are identical.
+    """
+    c_pos = anchor_body.find(':')
+    if c_pos >= 0:
+        id_val = anchor_body[:c_pos]
+        anchor_body = anchor_body[c_pos+1:]
+
+        id_val = id_val or anchor_body
+    else:
+        id_val = anchor_body
+
+    return (id_val.casefold().rstrip(), anchor_body.strip())
+
+
+def _parse_link_body(link_body):
+    """
+    Given the body of a link, parse it to determine what package and topic ID
+    the link will navigate to as well as what the visual link text should be.
+
+    This always returns a 3-tuple, though the value of the link text will be
+    None if the parse failed. It's possible for the package to be None, in
+    which case you can infer what the default package should be.
+    """
+    parts = link_body.split(':')
+    if len(parts) == 1:
+        return None, link_body.rstrip(), link_body.rstrip()
+
+    if len(parts) >= 3:
+        pkg = parts[0]
+        topic = parts[1]
+        text = ":".join(parts[2:])
+    else:
+        return (None, None, None)
+
+    pkg = pkg or None
+    topic = topic or text
+    return (pkg, topic.strip(), text.strip())
+
+
+###----------------------------------------------------------------------------
+
+
+def _scan_body(help_text, pos=0):
+    """
+    Scan the body of a help file starting at the given position, yielding a
+    tuple for each construct found that gives its kind, the span of the whole
+    construct and the span of its content.
+    """
+    while True:
+        match = _body_re.search(help_text, pos)
+        if match is None:
+            return
+
+        kind = match.lastgroup
+        content_start = match.end()
+
+        end_match = _body_end_re[kind].search(help_text, content_start)
+        if end_match is None:
+            content_end = end = len(help_text)
+        else:
+            content_end, end = end_match.start(), end_match.end()
+
+        yield kind, match.start(), end, content_start, content_end
+
+        pos = end
+
+
+def _strip_comments(help_text, pos=0):
+    """
+    Remove all comments from the given help text that appear at or after the
+    position provided, returning the new text.
+    """
+    pieces = []
+    last = 0
+    for kind, start, end, _, _ in _scan_body(help_text, pos):
+        if kind == "comment":
+            pieces.append(help_text[last:start])
+            last = end
+
+    pieces.append(help_text[last:])
+    return "".join(pieces)
+
+
+def _split_help_header(help_file, help_text):
+    """
+    Split the source header line from the provided help file source, returning
+    a tuple of the parsed header and the remaining text. If the file does not
+    have a source header, the header is None and the text is returned as is.
+    """
+    first_line = help_text[:help_text.find("\n") + 1] or help_text
+    header = _parse_help_header(help_file, first_line)
+    if header is None:
+        return None, help_text
+
+    return header, help_text[len(first_line):]
+
+
+def _render_help_body(help_text, header_anchor=True):
+    """
+    Render the provided help text, which should not have a source header,
+    returning a tuple of the rendered text, the anchors and the links; see
+    _render_help() for the details.
+
+    When header_anchor is True, an expanded help header on the first line of
+    the text is recognized and its file name anchor included.
+    """
+    help_text = _strip_comments(help_text)
+
+    pieces = []
+    anchors = []
+    links = []
+
+    # Track the number of characters consumed from the source and generated
+    # into the rendered output so far.
+    last = 0
+    size = 0
+
+    def emit(text):
+        nonlocal size
+        pieces.append(text)
+        size += len(text)
+
+    def copy_to(pos):
+        nonlocal last
+        emit(help_text[last:pos])
+        last = pos
+
+    tokens = []
+    match = _help_header_re.match(help_text) if header_anchor else None
+    if match is not None:
+        tokens.append(("anchor", 0, match.end(3), match.start(2), match.end(2)))
+
+    pos = match.end() if match is not None else 0
+    for kind, start, end, c_start, c_end in chain(tokens,
+                                                  _scan_body(help_text, pos)):
+        body = help_text[c_start:c_end]
+
+        if kind == "link":
+            pkg, topic, text = _parse_link_body(body)
+            if text is None:
+                topic = "_broken"
+                text = body
+
+            copy_to(c_start)
+            links.append((size, size + len(text), pkg, topic))
+            emit(text)
+            last = c_end
+
+        elif kind in ("anchor", "hidden", "heading"):
+            topic, text = _parse_anchor_body(body)
+
+            if kind == "hidden":
+                copy_to(start)
+            else:
+                copy_to(c_start)
+
+            anchors.append((size, size + len(text), topic))
+            emit(text)
+            last = end if kind == "hidden" else c_end
+
+    copy_to(len(help_text))
+    return "".join(pieces), anchors, links
+
+
+def _render_help(help_file, help_text, date_format="%x"):
+    """
+    Render the source of the given help file into the form that it takes when
+    it is displayed in a help view, the same way that the post processing of
+    a help view does.
+
+    The return value is a RenderedHelp tuple; anchors are (start, end, topic)
+    tuples and links are (start, end, package, topic) tuples, where the
+    package is None if the link is to the package containing the file.
+    """
+    header, help_text = _split_help_header(help_file, help_text)
+    if header is not None:
+        help_text = _format_help_header(help_file, header, date_format) + help_text
+
+    text, anchors, links = _render_help_body(help_text)
+    return RenderedHelp(text, anchors, links, header)
+
+
+###----------------------------------------------------------------------------
+
+
+def _sidecar_resource(res_name):
+    """
+    Get the resource name of the pre-rendered sidecar for the help file with
+    the given resource name.
+    """
+    return res_name + _sidecar_suffix
+
+
+def _encode_sidecar(help_file, help_text):
+    """
+    Pre-render the source of the given help file, returning back the binary
+    content of the sidecar that holds it.
+
+    The header of the file is not rendered, since its appearance depends on
+    the settings in use when it's displayed; the title and date are stored
+    instead.
+    """
+    header, body = _split_help_header(help_file, help_text)
+    text, anchors, links = _render_help_body(body, header is None)
+
+    payload = {
+        "header": None if header is None else (header.title, header.date),
+        "text": text,
+        "anchors": anchors,
+        "links": links
+    }
+
+    return (_sidecar_magic + _source_hash(help_text) +
+            pickle.dumps(payload, protocol=3))
+
+
+def _decode_sidecar(help_file, data, help_text, date_format="%x"):
+    """
+    Given the binary content of the sidecar for the given help file and the
+    source of the help file, return back a RenderedHelp tuple for the help file
+    as it would be returned by _render_help().
+
+    The return value is None if the sidecar is not valid or was not rendered
+    from the source provided.
+    """
+    if not data.startswith(_sidecar_magic):
+        return log("Ignoring unknown sidecar format for '%s'", help_file,
+                   level=LOG_WARNING)
+
+    offset = len(_sidecar_magic)
+    digest = _source_hash(help_text)
+    if data[offset:offset + len(digest)] != digest:
+        return log("Ignoring stale sidecar for '%s'", help_file,
+                   level=LOG_WARNING)
+
+    try:
+        payload = _IndexUnpickler(io.BytesIO(data[offset + len(digest):])).load()
+        header = payload["header"]
+        text = payload["text"]
+        anchors = payload["anchors"]
+        links = payload["links"]
+    except Exception as err:
+        return log("Ignoring invalid sidecar for '%s': %s", help_file, err,
+                   level=LOG_WARNING)
+
+    if header is None:
+        return RenderedHelp(text, anchors, links, None)
+
+    # Expand the header and shift everything else to follow it; the file name
+    # in the header is an anchor.
+    header = HeaderData(help_file, header[0], header[1])
+    header_text = _format_help_header(help_file, header, date_format)
+    shift = len(header_text)
+
+    anchors = ([(1, 1 + len(help_file), _parse_anchor_body(help_file)[0])] +
+               [(a + shift, b + shift, topic) for a, b, topic in anchors])
+    links = [(a + shift, b + shift, pkg, topic) for a, b, pkg, topic in links]
+
+    return RenderedHelp(header_text + text, anchors, links, header)
+
+
+def _split_sections(text, bounds):
+    """
+    Split rendered help text into sections at the provided offsets (typically
+    the start of each anchor), returning a list of (offset, text) tuples.
+    """
+    sections = []
+    last = 0
+    for pos in chain(sorted(bounds), [len(text)]):
+        if pos > last:
+            sections.append((last, text[last:pos]))
+            last = pos
+
+    return sections
+
+
+def _diff_rendered(old_text, old_bounds, new_text, new_bounds):
+    """
+    Compare two versions of a rendered help file and return back a list of the
+    edits that turn the old text into the new text, as (start, end, text)
+    tuples in ascending order; start and end are offsets in the old text.
+
+    The texts are compared section by section (sections start at the offsets
+    in the bounds lists, usually the anchors), so that unchanged sections are
+    skipped quickly. Within sections that changed, the edit covers only the
+    text between the first and last characters that differ.
+    """
+    old_sections = _split_sections(old_text, old_bounds)
+    new_sections = _split_sections(new_text, new_bounds)
+
+    matcher = SequenceMatcher(None, [text for pos, text in old_sections],
+                                    [text for pos, text in new_sections],
+                                    autojunk=False)
+
+    def span(sections, text, lo, hi):
+        start = sections[lo][0] if lo < len(sections) else len(text)
+        end = sections[hi][0] if hi < len(sections) else len(text)
+        return start, end
+
+    edits = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+
+        old_start, old_end = span(old_sections, old_text, i1, i2)
+        new_start, new_end = span(new_sections, new_text, j1, j2)
+
+        # Trim away the text that both sides have in common at either end.
+        limit = min(old_end - old_start, new_end - new_start)
+        prefix = 0
+        while (prefix < limit and
+                old_text[old_start + prefix] == new_text[new_start + prefix]):
+            prefix += 1
+
+        suffix = 0
+        while (suffix < limit - prefix and
+                old_text[old_end - suffix - 1] == new_text[new_end - suffix - 1]):
+            suffix += 1
+
+        edits.append((old_start + prefix, old_end - suffix,
+                      new_text[new_start + prefix:new_end - suffix]))
+
+    return edits
+
+
+###----------------------------------------------------------------------------
@@ -0,0 +1,411 @@
+import os
+import re
+import json
+import mmap
+import zlib
+import struct
+import fnmatch
+import zipfile
+
+# Inside packages, paths are always posix regardless of the platform in use.
+import posixpath
+
+
+###----------------------------------------------------------------------------
+
+
+# Sublime allows comments and trailing commas in its JSON files; these match
+# them (along with string literals, so that their contents are left alone) so
+# that they can be removed before the text is decoded as regular JSON.
+_json_string = r'("(?:[^"\\\n]|\\.)*")'
+_json_comment_re = re.compile(_json_string + r'|//[^\n]*|/\*.*?\*/', re.DOTALL)
+_json_trailing_comma_re = re.compile(_json_string + r'|,(\s*[\]}])')
+
+# The extension of packed packages.
+_package_ext = ".sublime-package"
+
+# The fixed size part of the local header of a file in a zip archive; the
+# lengths of the file name and extra field that follow are at the end of it.
+_zip_local_header = struct.Struct("<4s5H3L2H")
+
+
+###----------------------------------------------------------------------------
+
+
+def _decode_json(text):
+    """
+    Decode the provided JSON text the way that Sublime does, allowing for both
+    line and block comments as well as trailing commas in lists and objects.
+
+    Raises ValueError if the text is not valid.
+    """
+    def strip_comment(match):
+        return match.group(1) if match.group(1) is not None else " "
+
+    def strip_comma(match):
+        return match.group(1) if match.group(1) is not None else match.group(2)
+
+    text = _json_comment_re.sub(strip_comment, text)
+    text = _json_trailing_comma_re.sub(strip_comma, text)
+
+    return json.loads(text)
+
+
+###----------------------------------------------------------------------------
+
+
+class ResourceProvider():
+    """
+    The interface that the parts of hyperhelpcore that don't depend on Sublime
+    use to find and load package resources. Resources are named the way that
+    Sublime names them, e.g. "Packages/HyperHelp/help/index.txt".
+    """
+    def find_resources(self, pattern):
+        """
+        Return back a list of the names of all resources whose file name
+        matches the provided pattern, which can contain shell wildcards.
+        """
+        raise NotImplementedError()
+
+    def load_binary_resource(self, res_name):
+        """
+        Return back the binary content of the resource with the given name,
+        raising OSError if there is no such resource.
+        """
+        raise NotImplementedError()
+
+    def load_binary_resources(self, res_names):
+        """
+        Load the binary content of all of the resources in the provided list,
+        yielding a (res_name, data) tuple for each one that can be loaded, in
+        no particular order. The data is a bytes-like object.
+        """
+        for res_name in res_names:
+            try:
+                yield res_name, self.load_binary_resource(res_name)
+            except OSError:
+                continue
+
+    def resource_mtime(self, res_name):
+        """
+        Return back the modification time of the file that provides the
+        resource with the given name (the file itself, or the archive of a
+        packed package), or None if it can't be determined.
+        """
+        return None
+
+    def decode_value(self, text):
+        """
+        Decode the provided JSON text, raising ValueError if it's not valid.
+        """
+        return _decode_json(text)
+
+
+class SublimeResourceProvider(ResourceProvider):
+    """
+    A resource provider that uses the Sublime plugin API. Resources that
+    Sublime doesn't know about are also loaded from the packages folder if they
+    exist there, since Sublime only rescans packages periodically.
+    """
+    def __init__(self):
+        import sublime
+        self.sublime = sublime
+        self.files = None
+
+    def file_provider(self):
+        """
+        Get a file resource provider that reads the same packages that Sublime
+        does, directly from disk.
+        """
+        if self.files is None:
+            shipped = os.path.join(
+                os.path.dirname(self.sublime.executable_path()), "Packages")
+            self.files = FileResourceProvider(
+                self.sublime.packages_path(),
+                [shipped, self.sublime.installed_packages_path()])
+
+        return self.files
+
+    def find_resources(self, pattern):
+        return self.sublime.find_resources(pattern)
+
+    def load_binary_resource(self, res_name):
+        try:
+            return self.sublime.load_binary_resource(res_name)
+        except OSError:
+            pass
+
+        spp = os.path.split(self.sublime.packages_path())[0]
+        with open(os.path.join(spp, res_name), "rb") as file:
+            return file.read()
+
+    def load_binary_resources(self, res_names):
+        # Going through the plugin API for every file is slow when there are
+        # many; read the packages directly instead.
+        return self.file_provider().load_binary_resources(res_names)
+
+    def resource_mtime(self, res_name):
+        return self.file_provider().resource_mtime(res_name)
+
+    def decode_value(self, text):
+        return self.sublime.decode_value(text)
+
+
+class FileResourceProvider(ResourceProvider):
+    """
+    A resource provider that reads packages directly from disk, for use where
+    the Sublime plugin API is not available.
+
+    packages_path is the folder that holds unpacked packages. archive_paths is
+    a list of folders that hold packed packages, from lowest to highest
+    precedence (e.g. the packages shipped with Sublime followed by the
+    "Installed Packages" folder).
+
+    Precedence follows Sublime: a packed package replaces a packed package with
+    the same name from a folder earlier in the list, and files in an unpacked
+    package override the same files in the packed package of that name.
+    """
+    def __init__(self, packages_path, archive_paths=()):
+        self.packages_path = packages_path
+        self.archive_paths = list(archive_paths)
+        self.resources = None
+
+    def refresh(self):
+        """
+        Throw away the list of known resources, so that the next access scans
+        the packages again.
+        """
+        self.resources = None
+
+    def archives(self):
+        """
+        Return back a dictionary that maps the name of every packed package to
+        the path of the archive that provides it.
+        """
+        archives = {}
+        for folder in self.archive_paths:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+
+            for name in names:
+                if name.endswith(_package_ext):
+                    archives[name[:-len(_package_ext)]] = os.path.join(folder, name)
+
+        return archives
+
+    def scan_package(self, pkg, archive):
+        """
+        Return back a dictionary that maps the name of every resource in the
+        given package to where it comes from; this is either a (path, None)
+        tuple for a file on disk or an (archive path, member name) tuple for a
+        file in the given archive, which may be None.
+        """
+        resources = {}
+        if archive is not None:
+            try:
+                with zipfile.ZipFile(archive) as zip_file:
+                    members = zip_file.namelist()
+            except (OSError, zipfile.BadZipfile):
+                members = []
+
+            for member in members:
+                if not member.endswith("/"):
+                    res_name = posixpath.join("Packages", pkg, member)
+                    resources[res_name] = (archive, member)
+
+        root = os.path.join(self.packages_path, pkg)
+        for folder, dirs, files in os.walk(root):
+            rel = os.path.relpath(folder, root).replace(os.sep, "/")
+            prefix = posixpath.normpath(posixpath.join("Packages", pkg, rel))
+            for name in files:
+                resources[posixpath.join(prefix, name)] = (
+                    os.path.join(folder, name), None)
+
+        return resources
+
+    def scan(self):
+        """
+        Return back a dictionary that maps the name of every resource in every
+        package to where it comes from, as in scan_package().
+        """
+        if self.resources is not None:
+            return self.resources
+
+        archives = self.archives()
+        try:
+            unpacked = [name for name in os.listdir(self.packages_path)
+                        if os.path.isdir(os.path.join(self.packages_path, name))]
+        except OSError:
+            unpacked = []
+
+        resources = {}
+        for pkg in set(archives) | set(unpacked):
+            resources.update(self.scan_package(pkg, archives.get(pkg, None)))
+
+        self.resources = resources
+        return resources
+
+    def find_resources(self, pattern):
+        return sorted(res_name for res_name in self.scan()
+                      if fnmatch.fnmatchcase(posixpath.basename(res_name), pattern))
+
+    def load_binary_resource(self, res_name):
+        location = self.scan().get(res_name, None)
+        if location is None:
+            raise OSError("resource not found: %s" % res_name)
+
+        file_name, member = location
+        if member is None:
+            with open(file_name, "rb") as file:
+                return file.read()
+
+        try:
+            with zipfile.ZipFile(file_name) as zip_file:
+                return zip_file.read(member)
+        except (KeyError, zipfile.BadZipfile) as error:
+            raise OSError("unable to load %s: %s" % (res_name, error))
+
+    def resource_mtime(self, res_name):
+        parts = res_name.split("/", 2)
+        if len(parts) != 3 or parts[0] != "Packages":
+            return None
+
+        # Unpacked files override packed ones, and later archive folders
+        # override earlier ones.
+        candidates = [os.path.join(self.packages_path, parts[1],
+                                   *parts[2].split("/"))]
+        candidates.extend(os.path.join(folder, parts[1] + _package_ext)
+                          for folder in reversed(self.archive_paths))
+
+        for file_name in candidates:
+            try:
+                return os.stat(file_name).st_mtime
+            except OSError:
+                continue
+
+        return None
+
+    def load_binary_resources(self, res_names):
+        """
+        Load the resources in one pass over the packages that contain them;
+        each package is scanned once (so the result is always current) and each
+        archive is opened only once, with files that are stored uncompressed
+        returned as views into the memory mapped archive.
+        """
+        by_package = {}
+        for res_name in res_names:
+            parts = res_name.split("/", 2)
+            if len(parts) == 3 and parts[0] == "Packages":
+                by_package.setdefault(parts[1], []).append(res_name)
+
+        archives = self.archives()
+        for pkg, names in by_package.items():
+            resources = self.scan_package(pkg, archives.get(pkg, None))
+
+            members = []
+            for res_name in names:
+                file_name, member = resources.get(res_name, (None, None))
+                if member is not None:
+                    members.append((res_name, member))
+                elif file_name is not None:
+                    try:
+                        with open(file_name, "rb") as file:
+                            yield res_name, file.read()
+                    except OSError:
+                        continue
+
+            if members:
+                for item in _read_archive(archives[pkg], members):
+                    yield item
+
+
+###----------------------------------------------------------------------------
+
+
+def _read_archive(archive, members):
+    """
+    Read the given members from a package archive, yielding a tuple of the
+    resource name and the data of each one that can be read; members is a list
+    of (res_name, member name) tuples.
+
+    The archive is memory mapped; the data of members that are stored without
+    compression is a memoryview into the mapping rather than a copy, and the
+    mapping stays alive for as long as any of those views do.
+    """
+    try:
+        with open(archive, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return
+
+    try:
+        zip_file = zipfile.ZipFile(mapped)
+    except zipfile.BadZipfile:
+        mapped.close()
+        return
+
+    view = memoryview(mapped)
+    try:
+        for res_name, member in members:
+            try:
+                info = zip_file.getinfo(member)
+            except KeyError:
+                continue
+
+            # Encrypted files and unusual compression are left to zipfile.
+            if (info.flag_bits & 0x1 or info.compress_type not in
+                    (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)):
+                yield res_name, zip_file.read(member)
+                continue
+
+            offset = info.header_offset
+            header = _zip_local_header.unpack_from(mapped, offset)
+            start = offset + _zip_local_header.size + header[-2] + header[-1]
+            data = view[start:start + info.compress_size]
+
+            if info.compress_type == zipfile.ZIP_DEFLATED:
+                data = zlib.decompress(data, -zlib.MAX_WBITS)
+
+            yield res_name, data
+    finally:
+        zip_file.close()
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # Some of the data is still in use; the mapping is closed when the
+            # last view into it goes away.
+            pass
+
+
+###----------------------------------------------------------------------------
+
+
+_provider = None
+
+
+def resource_provider():
+    """
+    Get the resource provider in use; unless one has been set, this uses the
+    Sublime plugin API.
+    """
+    global _provider
+    if _provider is None:
+        _provider = SublimeResourceProvider()
+
+    return _provider
+
+
+def set_resource_provider(provider):
+    """
+    Set the resource provider used to find and load package resources, which
+    allows help indexes and help files to be processed outside of Sublime.
+    Passing None goes back to the Sublime plugin API.
+    """
+    global _provider
+    _provider = provider
+
+
+###----------------------------------------------------------------------------
@@ -0,0 +1,198 @@
+from .data import HistoryData
+
+
+###----------------------------------------------------------------------------
+
+
+# The per-view state of all help views, keyed by view id. This holds the bulky
+# data structures that track the links, anchors and history of a help view so
+# that looking them up doesn't need to copy them out of the view settings.
+#
+# A compact copy of the state is also persisted into the view settings, so that
+# it can be recovered for help views restored from a session. The links are only
+# copied once the help file is fully displayed, rather than for every chunk of a
+# file that's displayed progressively.
+# The anchor navigation information is not copied; the settings only hold a
+# token that says that the view had some, so that views restored from a
+# session know to rebuild it.
+_view_state = dict()
+
+# The last token stored in the settings of a help view when its anchor
+# navigation information changes.
+_nav_token = 0
+
+
+###----------------------------------------------------------------------------
+
+
+class _HelpViewState():
+    """
+    The state of a single help view; the links in the current file (a list of
+    dicts with the package and topic of each link), the anchor navigation
+    information (a dict from topic to anchor index) and the history.
+
+    The anchor navigation information is None in a view restored from a session
+    until it's rebuilt from the help file being displayed.
+
+    The link targets (a dict from package to the indexes of the links that
+    target it) are derived from the links on demand. The anchor outline (a list
+    of AnchorData sorted by position, along with the list of their positions)
+    is thrown away whenever the anchors change.
+    """
+    __slots__ = ("links", "nav", "hist", "targets", "outline")
+
+    def __init__(self, links, nav, hist):
+        self.links = links
+        self.nav = nav
+        self.hist = hist
+        self.targets = None
+        self.outline = None
+
+
+def _state_for(view):
+    """
+    Get the state object for the provided help view, recovering it from the
+    compact copy in the view settings if this view has not been seen before.
+    """
+    state = _view_state.get(view.id(), None)
+    if state is None:
+        settings = view.settings()
+
+        links = [link if isinstance(link, dict) else
+                     {"pkg": link[0], "topic": link[1]}
+                 for link in settings.get("_hh_links", [])]
+        hist = [HistoryData._make(entry)
+                for entry in settings.get("_hh_hist", [])]
+
+        # Older versions stored the whole navigation dictionary here.
+        nav = settings.get("_hh_nav", None)
+        if not isinstance(nav, dict):
+            nav = {} if nav is None else None
+
+        state = _HelpViewState(links, nav, hist)
+        _view_state[view.id()] = state
+
+    return state
+
+
+###----------------------------------------------------------------------------
+
+
+def _get_help_links(view):
+    """
+    Get the list of link information for the file displayed in the given help
+    view; each entry is a dictionary with the package and topic of the link.
+    """
+    return _state_for(view).links
+
+
+def _set_help_links(view, links):
+    """
+    Set the list of link information for the file displayed in the given help
+    view. This only updates the side table; _save_help_links() persists the
+    links into the view settings.
+    """
+    state = _state_for(view)
+    state.links = links
+    state.targets = None
+
+
+def _save_help_links(view):
+    """
+    Persist the list of link information for the file displayed in the given
+    help view into the view settings, so that it can be recovered if the view
+    is restored from a session. This should be called once the file is fully
+    displayed.
+    """
+    view.settings().set("_hh_links", [[link["pkg"], link["topic"]]
+                                      for link in _state_for(view).links])
+
+
+def _get_link_targets(view):
+    """
+    Get the dictionary that associates the packages that the links in the file
+    displayed in the given help view point to with the list of the indexes of
+    the links that point there.
+    """
+    state = _state_for(view)
+    if state.targets is None:
+        state.targets = dict()
+        for idx, link in enumerate(state.links):
+            state.targets.setdefault(link["pkg"], []).append(idx)
+
+    return state.targets
+
+
+def _get_help_nav(view):
+    """
+    Get the dictionary that associates topics in the file displayed in the
+    given help view with the index of the anchor for that topic. This is empty
+    if the information was lost when the view was restored from a session.
+    """
+    return _state_for(view).nav or {}
+
+
+def _help_nav_lost(view):
+    """
+    Check if the anchor navigation information for the given help view was lost
+    because the view was restored from a session and needs to be rebuilt.
+    """
+    return _state_for(view).nav is None
+
+
+def _set_help_nav(view, nav):
+    """
+    Set the dictionary that associates topics in the file displayed in the
+    given help view with the index of the anchor for that topic.
+    """
+    global _nav_token
+
+    state = _state_for(view)
+    state.nav = nav
+    state.outline = None
+
+    _nav_token += 1
+    view.settings().set("_hh_nav", _nav_token)
+
+
+def _get_anchor_outline(view):
+    """
+    Get the anchor outline for the file displayed in the given help view; this
+    is a tuple of a list of AnchorData sorted by position and a list of the
+    start positions of those anchors. None is returned if the outline has not
+    been built since the anchors last changed.
+    """
+    return _state_for(view).outline
+
+
+def _set_anchor_outline(view, outline):
+    """
+    Set the anchor outline for the file displayed in the given help view.
+    """
+    _state_for(view).outline = outline
+
+
+def _get_help_history(view):
+    """
+    Get the list of history entries for the given help view.
+    """
+    return _state_for(view).hist
+
+
+def _set_help_history(view, hist_info):
+    """
+    Set the list of history entries for the given help view.
+    """
+    _state_for(view).hist = [HistoryData._make(entry) for entry in hist_info]
+    view.settings().set("_hh_hist", hist_info)
+
+
+def _discard_view_state(view):
+    """
+    Throw away the state being tracked for the provided view, if any. This
+    should be called when a help view is closed.
+    """
+    _view_state.pop(view.id(), None)
+
+
+###----------------------------------------------------------------------------
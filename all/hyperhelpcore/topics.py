@@ -0,0 +1,169 @@
+from threading import Thread, Lock
+
+from .common import log, hh_setting, LOG_WARNING
+from .data import TopicLocation
+from .indexer import _index_shards, _forget_index_shards
+
+
+###----------------------------------------------------------------------------
+
+
+class _TopicMap():
+    """
+    The map of where the anchor for every topic in every loaded help package
+    is; this associates each topic with its help file and the offset of its
+    anchor in the rendered file. A package is indexed in the background when
+    its help index is loaded or reloaded (sharing the index with the link
+    graph), so topics whose anchors are missing are known without having to
+    display their help files.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.packages = {}
+        self.version = 0
+        self.building = False
+        self.pending = None
+
+    def update(self, help_list):
+        """
+        Start bringing the map up to date with the provided help list in the
+        background, if it's not already up to date.
+        """
+        with self.lock:
+            removed = [pkg for pkg in self.packages if pkg not in help_list]
+            for pkg in removed:
+                del self.packages[pkg]
+
+            if removed:
+                self.version += 1
+                _forget_index_shards(removed)
+
+            stale = [pkg_info for pkg, pkg_info in help_list.items()
+                     if self.packages.get(pkg, (None, ))[0] is not pkg_info]
+            if not stale:
+                return
+
+            # Check again once the current build is done.
+            if self.building:
+                self.pending = help_list
+                return
+
+            self.building = True
+
+        Thread(target=self._build, daemon=True,
+               args=(stale, hh_setting("hyperhelp_date_format"))).start()
+
+    def _build(self, stale, date_format):
+        packages = None
+        try:
+            shards = _index_shards(stale, date_format).wait()
+            if shards is not None:
+                packages = {pkg_info.package: (pkg_info, ) + _package_topics(
+                                pkg_info, shards.get(pkg_info.package, []))
+                            for pkg_info in stale}
+
+                for pkg, (pkg_info, locations, missing) in sorted(packages.items()):
+                    if missing:
+                        log("Help package '%s' has %d topic(s) with no anchor: %s",
+                            pkg, len(missing), ", ".join(sorted(missing)),
+                            level=LOG_WARNING)
+
+        finally:
+            with self.lock:
+                if packages is not None:
+                    self.packages.update(packages)
+                    self.version += 1
+
+                self.building = False
+                pending, self.pending = self.pending, None
+
+        if pending:
+            self.update(pending)
+
+    def location(self, pkg_info, topic):
+        entry = self.packages.get(pkg_info.package, None)
+        if entry is None or entry[0] is not pkg_info:
+            return None
+
+        return entry[1].get(topic, False)
+
+    def missing(self, pkg_info):
+        entry = self.packages.get(pkg_info.package, None)
+        if entry is None or entry[0] is not pkg_info:
+            return None
+
+        return entry[2]
+
+
+_topic_map = _TopicMap()
+
+
+###----------------------------------------------------------------------------
+
+
+def _package_topics(pkg_info, shards):
+    """
+    Given the index shards for the help files in the provided help package,
+    return back a tuple of a dictionary that associates every topic whose
+    anchor is in its help file with a TopicLocation and a list of the topics
+    that should have an anchor in a help file but don't.
+    """
+    anchors = {}
+    for shard in shards:
+        for start, end, topic, snippet in shard["anchors"]:
+            # Anchors seen earlier in the file take precedence.
+            anchors.setdefault((shard["file"], topic),
+                               TopicLocation(shard["file"], start, end, snippet))
+
+    locations = {}
+    missing = []
+    for topic, topic_data in pkg_info.help_topics.items():
+        # Only topics in help files have anchors; not URLs or package files.
+        if topic_data["file"] not in pkg_info.help_files:
+            continue
+
+        location = anchors.get((topic_data["file"], topic), None)
+        if location is not None:
+            locations[topic] = location
+        else:
+            missing.append(topic)
+
+    return locations, missing
+
+
+def _update_topic_map(help_list):
+    """
+    Bring the topic map up to date with the provided help list (such as the
+    one returned by help_index_list()); this happens in the background.
+    """
+    _topic_map.update(help_list)
+
+
+def _topic_location(pkg_info, topic):
+    """
+    Get the location of the anchor for the given normalized topic in the given
+    help package, as a TopicLocation. This returns False if the package has
+    been indexed and the topic has no anchor in its help file, or None if the
+    package has not been indexed yet.
+    """
+    return _topic_map.location(pkg_info, topic)
+
+
+def _missing_topic_anchors(pkg_info):
+    """
+    Get the list of topics in the given help package that have no anchor in
+    their help file, or None if the package has not been indexed yet.
+    """
+    return _topic_map.missing(pkg_info)
+
+
+def _topic_map_version():
+    """
+    Get the version of the topic map; this goes up every time that the map is
+    updated, so it can be used to know when information derived from it is
+    stale.
+    """
+    return _topic_map.version
+
+
+###----------------------------------------------------------------------------
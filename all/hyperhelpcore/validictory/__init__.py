@@ -7,12 +7,16 @@ __all__ = ['validate', 'SchemaValidator', 'FieldValidationError', 'MultipleValid
            'ValidationError', 'SchemaError']
 __version__ = '1.1.2'
 
+# Validators are immutable and can be shared, so validate() reuses one validator for each set of
+# options instead of constructing a new one for every call.
+_shared_validators = {}
+
 
 def validate(data, schema, validator_cls=SchemaValidator,
              format_validators=None, required_by_default=True,
              blank_by_default=False, disallow_unknown_properties=False,
              apply_default_to_data=False, fail_fast=True,
-             remove_unknown_properties=False):
+             remove_unknown_properties=False, max_errors=None):
     '''
     Validates a parsed json document against the provided schema. If an
     error is found a :class:`ValidationError` is raised.
@@ -36,10 +40,21 @@ def validate(data, schema, validator_cls=SchemaValidator,
     :param remove_unknown_properties: defaults to False, set to True to
         filter out properties not listed in the schema definition. Only applies
         when disallow_unknown_properties is False.
+    :param max_errors: optional maximum number of errors to collect when
+        fail_fast is False; validation stops once this many are found.
     '''
-    v = validator_cls(format_validators, required_by_default, blank_by_default,
-                      disallow_unknown_properties, apply_default_to_data, fail_fast,
-                      remove_unknown_properties)
+    options = (required_by_default, blank_by_default, disallow_unknown_properties,
+               apply_default_to_data, fail_fast, remove_unknown_properties, max_errors)
+
+    # custom format validators can't be used as a key, so those validators aren't shared
+    if format_validators:
+        v = validator_cls(format_validators, *options)
+    else:
+        key = (validator_cls, ) + options
+        v = _shared_validators.get(key)
+        if v is None:
+            v = _shared_validators.setdefault(key, validator_cls(None, *options))
+
     return v.validate(data, schema)
 
 if __name__ == '__main__':
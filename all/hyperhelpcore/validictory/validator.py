@@ -2,9 +2,11 @@ import re
 import sys
 import copy
 import socket
+import threading
 from datetime import datetime
 from decimal import Decimal
-from collections import Mapping, Container
+from collections.abc import Mapping, Container
+from types import MappingProxyType
 
 if sys.version_info[0] == 3:
     _str_type = str
@@ -51,10 +53,44 @@ class RequiredFieldValidationError(ValidationError):
 
 
 class MultipleValidationError(ValidationError):
-    def __init__(self, errors):
-        msg = "{0} validation errors:\n{1}".format(len(errors), '\n'.join(str(e) for e in errors))
+    """
+    Validation error that holds all of the errors found when not failing fast. `truncated` is
+    True if validation stopped early because the maximum number of errors was reached.
+    """
+    def __init__(self, errors, truncated=False):
+        msg = "{0} validation errors{1}:\n{2}".format(len(errors),
+                                                     " (stopped early)" if truncated else "",
+                                                     '\n'.join(str(e) for e in errors))
         super(MultipleValidationError, self).__init__(msg)
         self.errors = errors
+        self.truncated = truncated
+
+
+def _json_pointer(tokens):
+    """
+    Return the JSON pointer (RFC 6901) that refers to the location given by a list of object
+    keys and array indexes.
+    """
+    return ''.join('/' + str(token).replace('~', '~0').replace('/', '~1') for token in tokens)
+
+
+# Tags that mark the canonical form of a list or dict; these can't appear in validated data, so
+# canonical containers never compare equal to a tuple from the data.
+_list_tag = object()
+_dict_tag = object()
+
+
+def _canonical(value):
+    """
+    Return a hashable value that compares equal to the canonical value of any other value that
+    compares equal to the one given; lists and dicts (at any depth) are converted to tuples and
+    frozensets.
+    """
+    if isinstance(value, list):
+        return (_list_tag, tuple(_canonical(item) for item in value))
+    if isinstance(value, dict):
+        return (_dict_tag, frozenset((key, _canonical(item)) for key, item in value.items()))
+    return value
 
 
 def _generate_datetime_validator(format_option, dateformat_string):
@@ -112,6 +148,20 @@ DEFAULT_FORMAT_VALIDATORS = {
 }
 
 
+class _ValidationContext(object):
+    '''
+    The state of a single call to :meth:`SchemaValidator.validate`: the errors collected so far,
+    the location of the value being validated (as a list of JSON pointer tokens) and how many
+    union type branches deep validation currently is.
+    '''
+    __slots__ = ('errors', 'pointer', 'branch_depth')
+
+    def __init__(self):
+        self.errors = []
+        self.pointer = []
+        self.branch_depth = 0
+
+
 class SchemaValidator(object):
     '''
     Validator largely based upon the JSON Schema proposal but useful for
@@ -131,24 +181,33 @@ class SchemaValidator(object):
     :param remove_unknown_properties: defaults to False, set to True to
         filter out properties not listed in the schema definition. Only applies
         when disallow_unknown_properties is False.
+    :param max_errors: optional maximum number of errors to collect when
+        fail_fast is False; validation stops once this many are found.
+
+    Every error raised or collected has a `pointer` attribute that holds the
+    JSON pointer of the value that failed validation.
+
+    A validator does not change once it has been constructed; the state of each
+    call to :meth:`validate` is kept separately, so one validator can be used by
+    any number of threads at once.
     '''
 
     def __init__(self, format_validators=None, required_by_default=True,
                  blank_by_default=False, disallow_unknown_properties=False,
                  apply_default_to_data=False, fail_fast=True,
-                 remove_unknown_properties=False):
+                 remove_unknown_properties=False, max_errors=None):
+
+        # add the default format validators and any custom format validators provided
+        self._format_validators = MappingProxyType(dict(DEFAULT_FORMAT_VALIDATORS,
+                                                        **(format_validators or {})))
 
-        self._format_validators = {}
-        self._errors = []
+        # compiled regular expressions, keyed by pattern; sharing this between threads is safe,
+        # since the worst case is that a pattern is compiled more than once
+        self._patterns = {}
 
-        # add the default format validators
-        for key, value in DEFAULT_FORMAT_VALIDATORS.items():
-            self.register_format_validator(key, value)
+        # the context of the call to validate() in progress in each thread
+        self._local = threading.local()
 
-        # register any custom format validators if they were provided
-        if format_validators:
-            for key, value in format_validators.items():
-                self.register_format_validator(key, value)
         self.required_by_default = required_by_default
         self.blank_by_default = blank_by_default
         self.disallow_unknown_properties = disallow_unknown_properties
@@ -157,9 +216,31 @@ class SchemaValidator(object):
 
         # disallow_unknown_properties takes precedence over remove_unknown_properties
         self.remove_unknown_properties = remove_unknown_properties
+        self.max_errors = max_errors
 
     def register_format_validator(self, format_name, format_validator_fun):
-        self._format_validators[format_name] = format_validator_fun
+        # the mapping is replaced rather than changed, since it may be in use in another thread
+        format_validators = dict(self._format_validators)
+        format_validators[format_name] = format_validator_fun
+        self._format_validators = MappingProxyType(format_validators)
+
+    @property
+    def _context(self):
+        return self._local.context
+
+    def _compiled_pattern(self, pattern):
+        '''
+        Returns the compiled form of a regular expression in a schema, compiling it the first time
+        that it's seen. Patterns that are already compiled are returned as is.
+        '''
+        if not isinstance(pattern, _str_type):
+            return pattern
+
+        compiled = self._patterns.get(pattern)
+        if compiled is None:
+            compiled = self._patterns[pattern] = re.compile(pattern)
+
+        return compiled
 
     def get_default(self, value):
         if isinstance(value, dict) or isinstance(value, list):
@@ -202,10 +283,46 @@ class SchemaValidator(object):
             err.fieldname = fieldname
             err.path = path
 
+        err.pointer = _json_pointer(self._context.pointer)
         if self.fail_fast:
             raise err
         else:
-            self._errors.append(err)
+            self._add_error(err)
+
+    def _add_error(self, err):
+        context = self._context
+        context.errors.append(err)
+
+        # The limit only applies to errors that will be reported; errors in the branches of a
+        # union type are discarded if another branch matches.
+        if (self.max_errors and not context.branch_depth and
+                len(context.errors) >= self.max_errors):
+            raise MultipleValidationError(context.errors, truncated=True)
+
+    def _validate_branch(self, x, fieldname, path, fieldtype,
+                         caught=(SchemaError, ValidationError)):
+        '''
+        Validates the field against one alternative of a union (or disallowed) type, returning the
+        list of errors found. The errors are collected in a buffer of their own so that they can be
+        discarded if the alternative doesn't apply. Only the exceptions in caught are treated as
+        errors in the branch; anything else propagates.
+        '''
+        context = self._context
+        outer, context.errors = context.errors, []
+        depth = len(context.pointer)
+        context.branch_depth += 1
+        try:
+            self.validate_type(x, fieldname, fieldtype, path, fieldtype)
+        except caught as err:
+            if not hasattr(err, 'pointer'):
+                err.pointer = _json_pointer(context.pointer)
+            context.errors.append(err)
+        finally:
+            errors, context.errors = context.errors, outer
+            del context.pointer[depth:]
+            context.branch_depth -= 1
+
+        return errors
 
     def _validate_unknown_properties(self, schema, data, fieldname, patternProperties):
         """Raise a SchemaError when unknown fields are found."""
@@ -221,7 +338,8 @@ class SchemaValidator(object):
             patterns = patternProperties.keys() if patternProperties else []
 
             if patterns:
-                delta = [f for f in delta if not any(re.match(p, f) for p in patterns)]
+                delta = [f for f in delta
+                         if not any(self._compiled_pattern(p).match(f) for p in patterns)]
 
             for unknown_field in delta:
                 del data[unknown_field]
@@ -243,20 +361,11 @@ class SchemaValidator(object):
                 datavalid = False
                 errorlist = []
                 for eachtype in fieldtype:
-                    try:
-                        # if fail_fast is False, _error will not rais an exception.
-                        # need to monitor the _errors list as well
-                        errors = self._errors[:]
-                        self.validate_type(x, fieldname, eachtype, path, eachtype)
-                        if len(self._errors) > len(errors):
-                            # an exception was raised.
-                            # remove the error from self.errors and raise it here
-                            raise self._errors.pop()
-
+                    errors = self._validate_branch(x, fieldname, path, eachtype)
+                    if not errors:
                         datavalid = True
                         break
-                    except (SchemaError, ValidationError) as err:
-                        errorlist.append(err)
+                    errorlist.extend(errors)
                 if not datavalid:
                     self._error("doesn't match any of {numsubtypes} subtypes in {fieldtype}; "
                                 "errorlist = {errorlist!r}",
@@ -290,7 +399,7 @@ class SchemaValidator(object):
 
                     for property in properties:
                         self.__validate(property, value, properties.get(property),
-                                        path + '.' + property)
+                                        path + '.' + property, token=property)
                 else:
                     raise SchemaError("Properties definition of field '{0}' is not an object"
                                       .format(fieldname))
@@ -310,10 +419,12 @@ class SchemaValidator(object):
                         for index, item in enumerate(items):
                             try:
                                 self.__validate("_data", {"_data": value[index]}, item,
-                                                '{0}[{1}]'.format(path, index))
+                                                '{0}[{1}]'.format(path, index), token=index)
                             except FieldValidationError as e:
-                                raise type(e)("Failed to validate field '%s' list schema: %s" %
+                                err = type(e)("Failed to validate field '%s' list schema: %s" %
                                               (fieldname, e), fieldname, e.value)
+                                err.pointer = getattr(e, 'pointer', '')
+                                raise err
                 elif isinstance(items, dict):
                     for index, item in enumerate(value):
                         if ((self.disallow_unknown_properties or
@@ -324,7 +435,7 @@ class SchemaValidator(object):
                                                               schema.get('patternProperties'))
 
                         self.__validate("[list item]", {"[list item]": item}, items,
-                                        '{0}[{1}]'.format(path, index))
+                                        '{0}[{1}]'.format(path, index), token=index)
                 else:
                     raise SchemaError("Properties definition of field '{0}' is "
                                       "not a list or an object".format(fieldname))
@@ -350,9 +461,10 @@ class SchemaValidator(object):
         value_obj = x.get(fieldname, {})
 
         for pattern, schema in patternproperties.items():
+            compiled = self._compiled_pattern(pattern)
             for key, value in value_obj.items():
-                if re.match(pattern, key):
-                    self.__validate("_data", {"_data": value}, schema, path)
+                if compiled.match(key):
+                    self.__validate("_data", {"_data": value}, schema, path, token=key)
 
     def validate_additionalItems(self, x, fieldname, schema, path, additionalItems=False):
         value = x.get(fieldname)
@@ -366,9 +478,10 @@ class SchemaValidator(object):
             elif len(value) != len(schema['items']):
                 self._error("is not of same length as schema list", value, fieldname, path=path)
 
-        remaining = value[len(schema['items']):]
-        if len(remaining) > 0:
-            self.__validate("_data", {"_data": remaining}, {"items": additionalItems}, path)
+        if isinstance(additionalItems, dict):
+            for index in range(len(schema['items']), len(value)):
+                self.__validate("[list item]", {"[list item]": value[index]}, additionalItems,
+                                '{0}[{1}]'.format(path, index), token=index)
 
     def validate_additionalProperties(self, x, fieldname, schema, path, additionalProperties=None):
         '''
@@ -396,14 +509,16 @@ class SchemaValidator(object):
                 value = {}
             for eachProperty in value:
                 if (eachProperty not in properties and not
-                        any(re.match(p, eachProperty) for p in patterns)):
+                        any(self._compiled_pattern(p).match(eachProperty) for p in patterns)):
                     # If additionalProperties is the boolean value False
                     # then we don't accept any additional properties.
                     if additionalProperties is False:
                         self._error("contains additional property '{prop}' not defined by "
                                     "'properties' or 'patternProperties' and additionalProperties "
                                     " is False", value, fieldname, prop=eachProperty, path=path)
-                    self.__validate(eachProperty, value, additionalProperties, path)
+                    else:
+                        self.__validate(eachProperty, value, additionalProperties, path,
+                                        token=eachProperty)
         else:
             raise SchemaError("additionalProperties schema definition for "
                               "field '{0}' is not an object".format(fieldname))
@@ -515,10 +630,11 @@ class SchemaValidator(object):
             try:
                 format_validator(self, fieldname, value, format_option)
             except FieldValidationError as fve:
+                fve.pointer = _json_pointer(self._context.pointer)
                 if self.fail_fast:
                     raise
                 else:
-                    self._errors.append(fve)
+                    self._add_error(fve)
 
         # TODO: warn about unsupported format ?
 
@@ -527,9 +643,7 @@ class SchemaValidator(object):
         Validates that the given field, if a string, matches the given regular expression.
         '''
         value = x.get(fieldname)
-        if (isinstance(value, _str_type) and
-            (isinstance(pattern, _str_type) and not re.match(pattern, value)
-             or not isinstance(pattern, _str_type) and not pattern.match(value))):
+        if isinstance(value, _str_type) and not self._compiled_pattern(pattern).match(value):
             self._error("does not match regular expression '{pattern}'", value, fieldname,
                         pattern=pattern, path=path)
 
@@ -549,19 +663,15 @@ class SchemaValidator(object):
         if not isinstance(values, (list, tuple)):
             return
 
-        hashables = set()
-        unhashables = []
+        # Lists and dicts are compared by their canonical form, so that every check is a hash lookup
+        seen = set()
 
         for value in values:
-            if isinstance(value, (list, dict)):
-                container, add = unhashables, unhashables.append
-            else:
-                container, add = hashables, hashables.add
-
-            if value in container:
+            key = _canonical(value)
+            if key in seen:
                 self._error("is not unique", value, fieldname, path=path)
             else:
-                add(value)
+                seen.add(key)
 
     def validate_enum(self, x, fieldname, schema, path, options=None):
         '''
@@ -604,9 +714,8 @@ class SchemaValidator(object):
         '''
         Validates that the value of the given field does not match the disallowed type.
         '''
-        try:
-            self.validate_type(x, fieldname, schema, path, disallow)
-        except ValidationError:
+        # An invalid schema is an error in the schema, not a sign that the value is allowed.
+        if self._validate_branch(x, fieldname, path, disallow, caught=ValidationError):
             return
         self._error("is disallowed for field '{fieldname}'", x.get(fieldname), fieldname,
                     disallow=disallow, path=path)
@@ -615,11 +724,35 @@ class SchemaValidator(object):
         '''
         Validates a piece of json data against the provided json-schema.
         '''
-        self.__validate("data", {"data": data}, schema, '<obj>')
-        if self._errors:
-            raise MultipleValidationError(self._errors)
+        # a format validator could validate something else with this validator, so put back the
+        # context of any outer call when done
+        local = self._local
+        outer = getattr(local, 'context', None)
+        context = local.context = _ValidationContext()
+        try:
+            self.__validate("data", {"data": data}, schema, '<obj>')
+        finally:
+            local.context = outer
+
+        if context.errors:
+            raise MultipleValidationError(context.errors)
+
+    def __validate(self, fieldname, data, schema, path, token=None):
+        # token is the object key or array index that leads from the current location to the
+        # value being validated, if they're not the same.
+        if token is not None:
+            pointer = self._context.pointer
+            pointer.append(token)
+            try:
+                self.__validate_value(fieldname, data, schema, path)
+            finally:
+                pointer.pop()
+        else:
+            self.__validate_value(fieldname, data, schema, path)
+
+        return data
 
-    def __validate(self, fieldname, data, schema, path):
+    def __validate_value(self, fieldname, data, schema, path):
 
         if schema is not None:
             if not isinstance(schema, dict):
@@ -658,5 +791,3 @@ class SchemaValidator(object):
                 validator = getattr(self, validatorname, None)
                 if validator:
                     validator(data, fieldname, schema, path, newschema.get(schemaprop))
-
-        return data
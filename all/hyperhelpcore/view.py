@@ -1,4 +1,9 @@
-import sublime
+# Outside of Sublime there are no views; this module can still be imported so
+# that the modules that use it can be, but its functions need Sublime.
+try:
+    import sublime
+except ImportError:
+    sublime = None
 
 
 _get_window = lambda wnd: wnd if wnd is not None else sublime.active_window()
@@ -41,6 +46,10 @@ def update_help_view(help_content, help_pkg, help_file,
     Find or create the help view in the provided window and set it's contents
     to the help string provided. The help view will have it's internal state
     set up to track the given help package and file.
+
+    The content is swapped in with a single edit, and the undo history of the
+    view is cleared where Sublime allows it, since help views are never
+    edited; this keeps a help view from growing as it's navigated.
     """
     window = _get_window(window)
     help_view = find_help_view(window)
@@ -49,8 +58,6 @@ def update_help_view(help_content, help_pkg, help_file,
         help_view = new_help_view(syntax, window)
     else:
         help_view.set_read_only(False)
-        help_view.run_command("select_all")
-        help_view.run_command("left_delete")
 
         if window.active_view() != help_view:
             window.focus_view(help_view)
@@ -58,10 +65,25 @@ def update_help_view(help_content, help_pkg, help_file,
     help_view.settings().set("_hh_pkg", help_pkg)
     help_view.settings().set("_hh_file", help_file)
 
-    help_view.run_command("append", {"characters": help_content})
+    help_view.run_command("hyperhelp_internal_replace_content",
+                          {"characters": help_content})
+    help_view.sel().clear()
+    help_view.sel().add(sublime.Region(0))
     help_view.set_read_only(True)
+    clear_help_view_undo(help_view)
 
     return help_view
 
 
+def clear_help_view_undo(help_view):
+    """
+    Throw away the undo history of the provided help view, since the edits
+    made to display help are never undone. Only newer versions of Sublime
+    support this; otherwise this does nothing.
+    """
+    clear_undo = getattr(help_view, "clear_undo_stack", None)
+    if clear_undo is not None:
+        clear_undo()
+
+
 ###----------------------------------------------------------------------------